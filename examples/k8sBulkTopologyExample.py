@@ -0,0 +1,18 @@
+from k8s_lft import K8sHost, K8sSwitch, K8sTopology
+
+topology = K8sTopology(max_workers=32, qps=20)
+
+s1 = topology.addNode(K8sSwitch('s1'))
+hosts = [topology.addNode(K8sHost(f'h{i}')) for i in range(16)]
+
+for i, host in enumerate(hosts):
+    topology.addLink(host, s1, f"h{i}s1", f"s1h{i}")
+
+# Images are pulled on the cluster nodes beforehand, so deploy time excludes pulls
+topology.warmup()
+
+# All StatefulSets are submitted at once and links are wired as pods become ready
+topology.deploy()
+
+for i, host in enumerate(hosts):
+    host.setIp(f'10.0.0.{i + 1}', 24, f"h{i}s1")
@@ -0,0 +1,14 @@
+from k8s_lft import K8sHost, K8sSwitch, K8sTopology
+
+topology = K8sTopology(max_workers=32, qps=20)
+
+s1 = topology.addNode(K8sSwitch('s1'))
+hosts = [topology.addNode(K8sHost(f'h{i}')) for i in range(16)]
+
+for i, host in enumerate(hosts):
+    topology.addLink(host, s1, f"h{i}s1", f"s1h{i}")
+    topology.addAddress(host, f'10.0.0.{i + 1}', 24, f"h{i}s1")
+
+# Creates whatever is missing; running it again with nothing changed only observes each pod
+print(topology.reconcile())
+print(topology.reconcile())
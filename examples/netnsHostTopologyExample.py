@@ -0,0 +1,19 @@
+from profissa_lft import NetnsHost, Switch, Topology, gather
+
+topology = Topology(maxWorkers=32)
+
+# The switch is a container, the hosts are bare network namespaces sharing this machine's filesystem
+s1 = topology.addNode(Switch('s1'))
+hosts = [topology.addNode(NetnsHost(f'h{i}')) for i in range(1000)]
+
+for i, host in enumerate(hosts):
+    topology.addLink(host, s1, f"h{i}s1", f"s1h{i}")
+    topology.addAddress(host, f'10.0.{(i + 1) // 256}.{(i + 1) % 256}', 16, f"h{i}s1")
+
+topology.deploy()
+
+results = gather([host.submit("ip -br addr show") for host in hosts[:10]])
+for result in results:
+    print(result.nodeName, result.stdout.strip().splitlines()[-1])
+
+topology.delete()
@@ -1,9 +1,16 @@
 from profissa_lft.host import Host
 from profissa_lft.switch import Switch
+from profissa_lft.topology import Topology
 
 
 class DeployLFT():
+	def __init__(self, parallel=False, maxWorkers=16):
+		self.parallel = parallel
+		self.maxWorkers = maxWorkers
+
 	def deploy(self, size):
+		if self.parallel:
+			return self.__deployParallel(size)
 		s1 = Switch("s1")
 		s1.instantiate()
 		[self.__addHost(i, s1) for i in range(size)]
@@ -14,6 +21,15 @@ class DeployLFT():
 		switch.connect(host, f"s1h{counter}", f"h{counter}s1")
 		host.setIp(f"10.0.{int(counter/256)}.{(counter+2)%256}", 24, f"h{counter}s1")
 
+	def __deployParallel(self, size):
+		topology = Topology(maxWorkers=self.maxWorkers)
+		s1 = topology.addNode(Switch("s1"))
+		for counter in range(size):
+			host = topology.addNode(Host(f"h{counter}"), dockerImage="ubuntu:trusty", runCommand="tail -f /dev/null")
+			topology.addLink(s1, host, f"s1h{counter}", f"h{counter}s1")
+			topology.addAddress(host, f"10.0.{int(counter/256)}.{(counter+2)%256}", 24, f"h{counter}s1")
+		return topology.deploy()
+
 	def getReferences(self, size):
 		self.nodes = []
 		self.nodes.append(Switch("s1"))
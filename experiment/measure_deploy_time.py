@@ -98,6 +98,37 @@ saveFile(undeployLftDf, f'{RESULTS_PATH}undeployLftTime.csv')
 
 
 
+# Measure deployment time of LFT with parallel instantiation and bulk wiring
+deployLftParallelDf = DataFrame(columns = sizes)
+dlftParallel = DeployLFT(parallel=True)
+for i in range(replicas):
+    print(f'LFT Parallel Deployment Assessment: Replica {i+1}')
+    lftParallelDeployTime = []
+    for size in sizes:
+        try:
+            print(f'Deploying {size} node(s) in parallel')
+            start = time()
+            phases = dlftParallel.deploy(size)
+            lftParallelDeployTime.append(time() - start)
+            print(f'LFT Parallel Deployment Time: {lftParallelDeployTime} (phases: {phases})')
+            dlftParallel.getReferences(size)
+            sleep(coolDownTime)
+            dlftParallel.undeploy()
+            sleep(coolDownTime)
+        except Exception as ex:
+            print(f"Caught an exception. {ex}")
+            cleanupContainers()
+            continue
+    print(f'LFT Parallel Deployment times for replica {i+1} were {lftParallelDeployTime}')
+    deployLftParallelDf.loc[i] = lftParallelDeployTime
+
+
+cleanupContainers()
+saveFile(deployLftParallelDf, f'{RESULTS_PATH}deployLftParallelTime.csv')
+#barPlot(concat([deployLftDf.mean().rename("serial"), deployLftParallelDf.mean().rename("parallel")], axis=1), "LFT deployment time")
+
+
+
 # Measure Memory consumption of LFT
 awaitStabilizeMemoryTime = 5
 
@@ -1,3 +1,6 @@
 from .node import K8sNode
 from .host import K8sHost
-from .switch import K8sSwitch
\ No newline at end of file
+from .switch import K8sSwitch
+from .topology import K8sTopology
+from .aio import AsyncRuntime, AsyncK8sNode, AsyncK8sSwitch, AsyncK8sController
+from .reconcile import K8sReconciler
@@ -0,0 +1,355 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from kubernetes import client
+from k8s_lft.kubeclient import K8sClientContext
+from k8s_lft.session import ExecSessionPool
+from k8s_lft.tunnel import TUNNEL_KIND, TUNNEL_PORTS
+import threading
+import json
+import time
+import zlib
+import os
+
+
+# Brief: Temporary host-side name of one end of an agent veth pair.
+# Params:
+#   string container_id: Container of the pod.
+#   string ifname: Interface name in the pod.
+#   bool peer: Name of the second end of the pair (default: False).
+# Returns:
+#   string link name
+def vethTempName(container_id, ifname, peer=False):
+    return f"{'lftp' if peer else 'lftv'}{zlib.crc32(f'{container_id}/{ifname}'.encode()):x}"
+
+
+# Brief: Temporary host-side name of an agent tunnel device.
+# Params:
+#   int vni: Tunnel ID of the link.
+# Returns:
+#   string link name
+def tunnelTempName(vni):
+    return f"lft{vni:x}"
+
+
+# Privileged per-node LFT agent.
+# The agent is a DaemonSet pod with the host PID and network namespaces running
+# k8s_lft/agentd.py, which is shipped through a ConfigMap. Requests (links,
+# addresses, routes, tc and OVS) are sent in batches over the pod's persistent
+# exec session: the API server authenticates the channel, nothing listens on
+# the node, and the agent resolves pod namespaces from container IDs and applies
+# the batch with netlink. The client therefore needs no sudo, nsenter or
+# microk8s ctr, and batches for different nodes run in parallel on their own
+# agents.
+class LftAgent:
+    _instance = None
+    _instance_lock = threading.Lock()
+    NAME = "lft-agent"
+    SCRIPT = "/opt/lft/agentd.py"
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, namespace="default", image=None, max_workers=16):
+        if hasattr(self, "_initialized") and self._initialized:
+            return
+        self.namespace = namespace
+        # built from docker/lft_agent/Dockerfile, any image with python3, nsenter, iptables and pyroute2 works
+        self.image = image or os.environ.get("LFT_AGENT_IMAGE", "lft-agent:latest")
+        self.max_workers = max_workers
+        self.pods = dict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.context = K8sClientContext()
+        self._initialized = True
+
+
+    # Brief: Send a batch of requests to the agent of a cluster node.
+    # Params:
+    #   string node_name: Cluster node.
+    #   list requests: Requests understood by agentd.py.
+    # Returns:
+    #   List with the output of each request, raises RuntimeError if any of them failed
+    def call(self, node_name, requests):
+        if not requests:
+            return []
+        pod_name = self.__podOn(node_name)
+        payload = json.dumps(requests)
+        try:
+            with self.context.exec_lock:
+                session = ExecSessionPool().get(self.context.exec_api, pod_name, self.namespace)
+            output, code = session.run(f"python3 {self.SCRIPT} <<'__LFT_BATCH__'\n{payload}\n__LFT_BATCH__")
+        except ConnectionError:
+            with self.lock:
+                self.pods.pop(node_name, None)
+            ExecSessionPool().evict(pod_name, self.namespace)
+            raise
+
+        lines = output.strip().splitlines()
+        try:
+            results = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            raise RuntimeError(f"Agent on {node_name} failed (exit code {code}): {output.strip()}")
+        failed = [(r, res["error"]) for r, res in zip(requests, results) if not res["ok"]]
+        if failed:
+            raise RuntimeError(f"Agent on {node_name} failed {len(failed)} request(s): {failed}")
+        return [res["output"] for res in results]
+
+
+    # Brief: Collect the requests issued inside the block and send one batch per cluster node.
+    # Batches of different nodes are sent in parallel when the block ends.
+    # Params:
+    #   None
+    # Returns:
+    #   None, raises RuntimeError at the end of the block if any request failed
+    @contextmanager
+    def batch(self):
+        outer = getattr(self.local, "batches", None)
+        if outer is not None:
+            yield self
+            return
+        self.local.batches = dict()
+        try:
+            yield self
+        finally:
+            batches, self.local.batches = self.local.batches, None
+        if not batches:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            futures = [pool.submit(self.call, node_name, requests) for node_name, requests in batches.items()]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise RuntimeError(f"Agent batch failed: {errors}")
+
+
+    # Brief: Create a veth pair between two pods of the same cluster node.
+    # Params:
+    #   string node_name: Cluster node hosting both pods.
+    #   string container_id: Container of the first pod.
+    #   string ifname: Interface name in the first pod.
+    #   string peer_container_id: Container of the second pod.
+    #   string peer_ifname: Interface name in the second pod.
+    # Returns:
+    #   None
+    def createVethPair(self, node_name, container_id, ifname, peer_container_id, peer_ifname):
+        self.__submit(node_name, {
+            "op": "veth",
+            "container_id": container_id, "ifname": ifname,
+            "peer_container_id": peer_container_id, "peer_ifname": peer_ifname,
+            # temporary names in the host namespace, unique per link end
+            "tmp": vethTempName(container_id, ifname),
+            "peer_tmp": vethTempName(peer_container_id, peer_ifname, peer=True)
+        })
+
+
+    # Brief: Create one end of a tunnel-backed link inside a pod.
+    # The tunnel device is created in the host namespace, so its underlay
+    # socket stays there, and is then moved into the pod under the link's
+    # interface name.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the pod.
+    #   string ifname: Interface name in the pod.
+    #   int vni: Tunnel ID of the link.
+    #   string remote_ip: Host IP of the other end.
+    #   string kind: "vxlan" or "geneve" (default: TUNNEL_KIND).
+    # Returns:
+    #   None
+    def createTunnelEnd(self, node_name, container_id, ifname, vni, remote_ip, kind=TUNNEL_KIND):
+        if kind not in TUNNEL_PORTS:
+            raise ValueError(f"Unsupported tunnel kind {kind}")
+        self.__submit(node_name, {
+            "op": "tunnel", "kind": kind, "port": TUNNEL_PORTS[kind],
+            "container_id": container_id, "ifname": ifname,
+            "vni": vni, "remote": remote_ip, "tmp": tunnelTempName(vni)
+        })
+
+
+    # Brief: Delete an interface of a pod, doing nothing if it does not exist.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the pod.
+    #   string ifname: Interface name.
+    # Returns:
+    #   None
+    def deleteLink(self, node_name, container_id, ifname):
+        self.__submit(node_name, {"op": "delete", "container_id": container_id, "ifname": ifname})
+
+
+    # Brief: Assign an address to an interface of a pod and set it up.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the pod.
+    #   string ifname: Interface name.
+    #   string ip: IP address.
+    #   int mask: Prefix length.
+    # Returns:
+    #   None
+    def addAddress(self, node_name, container_id, ifname, ip, mask):
+        self.__submit(node_name, {"op": "addr", "container_id": container_id, "ifname": ifname, "ip": ip, "mask": mask})
+
+
+    # Brief: Add or replace a route of a pod.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the pod.
+    #   string dst: Destination in CIDR notation, or "default".
+    #   string ifname: Output interface.
+    #   string gateway: Next hop (default: None, directly connected).
+    # Returns:
+    #   None
+    def setRoute(self, node_name, container_id, dst, ifname, gateway=None):
+        self.__submit(node_name, {"op": "route", "container_id": container_id, "dst": dst,
+                                  "ifname": ifname, "gateway": gateway})
+
+
+    # Brief: Set a netem qdisc on an interface of a pod.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the pod.
+    #   string ifname: Interface name.
+    #   int delay: Delay in microseconds (default: None).
+    #   int jitter: Jitter in microseconds (default: None).
+    #   float loss: Loss in percent (default: None).
+    #   int rate: Rate in bytes per second (default: None).
+    # Returns:
+    #   None
+    def setNetem(self, node_name, container_id, ifname, delay=None, jitter=None, loss=None, rate=None):
+        self.__submit(node_name, {"op": "netem", "container_id": container_id, "ifname": ifname,
+                                  "delay": delay, "jitter": jitter, "loss": loss, "rate": rate})
+
+
+    # Brief: Connect a pod to the internet through a veth to the host of its cluster node.
+    # The host end gets the address and is NATed through the host's default
+    # route with iptables rules tagged with a comment, added only when missing.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the pod.
+    #   string ifname: Interface name in the pod.
+    #   string host_ifname: Interface name on the host.
+    #   string ip: IP address of the host end.
+    #   int mask: Prefix length.
+    #   string tag: Comment of the iptables rules (see iptablesTag).
+    # Returns:
+    #   string host interface of the default route, or None when called inside a batch
+    def connectToInternet(self, node_name, container_id, ifname, host_ifname, ip, mask, tag):
+        return self.__submit(node_name, {"op": "internet", "container_id": container_id, "ifname": ifname,
+                                         "host_ifname": host_ifname, "ip": ip, "mask": mask, "tag": tag,
+                                         "tmp": vethTempName(container_id, ifname)})
+
+
+    # Brief: Delete the iptables rules of a cluster node carrying a comment.
+    # Params:
+    #   string node_name: Cluster node.
+    #   string tag: Comment of the rules (see iptablesTag).
+    # Returns:
+    #   int number of deleted rules, or None when called inside a batch
+    def removeTaggedRules(self, node_name, tag):
+        return self.__submit(node_name, {"op": "untag", "tag": tag})
+
+
+    # Brief: Run ovs-vsctl in the mount and network namespaces of a switch pod.
+    # Params:
+    #   string node_name: Cluster node hosting the pod.
+    #   string container_id: Container of the switch pod.
+    #   list args: Arguments of ovs-vsctl.
+    # Returns:
+    #   string output of ovs-vsctl, or None when called inside a batch
+    def ovs(self, node_name, container_id, args):
+        return self.__submit(node_name, {"op": "ovs", "container_id": container_id, "args": list(args)})
+
+
+    def __submit(self, node_name, request):
+        batches = getattr(self.local, "batches", None)
+        if batches is not None:
+            batches.setdefault(node_name, []).append(request)
+            return None
+        return self.call(node_name, [request])[0]
+
+
+    # Brief: Get the ready agent pod of a cluster node, deploying the agent if needed.
+    # Params:
+    #   string node_name: Cluster node.
+    #   int timeout: Maximum time to wait for the agent, in seconds (default: 300).
+    # Returns:
+    #   string agent pod name
+    def __podOn(self, node_name, timeout: int = 300):
+        with self.lock:
+            if node_name in self.pods:
+                return self.pods[node_name]
+            self.__ensureDaemonSet()
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            pods = self.context.core_api.list_namespaced_pod(
+                namespace=self.namespace, label_selector=f"app={self.NAME}",
+                field_selector=f"spec.nodeName={node_name}").items
+            for pod in pods:
+                conditions = pod.status.conditions or []
+                if pod.metadata.deletion_timestamp is None and any(c.type == "Ready" and c.status == "True" for c in conditions):
+                    with self.lock:
+                        self.pods[node_name] = pod.metadata.name
+                    return pod.metadata.name
+            time.sleep(1)
+        raise TimeoutError(f"No {self.NAME} pod became ready on {node_name} within {timeout} seconds.")
+
+
+    # Brief: Create or update the agent ConfigMap and create the DaemonSet if it does not exist.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __ensureDaemonSet(self):
+        labels = {"app": self.NAME}
+        with open(os.path.join(os.path.dirname(__file__), "agentd.py")) as f:
+            configmap = {"metadata": {"name": self.NAME, "labels": labels}, "data": {"agentd.py": f.read()}}
+        try:
+            self.context.core_api.replace_namespaced_config_map(name=self.NAME, namespace=self.namespace, body=configmap)
+        except client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+            self.context.core_api.create_namespaced_config_map(namespace=self.namespace, body=configmap)
+
+        try:
+            self.context.apps_api.read_namespaced_daemon_set(name=self.NAME, namespace=self.namespace)
+            return
+        except client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+
+        manifest = {
+            "apiVersion": "apps/v1",
+            "kind": "DaemonSet",
+            "metadata": {"name": self.NAME, "labels": labels},
+            "spec": {
+                "selector": {"matchLabels": labels},
+                "template": {
+                    "metadata": {"labels": labels},
+                    "spec": {
+                        "hostNetwork": True,
+                        "hostPID": True,
+                        "tolerations": [{"operator": "Exists"}],
+                        "containers": [{
+                            "name": "agent",
+                            "image": self.image,
+                            # a locally imported :latest image would otherwise be pulled from Docker Hub
+                            "imagePullPolicy": "IfNotPresent",
+                            "command": ["/bin/sh", "-c", "touch /tmp/ready; exec sleep infinity"],
+                            "readinessProbe": {"exec": {"command": ["test", "-f", "/tmp/ready"]}, "periodSeconds": 1},
+                            "securityContext": {"privileged": True},
+                            "volumeMounts": [{"name": "agent", "mountPath": os.path.dirname(self.SCRIPT)}]
+                        }],
+                        "volumes": [{"name": "agent", "configMap": {"name": self.NAME}}]
+                    }
+                }
+            }
+        }
+        try:
+            self.context.apps_api.create_namespaced_daemon_set(namespace=self.namespace, body=manifest)
+            print(f"[INFO] DaemonSet {self.NAME} criado")
+        except client.exceptions.ApiException as e:
+            # another process created it first
+            if e.status != 409:
+                raise
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# LFT node agent.
+# Runs inside the privileged lft-agent DaemonSet pod (host PID and network
+# namespaces). A batch of requests is read as a JSON list on stdin, every
+# request is applied with netlink, and one JSON list of results is printed on
+# the last line of stdout. Pods are referenced by container ID ("container_id")
+# or PID ("pid"); their namespaces are resolved here, on the node, so the client
+# needs neither sudo, nsenter nor microk8s ctr.
+# This file is standalone on purpose: it only needs the standard library,
+# pyroute2 and the iptables tools, and is shipped to the agent through a ConfigMap.
+import glob
+import json
+import shlex
+import socket
+import subprocess
+import sys
+
+from pyroute2 import IPRoute, NetNS
+
+
+TUNNEL_PORTS = {"vxlan": 4789, "geneve": 6081}
+
+
+class Agent:
+
+    def __init__(self):
+        self.ipr = IPRoute()
+        self.pids = dict()
+        self.handles = dict()
+
+    # Brief: Resolve the PID of a pod from a request.
+    # Params:
+    #   dict request: Request holding "pid" or "container_id" (or "peer_pid"/"peer_container_id").
+    #   string prefix: "" for the pod itself, "peer_" for the other end of a link.
+    # Returns:
+    #   string PID
+    def pid(self, request, prefix=""):
+        if request.get(prefix + "pid"):
+            return str(request[prefix + "pid"])
+        container_id = request[prefix + "container_id"]
+        if container_id not in self.pids:
+            # any process of the container shares its network namespace
+            for path in glob.glob("/proc/[0-9]*/cgroup"):
+                try:
+                    with open(path) as f:
+                        if container_id in f.read():
+                            self.pids[container_id] = path.split("/")[2]
+                            break
+                except OSError:
+                    continue
+            else:
+                raise RuntimeError(f"No process found for container {container_id}")
+        return self.pids[container_id]
+
+    def netns(self, pid):
+        if pid not in self.handles:
+            self.handles[pid] = NetNS(f"/proc/{pid}/ns/net")
+        return self.handles[pid]
+
+    def index(self, handle, ifname):
+        indexes = handle.link_lookup(ifname=ifname)
+        if not indexes:
+            raise RuntimeError(f"Network interface {ifname} does not exist")
+        return indexes[0]
+
+    def delete(self, handle, ifname):
+        indexes = handle.link_lookup(ifname=ifname)
+        if indexes:
+            handle.link("del", index=indexes[0])
+
+    # Brief: Name of the interface of the host's default route.
+    def defaultInterface(self):
+        for route in self.ipr.route("dump", family=socket.AF_INET):
+            if route["dst_len"] == 0 and route.get("table") == 254 and route.get("oif"):
+                return self.ipr.link("get", index=route.get("oif"))[0].get("ifname")
+        raise RuntimeError("The host has no default route")
+
+    # Brief: Add an iptables rule unless it is already there.
+    def iptables(self, table, action, rule):
+        if subprocess.run(["iptables", "-t", table, "-C"] + rule, capture_output=True).returncode == 0:
+            return
+        result = subprocess.run(["iptables", "-t", table, action] + rule, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+
+    # Brief: Move an interface from the host into a pod, renaming it and setting it up.
+    def moveInto(self, tmp, pid, ifname):
+        fd = open(f"/proc/{pid}/ns/net")
+        try:
+            self.ipr.link("set", index=self.index(self.ipr, tmp), net_ns_fd=fd.fileno(), ifname=ifname)
+        finally:
+            fd.close()
+        handle = self.netns(pid)
+        handle.link("set", index=self.index(handle, ifname), state="up")
+
+    # Brief: Apply one request.
+    # Params:
+    #   dict request: Request with an "op" key.
+    # Returns:
+    #   None
+    def apply(self, request):
+        op = request["op"]
+        if op == "veth":
+            pid, peer_pid = self.pid(request), self.pid(request, "peer_")
+            tmp, peer_tmp = request["tmp"], request["peer_tmp"]
+            self.delete(self.netns(pid), request["ifname"])
+            self.delete(self.netns(peer_pid), request["peer_ifname"])
+            self.delete(self.ipr, tmp)
+            self.ipr.link("add", ifname=tmp, kind="veth", peer=peer_tmp)
+            try:
+                self.moveInto(tmp, pid, request["ifname"])
+                self.moveInto(peer_tmp, peer_pid, request["peer_ifname"])
+            except Exception:
+                self.delete(self.ipr, tmp)
+                self.delete(self.netns(pid), request["ifname"])
+                raise
+        elif op == "tunnel":
+            pid, kind, tmp = self.pid(request), request["kind"], request["tmp"]
+            port = request.get("port", TUNNEL_PORTS[kind])
+            self.delete(self.netns(pid), request["ifname"])
+            self.delete(self.ipr, tmp)
+            if kind == "vxlan":
+                self.ipr.link("add", ifname=tmp, kind="vxlan", vxlan_id=request["vni"],
+                              vxlan_group=request["remote"], vxlan_port=port)
+            elif kind == "geneve":
+                self.ipr.link("add", ifname=tmp, kind="geneve", geneve_id=request["vni"],
+                              geneve_remote=request["remote"], geneve_port=port)
+            else:
+                raise ValueError(f"Unsupported tunnel kind {kind}")
+            try:
+                self.moveInto(tmp, pid, request["ifname"])
+            except Exception:
+                self.delete(self.ipr, tmp)
+                raise
+        elif op == "delete":
+            self.delete(self.netns(self.pid(request)), request["ifname"])
+        elif op == "addr":
+            handle = self.netns(self.pid(request))
+            index = self.index(handle, request["ifname"])
+            handle.addr("replace", index=index, address=request["ip"], prefixlen=int(request["mask"]))
+            handle.link("set", index=index, state="up")
+        elif op == "route":
+            handle = self.netns(self.pid(request))
+            route = {"oif": self.index(handle, request["ifname"])}
+            if request.get("gateway"):
+                route["gateway"] = request["gateway"]
+            if request["dst"] != "default":
+                route["dst"] = request["dst"]
+            handle.route("replace", **route)
+        elif op == "netem":
+            handle = self.netns(self.pid(request))
+            params = {k: request[k] for k in ("delay", "jitter", "loss", "rate") if request.get(k) is not None}
+            handle.tc("replace", "netem", self.index(handle, request["ifname"]), "1:", **params)
+        elif op == "internet":
+            # veth between the pod and the host, NATed through the host's default route
+            pid, host_ifname = self.pid(request), request["host_ifname"]
+            self.delete(self.netns(pid), request["ifname"])
+            self.delete(self.ipr, host_ifname)
+            self.ipr.link("add", ifname=host_ifname, kind="veth", peer=request["tmp"])
+            try:
+                self.moveInto(request["tmp"], pid, request["ifname"])
+            except Exception:
+                self.delete(self.ipr, host_ifname)
+                raise
+            index = self.index(self.ipr, host_ifname)
+            self.ipr.addr("replace", index=index, address=request["ip"], prefixlen=int(request["mask"]))
+            self.ipr.link("set", index=index, state="up")
+            gateway = self.defaultInterface()
+            tag = ["-m", "comment", "--comment", request["tag"]]
+            self.iptables("nat", "-I", ["POSTROUTING", "-o", gateway] + tag + ["-j", "MASQUERADE"])
+            self.iptables("filter", "-A", ["FORWARD", "-i", host_ifname, "-o", gateway] + tag + ["-j", "ACCEPT"])
+            self.iptables("filter", "-A", ["FORWARD", "-i", gateway, "-o", host_ifname] + tag + ["-j", "ACCEPT"])
+            return gateway
+        elif op == "untag":
+            # delete the iptables rules carrying a comment, one iptables-restore per table
+            deleted = 0
+            for table in ("filter", "nat"):
+                saved = subprocess.run(["iptables-save", "-t", table], capture_output=True, text=True)
+                if saved.returncode != 0:
+                    continue
+                deletions = []
+                for line in saved.stdout.splitlines():
+                    args = shlex.split(line) if line.startswith("-A ") else []
+                    if any(arg == "--comment" and value == request["tag"] for arg, value in zip(args, args[1:])):
+                        deletions.append("-D " + line[3:])
+                if deletions:
+                    payload = f"*{table}\n" + "\n".join(deletions) + "\nCOMMIT\n"
+                    result = subprocess.run(["iptables-restore", "--noflush"], input=payload, capture_output=True, text=True)
+                    if result.returncode != 0:
+                        raise RuntimeError(result.stderr.strip())
+                    deleted += len(deletions)
+            return deleted
+        elif op == "ovs":
+            # ovs-vsctl of the switch container itself, in its mount and network namespaces
+            pid = self.pid(request)
+            result = subprocess.run(["nsenter", "-t", pid, "-m", "-n", "--", "ovs-vsctl"] + request["args"],
+                                    capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip())
+            return result.stdout
+        else:
+            raise ValueError(f"Unknown request {op}")
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.close()
+        self.ipr.close()
+
+
+def main():
+    requests = json.loads(sys.stdin.read())
+    agent = Agent()
+    results = []
+    try:
+        for request in requests:
+            try:
+                results.append({"ok": True, "output": agent.apply(request)})
+            except Exception as e:
+                results.append({"ok": False, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        agent.close()
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
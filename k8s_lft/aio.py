@@ -0,0 +1,454 @@
+from concurrent.futures import ThreadPoolExecutor
+from k8s_lft.kubeclient import K8sClientContext
+from k8s_lft.pidcache import PodPidCache, parseContainerId
+from k8s_lft.node import K8sNode
+from k8s_lft.switch import K8sSwitch
+from k8s_lft.controller import K8sController
+from k8s_lft.tunnel import isLocalNode
+import asyncio
+import functools
+import threading
+import json
+import re
+import os
+
+try:
+    from kubernetes_asyncio import client as aio_client, config as aio_config
+    from kubernetes_asyncio.stream import WsApiClient
+    from kubernetes_asyncio.stream.ws_client import STDOUT_CHANNEL, STDERR_CHANNEL, ERROR_CHANNEL
+except ImportError:
+    aio_client = None
+    aio_config = None
+
+
+# Shared runtime of the asyncio API: a semaphore bounding how many setup steps
+# run at once on the event loop, the worker pool that runs the steps which are
+# still blocking (netlink, agent calls), and the kubernetes_asyncio clients used
+# for API reads and pod exec when that package is installed.
+class AsyncRuntime:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, concurrency=64):
+        if hasattr(self, "_initialized") and self._initialized:
+            return
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="lft-async")
+        self.loop = None
+        self.semaphore = None
+        self.core_api = None
+        self.ws_api = None
+        self._initialized = True
+
+
+    # Brief: Bind the runtime to the running event loop.
+    # The semaphore and the async API client belong to one loop, so they are
+    # created again when the runtime is used from a new loop.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.core_api = None
+            self.ws_api = None
+
+
+    # Brief: Run a blocking callable on the worker pool, within the concurrency bound.
+    # Params:
+    #   function func: Callable to run.
+    #   args, kwargs: Arguments of the callable.
+    # Returns:
+    #   Value returned by the callable
+    async def call(self, func, *args, **kwargs):
+        self._bind()
+        async with self.semaphore:
+            return await self.loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+
+    # Brief: Run a host command as an asyncio subprocess, within the concurrency bound.
+    # Params:
+    #   list command: Command and arguments.
+    # Returns:
+    #   string stdout of the command
+    async def subprocess(self, *command):
+        self._bind()
+        async with self.semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"Command {' '.join(command)} failed: {stderr.decode().strip()}")
+        return stdout.decode()
+
+
+    # Brief: Read a pod, through kubernetes_asyncio when installed.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string namespace: Namespace of the pod.
+    # Returns:
+    #   V1Pod
+    async def readPod(self, pod_name, namespace):
+        if aio_client is None:
+            return await self.call(K8sClientContext().core_api.read_namespaced_pod, name=pod_name, namespace=namespace)
+
+        await self._connect()
+        async with self.semaphore:
+            return await self.core_api.read_namespaced_pod(name=pod_name, namespace=namespace)
+
+
+    # Brief: Run a command inside a pod over an asyncio websocket exec stream.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string namespace: Namespace of the pod.
+    #   string command: Command to run with bash -c.
+    # Returns:
+    #   Tuple (output, exit code); stdout and stderr are merged like in K8sNode.run
+    async def exec(self, pod_name, namespace, command):
+        await self._connect()
+        async with self.semaphore:
+            websocket = await self.ws_api.connect_get_namespaced_pod_exec(
+                pod_name, namespace, command=["/bin/bash", "-c", command],
+                stderr=True, stdin=False, stdout=True, tty=False, _preload_content=False)
+            output, code = "", None
+            async with websocket as ws:
+                async for message in ws:
+                    channel, data = message.data[0], message.data[1:]
+                    if channel in (STDOUT_CHANNEL, STDERR_CHANNEL):
+                        output += data.decode("utf-8", errors="replace")
+                    elif channel == ERROR_CHANNEL and data:
+                        code = WsApiClient.parse_error_data(data)
+        return output, code
+
+
+    # Brief: Create the kubernetes_asyncio clients of the running loop, once.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    async def _connect(self):
+        self._bind()
+        if self.core_api is not None:
+            return
+        # reuse the kubeconfig generated by the blocking client context
+        context = K8sClientContext()
+        configuration = aio_client.Configuration()
+        if os.environ.get("KUBERNETES_SERVICE_HOST"):
+            aio_config.load_incluster_config(client_configuration=configuration)
+        else:
+            await aio_config.load_kube_config(config_file=context.kubeconfig_path, client_configuration=configuration)
+        configuration.connection_pool_maxsize = self.concurrency
+        self.core_api = aio_client.CoreV1Api(aio_client.ApiClient(configuration))
+        self.ws_api = aio_client.CoreV1Api(WsApiClient(configuration))
+
+
+    # Brief: Close the kubernetes_asyncio clients; call it before the event loop ends.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    async def close(self):
+        for api in (self.core_api, self.ws_api):
+            if api is not None:
+                await api.api_client.close()
+        self.core_api = None
+        self.ws_api = None
+
+
+    # Brief: Set the maximum number of concurrent setup steps.
+    # The async clients are sized for the old bound, so they are closed and
+    # created again on next use.
+    # Params:
+    #   int concurrency: New bound.
+    # Returns:
+    #   None
+    async def setConcurrency(self, concurrency):
+        await self.close()
+        self.concurrency = concurrency
+        executor, self.executor = self.executor, ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="lft-async")
+        executor.shutdown(wait=False)
+        self.loop = None
+
+
+# Brief: Coroutine API of K8sNode.
+# Wraps a blocking K8sNode and exposes its methods as coroutines, so thousands
+# of setup steps can be awaited concurrently from one event loop. Waits
+# (readiness, PID lookups) never hold a worker thread, commands run over
+# asyncio exec streams and local nsenter/ip calls as asyncio subprocesses; the
+# remaining blocking steps run on the AsyncRuntime pool under its concurrency
+# bound. Operations are journaled exactly like in the blocking API.
+class AsyncK8sNode:
+    node_class = K8sNode
+
+    def __init__(self, *args, **kwargs):
+        self.node = self.node_class(*args, **kwargs)
+        self.runtime = AsyncRuntime()
+
+    @property
+    def nodeName(self):
+        return self.node.nodeName
+
+
+    # Brief: Instantiate the pod and wait until it is ready.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    async def instantiate(self):
+        await self.runtime.call(self.node._createStatefulSet)
+        await self._waitUntilReady()
+        await self.runtime.call(self.node._postInstantiate)
+
+
+    # Brief: Wait until the pod is ready, following the shared pod watch without blocking a thread.
+    # Params:
+    #   int timeout: Maximum time to wait in seconds (default: 600)
+    # Returns:
+    #   None
+    async def _waitUntilReady(self, timeout: int = 600):
+        watcher = self.node.watcher
+        if not watcher.tracks(self.node.namespace, self.node.app):
+            return await self.runtime.call(self.node._waitUntilReady, timeout)
+
+        # the watch thread wakes the loop up whenever readiness changes
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        listener = lambda: loop.call_soon_threadsafe(changed.set)
+        watcher.addReadinessListener(listener)
+        try:
+            deadline = loop.time() + timeout
+            while True:
+                changed.clear()
+                if self.nodeName in watcher.readyPods():
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"Pod {self.nodeName} did not become ready within {timeout} seconds.")
+        finally:
+            watcher.removeReadinessListener(listener)
+
+
+    # Brief: Get the PID of a pod's main container without blocking the event loop.
+    # Params:
+    #   string pod_name: Name of the pod (default: this node's pod)
+    # Returns:
+    #   string PID
+    async def _getPodpid(self, pod_name: str = None) -> str:
+        pod_name = pod_name or self.nodeName
+        pid_cache = PodPidCache()
+        pid = pid_cache.get(pod_name)
+        if pid is not None:
+            return pid
+
+        pod = await self.runtime.readPod(pod_name, self.node.namespace)
+        container_statuses = pod.status.container_statuses
+        if not container_statuses:
+            raise RuntimeError(f"No container status found for pod {pod_name}")
+        container_id = parseContainerId(container_statuses[0].container_id)
+        if container_id is None:
+            raise RuntimeError(f"Unexpected container ID format: {container_statuses[0].container_id}")
+
+        info = json.loads(await self.runtime.subprocess("sudo", "microk8s", "ctr", "containers", "info", container_id))
+        for ns in info.get("Spec", {}).get("linux", {}).get("namespaces", []):
+            match = re.search(r"/proc/(\d+)/ns/", ns.get("path", ""))
+            if match:
+                pid_cache.put(pod_name, container_id, match.group(1))
+                return match.group(1)
+        raise RuntimeError(f"PID not found in container info for {pod_name}")
+
+
+    # Brief: Connect this node to another node using a veth pair
+    # Params:
+    #   other: AsyncK8sNode, K8sNode or pod name to connect to
+    #   string interface_name: Name of the interface in this node
+    #   string peer_interface_name: Name of the interface in the other node
+    # Returns:
+    #   None
+    async def connect(self, other, interface_name: str, peer_interface_name: str, reconnect: bool = False):
+        other = other.node if isinstance(other, AsyncK8sNode) else other
+        peer_name = other if isinstance(other, str) else other.nodeName
+        # both PIDs are resolved on the loop, the blocking connect then hits the cache;
+        # pods on other cluster nodes have no local PID and are linked through their agent
+        await asyncio.gather(self._getPodpid(), self._getPodpid(peer_name), return_exceptions=True)
+        await self.runtime.call(self.node.connect, other, interface_name, peer_interface_name, reconnect)
+
+
+    # Brief: Check whether the pod runs on this cluster node without blocking the event loop.
+    # Params:
+    #   None
+    # Returns:
+    #   True if local nsenter and host PIDs can reach the pod
+    async def _isLocal(self) -> bool:
+        pid_cache = PodPidCache()
+        host = pid_cache.getHost(self.nodeName)
+        if host is None:
+            pod = await self.runtime.readPod(self.nodeName, self.node.namespace)
+            container_statuses = pod.status.container_statuses
+            if not container_statuses:
+                raise RuntimeError(f"No container status found for pod {self.nodeName}")
+            host = {
+                "node": pod.spec.node_name,
+                "ip": pod.status.host_ip,
+                "container_id": parseContainerId(container_statuses[0].container_id)
+            }
+            pid_cache.putHost(self.nodeName, host)
+        return isLocalNode(host["node"])
+
+
+    # Brief: Set IP address on a specific interface inside the pod
+    # Params:
+    #   string ip: IP address to set
+    #   int mask: Subnet mask (CIDR notation)
+    #   string interface: Interface name to set the IP on
+    #   bool reconnect: Replay of a journaled operation, not journaled again (default: False)
+    # Returns:
+    #   None, raises RuntimeError if the address could not be set
+    async def setIp(self, ip: str, mask: int, interface: str, reconnect: bool = False):
+        if aio_client is None:
+            return await self.runtime.call(self.node.setIp, ip, mask, interface, reconnect)
+        if not reconnect:
+            self.node._append_operation({"op": "setIp", "ip": ip, "mask": mask, "interface": interface})
+        # replace keeps replays from failing on an address that survived
+        output, code = await self.runWithExitCode(f"ip addr replace {ip}/{mask} dev {interface} && ip link set {interface} up")
+        if code not in (0, None):
+            raise RuntimeError(f"Error setting ip {ip}/{mask} on {interface} in {self.nodeName}: {output.strip()}")
+        print(f"[INFO] {self.nodeName} com ip {ip} na iface {interface}")
+
+
+    # Brief: Set the default gateway of the pod
+    # Params:
+    #   string gateway_ip: IP address of the gateway
+    #   string interfaceName: Interface name to use as the default route
+    #   bool reconnect: Replay of a journaled operation, not journaled again (default: False)
+    # Returns:
+    #   None
+    async def setDefaultGateway(self, gateway_ip: str, interfaceName: str, reconnect: bool = False):
+        if not await self._isLocal():
+            return await self.runtime.call(self.node.setDefaultGateway, gateway_ip, interfaceName, reconnect)
+        if not reconnect:
+            self.node._append_operation({"op": "setDefaultGateway", "gateway_ip": gateway_ip, "iface_peer": interfaceName})
+        pid = await self._getPodpid()
+        try:
+            # the k8s default gateway may not exist
+            await self.runtime.subprocess("nsenter", "-t", pid, "-n", "sh", "-c", "ip route del default || true")
+            await self.runtime.subprocess("nsenter", "-t", pid, "-n", "ip", "route", "add", "default", "via", gateway_ip, "dev", interfaceName)
+            print(f"[INFO] Default gateway {gateway_ip} set on {interfaceName} in pod {self.nodeName}")
+        except Exception as ex:
+            raise Exception(f"Error setting default gateway {gateway_ip} on {interfaceName} in {self.nodeName}: {str(ex)}")
+
+
+    # Brief: Add a static route inside the pod
+    # Params:
+    #   string ip: Destination IP address
+    #   string mask: Subnet mask (CIDR notation)
+    #   string interfaceName: Interface name to use for the route
+    #   bool reconnect: Replay of a journaled operation, not journaled again (default: False)
+    # Returns:
+    #   None
+    async def addRoute(self, ip: str, mask: str, interfaceName: str, reconnect: bool = False):
+        if not await self._isLocal():
+            return await self.runtime.call(self.node.addRoute, ip, mask, interfaceName, reconnect)
+        if not reconnect:
+            self.node._append_operation({"op": "addRoute", "ip": ip, "mask": mask, "interface": interfaceName})
+        pid = await self._getPodpid()
+        try:
+            await self.runtime.subprocess("nsenter", "-t", pid, "-n", "ip", "route", "add", f"{ip}/{mask}", "dev", interfaceName)
+            print(f"[INFO] Route {ip}/{mask} via {interfaceName} added in pod {self.nodeName}")
+        except Exception as ex:
+            raise Exception(f"Error adding route {ip}/{mask} via {interfaceName} in {self.nodeName}: {str(ex)}")
+
+
+    # Brief: Connect the node to the internet via a veth pair
+    # Params:
+    #   string ip: IP address to assign to the host's interface
+    #   int mask: Subnet mask (CIDR notation)
+    #   string node_iface: Interface name inside the pod
+    #   string host_iface: Interface name on the host
+    #   bool reconnect: Replay of a journaled operation, not journaled again (default: False)
+    # Returns:
+    #   None
+    async def connectToInternet(self, ip: str, mask: int, node_iface: str, host_iface: str, reconnect: bool = False):
+        if await self._isLocal():
+            await self._getPodpid()
+        await self.runtime.call(self.node.connectToInternet, ip, mask, node_iface, host_iface, reconnect)
+
+
+    # Brief: Run a command inside the pod
+    # Params:
+    #   string command: Command to run (string)
+    # Returns:
+    #   Command output (string)
+    async def run(self, command: str):
+        output, _ = await self.runWithExitCode(command)
+        return output
+
+
+    # Brief: Run a command inside the pod, over an asyncio exec stream when kubernetes_asyncio is installed
+    # Params:
+    #   string command: Command to run (string)
+    # Returns:
+    #   Tuple (output, exit code); the exit code is None if it could not be read
+    async def runWithExitCode(self, command: str):
+        if aio_client is None:
+            return await self.runtime.call(self.node.runWithExitCode, command)
+        return await self.runtime.exec(self.nodeName, self.node.namespace, command)
+
+
+    # Brief: Delete the pod from Kubernetes
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    async def delete(self):
+        await self.runtime.call(self.node.delete)
+
+
+# Brief: Coroutine API of K8sSwitch.
+class AsyncK8sSwitch(AsyncK8sNode):
+    node_class = K8sSwitch
+
+    # Brief: Point the switch bridge at an OpenFlow controller.
+    # Params:
+    #   string controller_ip: IP address of the controller
+    #   int controller_port: Port of the controller (default: 6653)
+    #   string protocol: Connection protocol (default: "tcp")
+    #   bool reconnect: Replay of a journaled operation, not journaled again (default: False)
+    # Returns:
+    #   None
+    async def setController(self, controller_ip: str, controller_port: int = 6653, protocol: str = "tcp", reconnect: bool = False):
+        await self.runtime.call(self.node.setController, controller_ip, controller_port, protocol, reconnect)
+
+
+# Brief: Coroutine API of K8sController.
+class AsyncK8sController(AsyncK8sNode):
+    node_class = K8sController
+
+    # Brief: Start the Ryu SDN controller inside the pod.
+    # Params:
+    #   string ip: Address Ryu listens on (default: None, the pod IP)
+    #   int port: OpenFlow port (default: 6653)
+    #   string app_path: Ryu application to run (default: "ryu.app.simple_switch_13")
+    #   bool reconnect: Replay of a journaled operation, not journaled again (default: False)
+    # Returns:
+    #   None
+    async def initController(self, ip=None, port=6653, app_path="ryu.app.simple_switch_13", reconnect: bool = False):
+        await self.runtime.call(self.node.initController, ip, port, app_path, reconnect)
+
+
+    # Brief: Get the IP address of the controller pod.
+    # Params:
+    #   None
+    # Returns:
+    #   string IP address
+    async def getIp(self):
+        return await self.runtime.call(self.node.getIp)
@@ -1,4 +1,5 @@
 from .node import K8sNode
+import socket
 import time
 
 # Brief: Kubernetes SDN controller node.
@@ -6,8 +7,8 @@ import time
 # This class encapsulates the functionality to create and manage an SDN controller
 class K8sController(K8sNode):
 
-    def __init__(self, nodeName):
-        super().__init__(nodeName, image="osrg/ryu")
+    def __init__(self, nodeName, namespace="default"):
+        super().__init__(nodeName, image="osrg/ryu", namespace=namespace)
 
 
     # Brief: Instantiate the controller pod.
@@ -44,20 +45,22 @@ class K8sController(K8sNode):
 
 
     # Brief: Wait for the Ryu controller to start listening on the specified port.
+    # Readiness is probed with a TCP connect to the pod IP instead of running `ss` inside the pod.
     # Params:
     #   int port: Port to check (default: 6653).
     #   int timeout: Maximum wait time in seconds (default: 600).
     # Returns:
     #   None
     def __waitForRyu(self, port=6653, timeout=600):
-        for _ in range(timeout):
+        pod_ip = self.api.read_namespaced_pod(name=self.nodeName, namespace=self.namespace).status.pod_ip
+        deadline = time.time() + timeout
+        while time.time() < deadline:
             try:
-                out = self.run("ss -lntp")
-                if str(port) in out:
+                with socket.create_connection((pod_ip, port), timeout=1):
                     return True
-            except Exception:
+            except OSError:
                 pass
-            time.sleep(1)
+            time.sleep(0.1)
         raise TimeoutError(f"Ryu controller não respondeu na porta {port}.")
 
 
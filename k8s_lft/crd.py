@@ -0,0 +1,47 @@
+from kubernetes import client
+from k8s_lft.kubeclient import K8sClientContext
+import datetime
+
+
+# Topology custom resource owned by the in-cluster operator
+GROUP = "lft.k8s.io"
+VERSION = "v1alpha1"
+PLURAL = "topologies"
+KIND = "Topology"
+
+# an operator heartbeat older than this is considered gone
+HEARTBEAT_TIMEOUT = 30
+
+
+# Brief: Read a Topology custom resource.
+# Params:
+#   string name: Name of the Topology.
+#   string namespace: Namespace of the Topology.
+# Returns:
+#   dict custom object, or None if it does not exist (or the CRD is not installed)
+def readTopology(name, namespace="default"):
+    try:
+        return client.CustomObjectsApi(K8sClientContext().api_client).get_namespaced_custom_object(
+            GROUP, VERSION, namespace, PLURAL, name)
+    except client.exceptions.ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+# Brief: Check whether an operator is recovering the topologies of a namespace.
+# Params:
+#   string namespace: Namespace of the topology.
+#   string name: Name of the Topology (default: "lft").
+# Returns:
+#   True if the operator reported a heartbeat recently
+def operatorActive(namespace="default", name="lft"):
+    try:
+        topology = readTopology(name, namespace)
+    except client.exceptions.ApiException:
+        return False
+    heartbeat = ((topology or {}).get("status") or {}).get("heartbeat")
+    if not heartbeat:
+        return False
+    age = datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(heartbeat)
+    return age.total_seconds() < HEARTBEAT_TIMEOUT
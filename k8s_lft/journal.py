@@ -0,0 +1,248 @@
+from kubernetes import client
+import atexit
+import threading
+import time
+import json
+
+
+# Operations that replace an earlier operation with the same key
+SUPERSEDING_KEYS = {
+    "connect": lambda op: (op["interface_name"],),
+    "connectToInternet": lambda op: (op["node_iface"],),
+    "setIp": lambda op: (op["ip"], op["mask"], op["interface"]),
+    "setDefaultGateway": lambda op: (),
+    "addRoute": lambda op: (op["ip"], op["mask"]),
+    "setController": lambda op: (),
+    "initController": lambda op: (),
+}
+
+# Operations that (re)create an interface, wiping whatever was configured on it before
+INTERFACE_CREATING_OPS = ("connect", "connectToInternet")
+
+
+# Brief: Get the interface an operation is bound to.
+# Params:
+#   dict operation: Journal operation.
+# Returns:
+#   string interface name, or None if the operation is not bound to an interface
+def interfaceOf(operation):
+    match operation["op"]:
+        case "connect":
+            return operation["interface_name"]
+        case "connectToInternet":
+            return operation["node_iface"]
+        case "setIp":
+            return operation["interface"]
+        case "setDefaultGateway":
+            return operation["iface_peer"]
+        case "addRoute":
+            return operation["interface"]
+        case _:
+            return None
+
+
+# Brief: Append an operation to a list of operations, dropping the entries it supersedes.
+# An operation replaces an earlier one with the same key, and an operation that
+# creates an interface drops everything previously configured on that interface,
+# since recreating the interface wiped it. The new entry is always appended last
+# so the compacted list replays in the same order the live state was built.
+# Params:
+#   list operations: Compacted operations of one node.
+#   dict operation: Operation to append.
+# Returns:
+#   New compacted list of operations
+def compactOperations(operations, operation):
+    key_of = SUPERSEDING_KEYS.get(operation["op"])
+    key = key_of(operation) if key_of else None
+    iface = interfaceOf(operation) if operation["op"] in INTERFACE_CREATING_OPS else None
+
+    def superseded(old):
+        if old == operation:
+            return True
+        if key is not None and old["op"] == operation["op"] and SUPERSEDING_KEYS[old["op"]](old) == key:
+            return True
+        return iface is not None and interfaceOf(old) == iface
+
+    return [old for old in operations if not superseded(old)] + [operation]
+
+
+# Per-namespace journal of the operations applied to each pod of a topology.
+# The journal lives in a single ConfigMap with one key per pod, holding the
+# node kind and its compacted list of operations. Appends only touch an
+# in-memory mirror; dirty entries are flushed in the background with one PATCH
+# that carries just the changed keys, so recording an operation costs no API
+# round trip and the size of each entry stays bounded by the live state.
+class OperationJournal:
+    CONFIGMAP_NAME = "lft-journal"
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    def __new__(cls, namespace="default", *args, **kwargs):
+        with cls._instances_lock:
+            if namespace not in cls._instances:
+                cls._instances[namespace] = super().__new__(cls)
+            return cls._instances[namespace]
+
+    def __init__(self, namespace="default", api=None, flush_interval=0.5, labels=None):
+        if hasattr(self, "_initialized") and self._initialized:
+            return
+
+        self._initialized = True
+        self.namespace = namespace
+        self.api = api or client.CoreV1Api()
+        self.flush_interval = flush_interval
+        self.labels = labels or {"app": "k8s-node"}
+        self.entries = None
+        self.dirty = set()
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.__flushLoop, daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+
+    # Brief: Record an operation applied to a pod.
+    # Params:
+    #   string pod_name: Name of the pod the operation was applied to.
+    #   string kind: Class name of the node (e.g. "K8sSwitch").
+    #   dict operation: Operation to record.
+    # Returns:
+    #   None
+    def append(self, pod_name, kind, operation):
+        with self.lock:
+            entries = self.__entries()
+            entry = entries.setdefault(pod_name, {"kind": kind, "operations": []})
+            entry["operations"] = compactOperations(entry["operations"], operation)
+            self.dirty.add(pod_name)
+        self.wakeup.set()
+
+
+    # Brief: Start an empty journal entry for a pod, discarding what a previous topology left behind.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string kind: Class name of the node.
+    # Returns:
+    #   None
+    def reset(self, pod_name, kind):
+        with self.lock:
+            self.__entries()[pod_name] = {"kind": kind, "operations": []}
+            self.dirty.add(pod_name)
+        self.wakeup.set()
+
+
+    # Brief: Drop the journal entries of pods that no longer exist.
+    # Params:
+    #   iterable pod_names: Names of the pods.
+    # Returns:
+    #   None
+    def remove(self, pod_names):
+        with self.lock:
+            entries = self.__entries()
+            for pod_name in pod_names:
+                if entries.pop(pod_name, None) is not None:
+                    self.dirty.add(pod_name)
+        self.wakeup.set()
+
+
+    # Brief: Get the recorded operations of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    # Returns:
+    #   List of operations, or None if the pod has no journal entry
+    def operations(self, pod_name):
+        with self.lock:
+            entry = self.__entries().get(pod_name)
+            return list(entry["operations"]) if entry else None
+
+
+    # Brief: Get the recorded entries of every pod.
+    # Params:
+    #   None
+    # Returns:
+    #   dict mapping pod names to {"kind", "operations"}
+    def readAll(self):
+        with self.lock:
+            return {name: {"kind": entry["kind"], "operations": list(entry["operations"])}
+                    for name, entry in self.__entries().items()}
+
+
+    # Brief: Reload the journal from the cluster with a single GET, dropping unflushed changes.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def reload(self):
+        with self.lock:
+            self.entries = None
+            self.dirty.clear()
+            self.__entries()
+
+
+    # Brief: Write every dirty entry to the ConfigMap with a single request.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                # removed entries are sent as null, which deletes their key
+                data = {name: json.dumps(self.entries[name]) if name in self.entries else None for name in self.dirty}
+                self.dirty.clear()
+            try:
+                self.api.patch_namespaced_config_map(
+                    name=self.CONFIGMAP_NAME,
+                    namespace=self.namespace,
+                    body={"data": data}
+                )
+            except client.exceptions.ApiException as e:
+                if e.status != 404:
+                    with self.lock:
+                        self.dirty.update(data)
+                    raise
+                self.api.create_namespaced_config_map(
+                    namespace=self.namespace,
+                    body={
+                        "apiVersion": "v1",
+                        "kind": "ConfigMap",
+                        "metadata": {"name": self.CONFIGMAP_NAME, "labels": self.labels},
+                        "data": data
+                    }
+                )
+
+
+    # Brief: Load the in-memory mirror of the journal on first use.
+    # Params:
+    #   None
+    # Returns:
+    #   dict of journal entries
+    def __entries(self):
+        if self.entries is None:
+            try:
+                cm = self.api.read_namespaced_config_map(self.CONFIGMAP_NAME, self.namespace)
+                self.entries = {name: json.loads(value) for name, value in (cm.data or {}).items()}
+            except client.exceptions.ApiException as e:
+                if e.status != 404:
+                    raise
+                self.entries = dict()
+        return self.entries
+
+
+    # Brief: Background loop flushing dirty entries every flush_interval seconds.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __flushLoop(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            time.sleep(self.flush_interval)  # let appends pile up into one batch
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Journal] Erro ao gravar o journal: {e}. Nova tentativa em {self.flush_interval}s")
+                self.wakeup.set()
@@ -0,0 +1,78 @@
+from kubernetes import client, config
+import subprocess
+import threading
+import os
+
+
+# Process-wide Kubernetes client context shared by every K8sNode, K8sSwitch,
+# K8sController and the K8sWatcher. The kubeconfig is generated and loaded once,
+# and all API objects share one ApiClient whose urllib3 pool is sized for large
+# topologies, instead of every node opening its own pool.
+class K8sClientContext:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, kubeconfig_path="kubeconfig", pool_maxsize=64):
+        if hasattr(self, "_initialized") and self._initialized:
+            return
+
+        with self._instance_lock:
+            if hasattr(self, "_initialized") and self._initialized:
+                return
+            self.kubeconfig_path = kubeconfig_path
+            self.configuration = client.Configuration()
+            if os.environ.get("KUBERNETES_SERVICE_HOST"):
+                config.load_incluster_config(client_configuration=self.configuration)
+            else:
+                self._generateKubeconfig(kubeconfig_path)
+                config.load_kube_config(config_file=kubeconfig_path, client_configuration=self.configuration)
+            self.configuration.connection_pool_maxsize = pool_maxsize
+            client.Configuration.set_default(self.configuration)
+
+            self.api_client = client.ApiClient(self.configuration)
+            self.core_api = client.CoreV1Api(self.api_client)
+            self.apps_api = client.AppsV1Api(self.api_client)
+            # kubernetes.stream swaps the request method of the ApiClient it is
+            # given while opening a websocket, so exec streams get their own client
+            self.exec_api = client.CoreV1Api(client.ApiClient(self.configuration))
+            self.exec_lock = threading.Lock()
+            self._initialized = True
+
+
+    # Brief: Get a CoreV1Api backed by a private ApiClient, for blocking exec streams.
+    # The caller owns the client and must close it with api.api_client.close().
+    # Params:
+    #   None
+    # Returns:
+    #   CoreV1Api
+    def newExecApi(self):
+        return client.CoreV1Api(client.ApiClient(self.configuration))
+
+
+    # Brief: Generate kubeconfig file for accessing the cluster
+    # Params:
+    # path: Path to save the kubeconfig file
+    # Returns:
+    #   None
+    def _generateKubeconfig(self, path: str):
+        try:
+            result = subprocess.run(
+                ["sudo", "microk8s", "config"],
+                capture_output=True, text=True, check=True
+            )
+            kubeconfig = result.stdout
+            with open(path, "w") as f:
+                    f.write(kubeconfig)
+
+        except subprocess.CalledProcessError as e:
+            print("Failed to generate kubeconfig:", e.stderr)
+            raise
+        except Exception as e:
+            print("Error creating kubeconfig:", str(e))
+            raise
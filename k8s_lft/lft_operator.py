@@ -0,0 +1,176 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from kubernetes import client
+from k8s_lft.kubeclient import K8sClientContext
+from k8s_lft.journal import OperationJournal
+from k8s_lft.crd import GROUP, VERSION, PLURAL, KIND, readTopology
+from k8s_lft.node import K8sNode
+from k8s_lft.host import K8sHost
+from k8s_lft.switch import K8sSwitch
+from k8s_lft.controller import K8sController
+import argparse
+import datetime
+import threading
+import time
+import os
+
+
+NODE_KINDS = {cls.__name__: cls for cls in (K8sNode, K8sHost, K8sSwitch, K8sController)}
+
+
+# In-cluster operator recovering LFT topologies.
+# It owns a Topology custom resource whose spec names the namespace journal,
+# rebuilds a node object for every pod recorded in the journal, and lets the
+# shared K8sWatcher informer (list once, then watch from the last
+# resourceVersion) replay lost state through the node agents as soon as a pod
+# is recreated. Recovery therefore keeps working after the script that built
+# the topology has exited. Recovery latency is published in the Topology status
+# and as Prometheus metrics.
+class LftOperator:
+
+    def __init__(self, name="lft", namespace="default", metrics_port=9090, sync_interval=5):
+        self.name = name
+        self.namespace = namespace
+        self.metrics_port = metrics_port
+        self.sync_interval = sync_interval
+        self.context = K8sClientContext()
+        self.custom_api = client.CustomObjectsApi(self.context.api_client)
+        self.journal = OperationJournal(namespace=namespace, api=self.context.core_api)
+        self.nodes = dict()
+        self.watcher = None
+
+
+    # Brief: Run the operator until the process is stopped.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def run(self):
+        self.__ensureTopology()
+        threading.Thread(target=self.__serveMetrics, daemon=True).start()
+        print(f"[Operator] Recuperando a topologia {self.namespace}/{self.name}")
+        while True:
+            try:
+                self.__sync()
+                self.__updateStatus()
+            except Exception as e:
+                print(f"[Operator] Erro na sincronização: {e}")
+            time.sleep(self.sync_interval)
+
+
+    # Brief: Adopt the pods recorded in the journal since the last sync.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __sync(self):
+        # the journal is only read here, the scripts building topologies write it
+        self.journal.reload()
+        entries = {pod_name: entry for pod_name, entry in self.journal.readAll().items() if pod_name not in self.nodes}
+        if not entries:
+            return
+        # the topology of each pod is stamped on its StatefulSet, the tag of its iptables rules derives from it
+        labels = {statefulset.metadata.name: statefulset.metadata.labels or {}
+                  for statefulset in self.context.apps_api.list_namespaced_stateful_set(namespace=self.namespace).items}
+        for pod_name, entry in entries.items():
+            node_class = NODE_KINDS.get(entry["kind"], K8sNode)
+            # node constructors take the StatefulSet name, the pod is its "-0" replica
+            node = node_class(pod_name[:-2], namespace=self.namespace)
+            node.topology = labels.get(pod_name[:-2], {}).get("lft/topology")
+            self.nodes[pod_name] = node
+            self.watcher = node.watcher
+            print(f"[Operator] Adotado {pod_name} ({entry['kind']}, topologia {node.topology})")
+
+
+    # Brief: Get the recovery and watch metrics.
+    # Params:
+    #   None
+    # Returns:
+    #   dict of metric names to values
+    def metrics(self):
+        metrics = {"lft_operator_nodes": len(self.nodes)}
+        if self.watcher is None:
+            return metrics
+        recovery = self.watcher.getRecoveryMetrics()
+        stats = self.watcher.getWatchStats()
+        metrics.update({
+            "lft_recoveries_total": recovery["recoveries"],
+            "lft_recovery_seconds_mean": recovery["mean_time_to_recover"],
+            "lft_recovery_seconds_max": recovery["max_time_to_recover"],
+            "lft_recovery_seconds_last": (recovery["last"] or {}).get("time_to_recover"),
+            "lft_watch_relists_total": stats["relists"],
+            "lft_watch_events_total": stats["events"],
+        })
+        return metrics
+
+
+    # Brief: Create the Topology custom resource if it does not exist.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __ensureTopology(self):
+        if readTopology(self.name, self.namespace) is not None:
+            return
+        body = {
+            "apiVersion": f"{GROUP}/{VERSION}",
+            "kind": KIND,
+            "metadata": {"name": self.name},
+            "spec": {"journal": OperationJournal.CONFIGMAP_NAME}
+        }
+        self.custom_api.create_namespaced_custom_object(GROUP, VERSION, self.namespace, PLURAL, body)
+
+
+    # Brief: Publish the heartbeat and the recovery metrics in the Topology status.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __updateStatus(self):
+        metrics = self.metrics()
+        status = {
+            "heartbeat": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "nodes": metrics["lft_operator_nodes"],
+            "recoveries": metrics.get("lft_recoveries_total", 0),
+            "lastRecoverySeconds": metrics.get("lft_recovery_seconds_last"),
+            "meanRecoverySeconds": metrics.get("lft_recovery_seconds_mean"),
+        }
+        self.custom_api.patch_namespaced_custom_object_status(
+            GROUP, VERSION, self.namespace, PLURAL, self.name, {"status": status})
+
+
+    # Brief: Serve the metrics in the Prometheus text format.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __serveMetrics(self):
+        operator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                lines = [f"{name} {value}" for name, value in operator.metrics().items() if value is not None]
+                body = ("\n".join(lines) + "\n").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer(("", self.metrics_port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-cluster recovery operator for LFT topologies")
+    parser.add_argument("--name", default="lft", help="Name of the Topology custom resource")
+    parser.add_argument("--namespace", default="default", help="Namespace of the topology")
+    parser.add_argument("--metrics-port", type=int, default=9090)
+    args = parser.parse_args()
+    # this process does the recovery instead of deferring it
+    os.environ["LFT_OPERATOR"] = "1"
+    LftOperator(args.name, args.namespace, args.metrics_port).run()
@@ -1,6 +1,14 @@
-from kubernetes import client, config
+from kubernetes import client
 from kubernetes.stream import stream
+from k8s_lft.kubeclient import K8sClientContext
 from k8s_lft.watch import K8sWatcher
+from k8s_lft.pidcache import PodPidCache, parseContainerId
+from k8s_lft.journal import OperationJournal
+from k8s_lft.session import ExecSessionPool, ExecSessionInterrupted
+from k8s_lft.tunnel import isLocalNode, tunnelId, TUNNEL_KIND
+from k8s_lft.teardown import iptablesTag
+from k8s_lft.agent import LftAgent
+from profissa_lft.netlink import LinkEngine
 import subprocess
 import re
 import time
@@ -23,12 +31,16 @@ class K8sNode:
         self.cpu = cpu
         self.memory = memory
         self.namespace = namespace
-        self._generateKubeconfig("kubeconfig")
-        config.load_kube_config(config_file="kubeconfig")
-        topology_watcher=K8sWatcher(namespace="default", label_selector="app=k8s-node")
-        topology_watcher.registerNode(self)
-        self.api = client.CoreV1Api()
-        self.apps_api = client.AppsV1Api()
+        # cluster node chosen by the topology placement, None leaves it to the scheduler
+        self.placement = None
+        # name of the K8sTopology holding the node, stamped as the "lft/topology" label
+        self.topology = None
+        self.context = K8sClientContext()
+        self.api = self.context.core_api
+        self.apps_api = self.context.apps_api
+        self.watcher = K8sWatcher(namespace=self.namespace, label_selector="app=k8s-node")
+        self.watcher.registerNode(self)
+        self.journal = OperationJournal(namespace=self.namespace, api=self.api)
 
     # Brief: Instantiate the node (pod) in Kubernetes
     # Params:
@@ -36,10 +48,30 @@ class K8sNode:
     # Returns:
     #   None
     def instantiate(self):
+        self._createStatefulSet()
+        self._waitUntilReady()
+        self._postInstantiate()
+
+
+    # Brief: Submit the StatefulSet of this node without waiting for the pod
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def _createStatefulSet(self):
         ss_manifest  = self._buildStatefulSetManifest()
         self.apps_api.create_namespaced_stateful_set(namespace=self.namespace, body=ss_manifest)
-        self._waitUntilReady()
-            
+        # a fresh StatefulSet must not inherit operations from an older topology
+        self.journal.reset(self.nodeName, self.__class__.__name__)
+
+
+    # Brief: Hook run once the pod is ready, before any link is wired to it
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def _postInstantiate(self):
+        pass
 
 
     # Brief: Connect this node to another node using a veth pair
@@ -52,30 +84,104 @@ class K8sNode:
     def connect(self, other: "K8sNode | str", interface_name: str, peer_interface_name: str, reconnect: bool = False):
         if isinstance(other, str):
             peer_name = other
-            pid2 = self._getPodpid(peer_name) 
 
         elif isinstance(other, K8sNode):
             peer_node = other
             peer_name = other.nodeName
-            pid2 = other._getPodpid()
-            other._append_operation({
-                 "op": "connect",
-                 "peer": self.nodeName,
-                 "interface_name": peer_interface_name,
-                 "peer_interface_name": interface_name
-            })
+            if not reconnect:
+                other._append_operation({
+                     "op": "connect",
+                     "peer": self.nodeName,
+                     "interface_name": peer_interface_name,
+                     "peer_interface_name": interface_name
+                })
 
         else:
             raise TypeError("Parâmetro 'other' deve ser um str (nome) ou K8sNode")
-        
-        pid1 = self._getPodpid()
 
+        host1 = self._getPodHost()
+        host2 = self._getPodHost(peer_name)
+        if host1["node"] != host2["node"]:
+            # endpoints on different cluster nodes are joined by a tunnel
+            self.__connectTunnel(interface_name, peer_interface_name, peer_name, host1, host2)
+        elif not isLocalNode(host1["node"]):
+            print(f"Conectando {self.nodeName} <--> {peer_name} pelo agente de {host1['node']}")
+            LftAgent().createVethPair(host1["node"], host1["container_id"], interface_name,
+                                      host2["container_id"], peer_interface_name)
+        else:
+            pid1 = self._getPodpid()
+            pid2 = self._getPodpid(peer_name)
+            print(f"Conectando {self.nodeName} (PID {pid1}) <--> {peer_name} (PID {pid2})")
 
-        print(f"Conectando {self.nodeName} (PID {pid1}) <--> {peer_name} (PID {pid2})")
+            if LinkEngine.available():
+                self.__connectNetlink(interface_name, peer_interface_name, pid1, pid2)
+            else:
+                self.__connectShell(interface_name, peer_interface_name, pid1, pid2)
 
-        # # Clean up old interfaces if they exist
-        # subprocess.run(f"sudo ip link delete {interface_name}", shell=True, stderr=subprocess.DEVNULL)
-        # subprocess.run(f"sudo ip link delete {peer_interface_name}", shell=True, stderr=subprocess.DEVNULL)
+        if hasattr(self, '_connectInterface'):
+            self._connectInterface(interface_name)
+        if hasattr(other, '_connectInterface'):
+            other._connectInterface(peer_interface_name)
+
+
+        if not reconnect:
+            # insert into statefulset logs, in case this pod crashes
+            self._append_operation({
+                "op": "connect",
+                "peer": peer_name,
+                "interface_name": interface_name,
+                "peer_interface_name": peer_interface_name
+            })
+
+
+    # Brief: Create a link between pods on different cluster nodes as a pair of VXLAN/Geneve tunnel ends
+    # Each end is created by the agent of its cluster node and points at the
+    # host IP of the other end; both ends share an ID derived from the link.
+    # Params:
+    #   string interface_name: Name of the interface in this node
+    #   string peer_interface_name: Name of the interface in the other node
+    #   string peer_name: Name of the other pod
+    #   dict host1: Placement of this pod
+    #   dict host2: Placement of the other pod
+    # Returns:
+    #   None
+    def __connectTunnel(self, interface_name: str, peer_interface_name: str, peer_name: str, host1: dict, host2: dict):
+        vni = tunnelId(self.nodeName, interface_name, peer_name, peer_interface_name)
+        print(f"Conectando {self.nodeName} ({host1['node']}) <--> {peer_name} ({host2['node']}) por {TUNNEL_KIND} {vni}")
+        agent = LftAgent()
+        # one batch per cluster node, both ends are created in parallel
+        with agent.batch():
+            agent.createTunnelEnd(host1["node"], host1["container_id"], interface_name, vni, host2["ip"])
+            agent.createTunnelEnd(host2["node"], host2["container_id"], peer_interface_name, vni, host1["ip"])
+
+
+    # Brief: Create the veth pair of a link with direct netlink messages
+    # Params:
+    #   string interface_name: Name of the interface in this node
+    #   string peer_interface_name: Name of the interface in the other node
+    #   string pid1: PID of this pod's network namespace
+    #   string pid2: PID of the other pod's network namespace
+    # Returns:
+    #   None
+    def __connectNetlink(self, interface_name: str, peer_interface_name: str, pid1: str, pid2: str):
+        engine = LinkEngine()
+        # Clean up old interfaces (try in all possible namespaces)
+        with engine.batch():
+            for iface, pid in [(interface_name, pid1), (peer_interface_name, pid2)]:
+                engine.deleteLink(iface)
+                engine.deleteLink(iface, pid)
+        engine.createVethPair(interface_name, peer_interface_name, pid1, pid2)
+
+
+    # Brief: Create the veth pair of a link with ip/nsenter processes, when netlink is not available
+    # Params:
+    #   string interface_name: Name of the interface in this node
+    #   string peer_interface_name: Name of the interface in the other node
+    #   string pid1: PID of this pod's network namespace
+    #   string pid2: PID of the other pod's network namespace
+    # Returns:
+    #   None
+    def __connectShell(self, interface_name: str, peer_interface_name: str, pid1: str, pid2: str):
         # Clean up old interfaces (try in all possible namespaces)
         for iface, pid in [(interface_name, pid1), (peer_interface_name, pid2)]:
             # Tenta deletar no namespace raiz
@@ -96,21 +202,6 @@ class K8sNode:
         subprocess.run(f"sudo nsenter -t {pid1} -n ip link set {interface_name} up", shell=True, check=True)
         subprocess.run(f"sudo nsenter -t {pid2} -n ip link set {peer_interface_name} up", shell=True, check=True)
 
-        if hasattr(self, '_connectInterface'):
-            self._connectInterface(interface_name)
-        if hasattr(other, '_connectInterface'):
-            other._connectInterface(peer_interface_name)
-
-
-        if not reconnect:
-            # insert into statefulset logs, in case this pod crashes
-            self._append_operation({
-                "op": "connect",
-                "peer": peer_name,
-                "interface_name": interface_name,
-                "peer_interface_name": peer_interface_name
-            })
-
 
     # Brief: Set IP address on a specific interface inside the pod
     # Params:
@@ -139,12 +230,40 @@ class K8sNode:
     # Returns:
     #   Command output (string)
     def run(self, command: str):
+        output, _ = self.runWithExitCode(command)
+        return output
+
+
+    # Brief: Run a command inside the pod through its persistent exec session
+    # Falls back to a one-shot exec stream if the session cannot be opened or written to.
+    # A session lost while the command runs raises ExecSessionInterrupted instead,
+    # since the command may already have taken effect.
+    # Params:
+    #   string command: Command to run (string)
+    # Returns:
+    #   Tuple (output, exit code); the exit code is None on the one-shot fallback
+    def runWithExitCode(self, command: str):
+        try:
+            with self.context.exec_lock:
+                session = ExecSessionPool().get(self.context.exec_api, self.nodeName, self.namespace)
+            return session.run(command)
+        except ExecSessionInterrupted:
+            ExecSessionPool().evict(self.nodeName, self.namespace)
+            raise
+        except (ConnectionError, client.exceptions.ApiException) as e:
+            print(f"[INFO] Sessão exec de {self.nodeName} indisponível ({e}), usando exec avulso")
+            ExecSessionPool().evict(self.nodeName, self.namespace)
+
         exec_command = ["/bin/bash", "-c", command]
-        return stream(self.api.connect_get_namespaced_pod_exec,
-                      self.nodeName, "default",
-                      command=exec_command,
-                      stderr=True, stdin=False,
-                      stdout=True, tty=False)
+        api = self.context.newExecApi()
+        try:
+            return stream(api.connect_get_namespaced_pod_exec,
+                          self.nodeName, self.namespace,
+                          command=exec_command,
+                          stderr=True, stdin=False,
+                          stdout=True, tty=False), None
+        finally:
+            api.api_client.close()
 
 
     # Brief: Delete the pod from Kubernetes
@@ -159,25 +278,65 @@ class K8sNode:
             print(f"Error deleting pod {self.nodeName}: {e}")
 
 
-    # Brief: Get the PID of the pod's main container
+    # Brief: Get the cluster node, host IP and container ID of a pod
+    # Params:
+    #   string pod_name: Name of the pod (default: this node's pod)
+    # Returns:
+    #   dict with keys "node", "ip" and "container_id"
+    def _getPodHost(self, pod_name: str = None) -> dict:
+        pod_name = pod_name or self.nodeName
+        pid_cache = PodPidCache()
+        host = pid_cache.getHost(pod_name)
+        if host is not None:
+            return host
+
+        pod = self.api.read_namespaced_pod(name=pod_name, namespace=self.namespace)
+        container_statuses = pod.status.container_statuses
+        if not container_statuses:
+            raise RuntimeError(f"No container status found for pod {pod_name}")
+        host = {
+            "node": pod.spec.node_name,
+            "ip": pod.status.host_ip,
+            "container_id": parseContainerId(container_statuses[0].container_id)
+        }
+        pid_cache.putHost(pod_name, host)
+        return host
+
+
+    # Brief: Check whether the pod runs on the cluster node running this process
     # Params:
     #   None
     # Returns:
+    #   True if local nsenter and host PIDs can reach the pod
+    def _isLocal(self) -> bool:
+        return isLocalNode(self._getPodHost()["node"])
+
+
+    # Brief: Get the PID of the pod's main container
+    # The PID is served from the process-wide PodPidCache when possible; the
+    # watcher evicts entries whenever the pod is recreated.
+    # Params:
+    #   string pod_name: Name of the pod (default: this node's pod)
+    # Returns:
     #   string PID 
     def _getPodpid(self, pod_name: str = None) -> str:
         if (pod_name is None):
             pod_name = self.nodeName
 
+        pid_cache = PodPidCache()
+        pid = pid_cache.get(pod_name)
+        if pid is not None:
+            return pid
+
         pod = self.api.read_namespaced_pod(name=pod_name, namespace=self.namespace)
         container_statuses = pod.status.container_statuses
         if not container_statuses:
             raise RuntimeError(f"No container status found for pod {pod_name}")
 
         full_container_id = container_statuses[0].container_id  # Format: "containerd://<id>"
-        match = re.match(r"containerd://([a-f0-9]+)", full_container_id)
-        if not match:
+        container_id = parseContainerId(full_container_id)
+        if container_id is None:
             raise RuntimeError(f"Unexpected container ID format: {full_container_id}")
-        container_id = match.group(1)
 
         # Use microk8s ctr to inspect container and get PID
         result = subprocess.run(
@@ -195,48 +354,67 @@ class K8sNode:
             if match:
                 pid = match.group(1)
                 print(f"PID do pod {pod_name} é {pid}")
+                pid_cache.put(pod_name, container_id, pid)
                 return pid
         raise RuntimeError(f"PID not found in container info for {pod_name}")
 
 
     # Brief: Connect the node to the internet via a veth pair
+    # The host end lives on the cluster node of the pod and is NATed through its
+    # default route. Pods on other cluster nodes, and every pod when running in
+    # the operator, are connected through the agent of their node.
     # Params:
-    #   string ip: IP address to assign to the node's interface
+    #   string ip: IP address to assign to the host's interface
     #   int mask: Subnet mask (CIDR notation)
     #   string node_iface: Interface name inside the pod
     #   string host_iface: Interface name on the host
     # Returns:
     #   None
     def connectToInternet(self, ip: str, mask: int, node_iface: str, host_iface: str, reconnect: bool = False):
+        # rules are tagged with the topology so teardown removes exactly them, and
+        # only added when missing so watcher replays do not stack duplicates
+        tag = iptablesTag(self.topology)
+        if not self._isLocal():
+            host = self._getPodHost()
+            hostGateway = LftAgent().connectToInternet(host["node"], host["container_id"], node_iface, host_iface, ip, mask, tag)
+        else:
+            hostGateway = subprocess.run(
+                "ip route show default | awk '{print $5}'",
+                shell=True, capture_output=True
+            ).stdout.decode().strip()
+
+            pid = self._getPodpid()
+            self._create(node_iface, host_iface)
+            self._setInterface(pid, node_iface)
+
+            if LinkEngine.available():
+                engine = LinkEngine()
+                engine.setUp(host_iface)
+                engine.addAddress(host_iface, ip, mask)
+            else:
+                subprocess.run(f"ip link set {host_iface} up", shell=True, check=True)
+                subprocess.run(f"ip addr add {ip}/{mask} dev {host_iface}", shell=True, check=True)
+
+            comment = f"-m comment --comment {tag}"
+            for table, action, rule in (("nat", "-I", f"POSTROUTING -o {hostGateway} {comment} -j MASQUERADE"),
+                                        ("filter", "-A", f"FORWARD -i {host_iface} -o {hostGateway} {comment} -j ACCEPT"),
+                                        ("filter", "-A", f"FORWARD -i {hostGateway} -o {host_iface} {comment} -j ACCEPT")):
+                subprocess.run(f"iptables -t {table} -C {rule} 2>/dev/null || iptables -t {table} {action} {rule}", shell=True, check=True)
+
+        print(f"[INFO] Host gateway: {hostGateway}")
+
+        if self.__class__.__name__ == 'K8sSwitch' and hasattr(self, '_createPort'):
+            self._createPort(self.nodeName, node_iface)
+
         if not reconnect:
             self._append_operation({
                 "op": "connectToInternet",
                 "ip": ip,
                 "mask": mask,
                 "node_iface": node_iface,
-                "host_iface": host_iface
+                "host_iface": host_iface,
+                "gateway": hostGateway
             })
-        pid = self._getPodpid()
-        self._create(node_iface, host_iface)
-        self._setInterface(pid, node_iface)
-
-        if self.__class__.__name__ == 'K8sSwitch' and hasattr(self, '_createPort'):
-            self._createPort(self.nodeName, node_iface)
-
-    
-        subprocess.run(f"ip link set {host_iface} up", shell=True, check=True)
-        subprocess.run(f"ip addr add {ip}/{mask} dev {host_iface}", shell=True, check=True)
-
-        hostGateway = subprocess.run(
-            "ip route show default | awk '{print $5}'",
-            shell=True, capture_output=True
-        ).stdout.decode().strip()
-
-        print(f"[INFO] Host gateway: {hostGateway}")
-
-        subprocess.run(f"iptables -t nat -I POSTROUTING -o {hostGateway} -j MASQUERADE", shell=True, check=True)
-        subprocess.run(f"iptables -A FORWARD -i {host_iface} -o {hostGateway} -j ACCEPT", shell=True, check=True)
-        subprocess.run(f"iptables -A FORWARD -i {hostGateway} -o {host_iface} -j ACCEPT", shell=True, check=True)
 
         print(f"[INFO] {self.nodeName} conectado à Internet com {ip}/{mask}")
 
@@ -248,6 +426,15 @@ class K8sNode:
     # Returns:
     #   None
     def _create(self, peer1Name: str, peer2Name: str) -> None:
+        if LinkEngine.available():
+            engine = LinkEngine()
+            with engine.batch():
+                engine.deleteLink(peer1Name)
+                engine.deleteLink(peer2Name)
+            engine.createVethPair(peer1Name, peer2Name, up=False)
+            print(f"[INFO] Par veth {peer1Name}<->{peer2Name} criado")
+            return
+
         # Remove if exists 
         subprocess.run(f"ip link del {peer1Name}", shell=True, check=False, stderr=subprocess.DEVNULL) 
         subprocess.run(f"ip link del {peer2Name}", shell=True, check=False, stderr=subprocess.DEVNULL)
@@ -266,8 +453,11 @@ class K8sNode:
     #   None
     def _setInterface(self, pid: int, peerName: str) -> None:
         try:
-            subprocess.run(f"ip link set {peerName} netns {pid}", shell=True, check=True)
-            subprocess.run(f"nsenter -t {pid} -n ip link set {peerName} up", shell=True, check=True)
+            if LinkEngine.available():
+                LinkEngine().moveToNamespace(peerName, pid)
+            else:
+                subprocess.run(f"ip link set {peerName} netns {pid}", shell=True, check=True)
+                subprocess.run(f"nsenter -t {pid} -n ip link set {peerName} up", shell=True, check=True)
             print(f"[INFO] Interface {peerName} movida para pod {self.nodeName} (PID {pid}) e ativada")
         except Exception as ex:
             raise Exception(f"Error while setting interface {peerName} in pod {self.nodeName} (PID {pid}): {str(ex)}")
@@ -287,6 +477,12 @@ class K8sNode:
                 "iface_peer": interfaceName
             })
 
+        if not self._isLocal():
+            host = self._getPodHost()
+            LftAgent().setRoute(host["node"], host["container_id"], "default", interfaceName, gateway_ip)
+            print(f"[INFO] Default gateway {gateway_ip} set on {interfaceName} in pod {self.nodeName}")
+            return
+
         pid = self._getPodpid()
         try:
             # delete k8s deafult gateway if exists
@@ -304,7 +500,21 @@ class K8sNode:
     #   string interfaceName: Interface name to use for the route
     # Returns:
     #   None
-    def addRoute(self, ip: str, mask: str, interfaceName: str):
+    def addRoute(self, ip: str, mask: str, interfaceName: str, reconnect: bool = False):
+        if not reconnect:
+            self._append_operation({
+                "op": "addRoute",
+                "ip": ip,
+                "mask": mask,
+                "interface": interfaceName
+            })
+
+        if not self._isLocal():
+            host = self._getPodHost()
+            LftAgent().setRoute(host["node"], host["container_id"], f"{ip}/{mask}", interfaceName)
+            print(f"[INFO] Route {ip}/{mask} via {interfaceName} added in pod {self.nodeName}")
+            return
+
         pid = self._getPodpid()
         try:
             subprocess.run(f"nsenter -t {pid} -n ip route add {ip}/{mask} dev {interfaceName}", shell=True, check=True)
@@ -314,14 +524,22 @@ class K8sNode:
 
 
     # Brief: Wait until the pod is in Running state and ready
+    # Readiness comes from the shared K8sWatcher pod watch, so waiters wake up
+    # as soon as the Ready condition flips instead of polling the apiserver.
     # Params:
     #   int timeout: Maximum time to wait in seconds (default: 600)
     # Returns:
     #   None
     def _waitUntilReady(self, timeout: int = 600):
+        if self.watcher.tracks(self.namespace, self.app):
+            if self.watcher.waitUntilReady(self.nodeName, timeout):
+                return
+            raise TimeoutError(f"Pod {self.nodeName} did not become ready within {timeout} seconds.")
+
+        # pods outside the watcher's namespace or label selector are polled
         for _ in range(timeout):
             try:
-                pod = self.api.read_namespaced_pod(name=self.nodeName, namespace="default")
+                pod = self.api.read_namespaced_pod(name=self.nodeName, namespace=self.namespace)
                 if pod.status.phase == "Running":
                     # Check if all containers are ready
                     conditions = pod.status.conditions or []
@@ -335,29 +553,6 @@ class K8sNode:
         raise TimeoutError(f"Pod {self.nodeName} did not become ready within {timeout} seconds.")
 
 
-    # Brief: Generate kubeconfig file for accessing the cluster
-    # Params:
-    # path: Path to save the kubeconfig file
-    # Returns:
-    #   None
-    def _generateKubeconfig(self, path: str):
-        try:
-            result = subprocess.run(
-                ["sudo", "microk8s", "config"],
-                capture_output=True, text=True, check=True
-            )
-            kubeconfig = result.stdout
-            with open(path, "w") as f:
-                    f.write(kubeconfig)
-
-        except subprocess.CalledProcessError as e:
-            print("Failed to generate kubeconfig:", e.stderr)
-            raise
-        except Exception as e:
-            print("Error creating kubeconfig:", str(e))
-            raise
-
-
     # Brief: Build the StatefulSet manifest for Kubernetes, to ensure stable network identity
     # Params:
     #   None
@@ -368,62 +563,58 @@ class K8sNode:
         if self.privileged:
             security_context["privileged"] = True
 
+        pod_spec = {
+            "containers": [{
+                "name": "main",
+                "image": self.image,
+                "stdin": True,
+                "tty": True,
+                "securityContext": security_context,
+                "resources": {
+                    "limits": {
+                        "cpu": self.cpu,
+                        "memory": self.memory
+                    }
+                }
+            }],
+            "restartPolicy": "Always"
+        }
+        if self.placement is not None:
+            # affinity instead of nodeName so the scheduler still checks resources
+            pod_spec["affinity"] = {"nodeAffinity": {"requiredDuringSchedulingIgnoredDuringExecution": {
+                "nodeSelectorTerms": [{"matchFields": [
+                    {"key": "metadata.name", "operator": "In", "values": [self.placement]}
+                ]}]
+            }}}
+
+        labels = {"app": self.app}
+        if self.topology is not None:
+            labels["lft/topology"] = self.topology
+
         return {
             "apiVersion": "apps/v1",
             "kind": "StatefulSet",
             "metadata": {
                 "name": f"{(self.nodeName)[:-2]}",
-                "labels": {"app": self.app}
+                "labels": labels
             },
             "spec": {
                 "serviceName": f"{(self.nodeName)[:-2]}",  # precisa do headless service
                 "replicas": 1,
                 "selector": {"matchLabels": {"app": self.app}},
                 "template": {
-                    "metadata": {"labels": {"app": self.app}},
-                    "spec": {
-                        "containers": [{
-                            "name": "main",
-                            "image": self.image,
-                            "stdin": True,
-                            "tty": True,
-                            "securityContext": security_context,
-                            "resources": {
-                                "limits": {
-                                    "cpu": self.cpu,
-                                    "memory": self.memory
-                                }
-                            }
-                        }],
-                        "restartPolicy": "Always"
-                    }
+                    "metadata": {"labels": labels},
+                    "spec": pod_spec
                 }
             }
         }
 
 
 
-    # Brief: Append an operation to the pod's StatefulSet annotations for persistence
+    # Brief: Record an operation in the topology's operation journal for persistence
     # Params:
     #  dict operation: Operation to append
     # Returns:
     #  None
     def _append_operation(self, operation):
-        ss = self.apps_api.read_namespaced_stateful_set(self.nodeName[:-2], "default")
-        annotations = ss.metadata.annotations or {}
-
-        ops = json.loads(annotations.get("lft/operations", "[]"))
-
-        ops.append(operation)
-        annotations["lft/operations"] = json.dumps(ops)
-
-        patch = {"metadata": {"annotations": annotations}}
-        self.apps_api.patch_namespaced_stateful_set(
-            name=ss.metadata.name,
-            namespace="default",
-            body=patch
-        )
-
-
-
-
+        self.journal.append(self.nodeName, self.__class__.__name__, operation)
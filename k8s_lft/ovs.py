@@ -0,0 +1,105 @@
+import shlex
+
+
+# Brief: Open vSwitch configuration builder.
+# Bridge, port, controller and fail-mode changes are collected and rendered as
+# one shell command: a single "ovs-vsctl -- ... -- ..." transaction followed by
+# setting the new devices up. The whole set is applied by one exec in the
+# switch pod and is atomic on the OVSDB side, so attaching 100 ports costs one
+# round trip instead of 200.
+class OvsTransaction:
+
+    def __init__(self):
+        self.commands = []
+        self.devices = []
+
+
+    # Brief: Create a bridge, doing nothing if it already exists.
+    # Params:
+    #   string bridge: Bridge name.
+    # Returns:
+    #   The transaction itself
+    def addBridge(self, bridge: str):
+        self.commands.append(["--may-exist", "add-br", bridge])
+        self.__up(bridge)
+        return self
+
+
+    # Brief: Attach an interface to a bridge, doing nothing if it is already attached.
+    # Params:
+    #   string bridge: Bridge name.
+    #   string port: Interface name.
+    # Returns:
+    #   The transaction itself
+    def addPort(self, bridge: str, port: str):
+        self.commands.append(["--may-exist", "add-port", bridge, port])
+        self.__up(port)
+        return self
+
+
+    # Brief: Replace the controllers of a bridge.
+    # Params:
+    #   string bridge: Bridge name.
+    #   string target: Controller target such as "tcp:10.0.0.1:6653".
+    # Returns:
+    #   The transaction itself
+    def setController(self, bridge: str, target: str):
+        # set-controller replaces every controller of the bridge
+        self.commands.append(["set-controller", bridge, target])
+        return self
+
+
+    # Brief: Set the fail mode of a bridge.
+    # Params:
+    #   string bridge: Bridge name.
+    #   string mode: "secure" or "standalone".
+    # Returns:
+    #   The transaction itself
+    def setFailMode(self, bridge: str, mode: str):
+        self.commands.append(["set-fail-mode", bridge, mode])
+        return self
+
+
+    # Brief: Add the changes of another transaction to this one.
+    # Params:
+    #   OvsTransaction other: Transaction to merge.
+    # Returns:
+    #   The transaction itself
+    def extend(self, other):
+        self.commands.extend(other.commands)
+        for device in other.devices:
+            self.__up(device)
+        return self
+
+
+    # Brief: Render the transaction as one shell command.
+    # Params:
+    #   None
+    # Returns:
+    #   string command, empty if the transaction has no changes
+    def command(self):
+        if not self.commands:
+            return ""
+        command = "ovs-vsctl " + " ".join("-- " + shlex.join(args) for args in self.commands)
+        if self.devices:
+            command += " && " + self.upCommand()
+        return command
+
+
+    # Brief: Render the part of the transaction that sets the new devices up.
+    # Params:
+    #   None
+    # Returns:
+    #   string command, empty if no device is created
+    def upCommand(self):
+        # chained instead of "ip -batch", which busybox ip does not support
+        return " && ".join(f"ip link set {shlex.quote(device)} up" for device in self.devices)
+
+
+    def __up(self, device):
+        if device not in self.devices:
+            self.devices.append(device)
+
+
+    def __len__(self):
+        return len(self.commands)
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+
+
+# Brief: Extract the bare container ID from a pod status container ID.
+# Params:
+#   string full_container_id: Container ID in the "containerd://<id>" format.
+# Returns:
+#   string container ID, or None if the format is not recognised
+def parseContainerId(full_container_id: str):
+    match = re.match(r"containerd://([a-f0-9]+)", full_container_id or "")
+    return match.group(1) if match else None
+
+
+# Brief: Find a process of a container on this host.
+# Unlike the namespace PID, which may belong to the pod sandbox, this process
+# runs in the container's own mount namespace, so /proc/<pid>/root is the
+# container's filesystem.
+# Params:
+#   string container_id: Bare container ID.
+# Returns:
+#   string PID, or None if no process of the container is visible
+def containerPid(container_id: str):
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/cgroup") as f:
+                if container_id in f.read():
+                    return entry
+        except OSError:
+            continue
+    return None
+
+
+# Process-wide cache of pod network-namespace PIDs.
+# Resolving a PID costs an API round trip plus a `microk8s ctr containers info`
+# call, so every K8sNode shares this cache. Entries are keyed by pod name and
+# remember the container ID they were resolved from; K8sWatcher evicts them
+# as soon as it observes a new pod UID or container ID for that pod.
+class PodPidCache:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance._entries = dict()
+                cls._instance._hosts = dict()
+                cls._instance._lock = threading.Lock()
+        return cls._instance
+
+
+    # Brief: Get the cached PID of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string container_id: If given, only return the entry if it was resolved from this container.
+    # Returns:
+    #   string PID, or None if there is no valid entry
+    def get(self, pod_name: str, container_id: str = None):
+        with self._lock:
+            entry = self._entries.get(pod_name)
+        if entry is None:
+            return None
+        if container_id is not None and entry["container_id"] != container_id:
+            self.evict(pod_name)
+            return None
+        # A PID whose namespace is gone belongs to a dead sandbox
+        if not os.path.lexists(f"/proc/{entry['pid']}/ns/net"):
+            self.evict(pod_name)
+            return None
+        return entry["pid"]
+
+
+    # Brief: Store the PID of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string container_id: Container ID the PID was resolved from.
+    #   string pid: PID of the pod's network namespace holder.
+    # Returns:
+    #   None
+    def put(self, pod_name: str, container_id: str, pid: str):
+        with self._lock:
+            self._entries[pod_name] = {"container_id": container_id, "pid": pid}
+
+
+    # Brief: Get the cached placement of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    # Returns:
+    #   dict with the cluster node, host IP and container ID of the pod, or None
+    def getHost(self, pod_name: str):
+        with self._lock:
+            return self._hosts.get(pod_name)
+
+
+    # Brief: Store the placement of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   dict host: Cluster node ("node"), host IP ("ip") and container ID ("container_id").
+    # Returns:
+    #   None
+    def putHost(self, pod_name: str, host: dict):
+        with self._lock:
+            self._hosts[pod_name] = host
+
+
+    # Brief: Drop the cached PID and placement of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    # Returns:
+    #   None
+    def evict(self, pod_name: str):
+        with self._lock:
+            self._entries.pop(pod_name, None)
+            self._hosts.pop(pod_name, None)
+
+
+    # Brief: Evict the entry if it was resolved from a different container.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string container_id: Container ID currently reported for the pod.
+    # Returns:
+    #   None
+    def evictIfStale(self, pod_name: str, container_id: str):
+        with self._lock:
+            entry = self._entries.get(pod_name)
+            if entry is not None and entry["container_id"] != container_id:
+                del self._entries[pod_name]
+            host = self._hosts.get(pod_name)
+            if host is not None and host["container_id"] != container_id:
+                del self._hosts[pod_name]
+
+
+    # Brief: Drop every cached PID and placement.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hosts.clear()
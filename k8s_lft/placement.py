@@ -0,0 +1,146 @@
+from k8s_lft.kubeclient import K8sClientContext
+import re
+
+
+MEMORY_UNITS = {"": 1, "K": 10**3, "M": 10**6, "G": 10**9, "T": 10**12,
+                "Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40}
+
+
+# Brief: Parse a Kubernetes CPU quantity.
+# Params:
+#   string quantity: Quantity such as "500m" or "2".
+# Returns:
+#   int millicores
+def parseCpu(quantity):
+    quantity = str(quantity)
+    if quantity.endswith("m"):
+        return int(float(quantity[:-1]))
+    return int(float(quantity) * 1000)
+
+
+# Brief: Parse a Kubernetes memory quantity.
+# Params:
+#   string quantity: Quantity such as "512Mi" or "1G".
+# Returns:
+#   int bytes
+def parseMemory(quantity):
+    match = re.match(r"^([0-9.]+)([KMGT]i?)?$", str(quantity))
+    if not match:
+        raise ValueError(f"Unsupported memory quantity {quantity}")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2) or ""])
+
+
+# Brief: List the cluster nodes emulated pods can be placed on, with their allocatable resources.
+# Nodes marked unschedulable are skipped, and so are nodes with a NoSchedule
+# taint unless every node has one (single-node clusters often taint nothing,
+# multi-node ones taint the control plane).
+# Params:
+#   None
+# Returns:
+#   dict mapping node names to {"cpu": millicores, "memory": bytes}
+def schedulableHosts():
+    nodes = K8sClientContext().core_api.list_node().items
+    nodes = [n for n in nodes if not n.spec.unschedulable]
+    untainted = [n for n in nodes if not any(t.effect == "NoSchedule" for t in (n.spec.taints or []))]
+    return {
+        n.metadata.name: {"cpu": parseCpu(n.status.allocatable["cpu"]), "memory": parseMemory(n.status.allocatable["memory"])}
+        for n in (untainted or nodes)
+    }
+
+
+# Brief: Partition the link graph of a topology over cluster nodes.
+# Each host, largest first, grows a region from the most linked unassigned pod,
+# repeatedly taking the pod with the most links into the region, until the host
+# reaches its share of the declared CPU and memory. Single-pod moves that shrink
+# the cut are then applied until none is left, so most links stay local veths
+# and only a small cut becomes tunnels.
+# Params:
+#   dict demands: Mapping of pod names to {"cpu": millicores, "memory": bytes}.
+#   list links: List of (pod_name, peer_name) pairs.
+#   dict hosts: Mapping of cluster node names to {"cpu": millicores, "memory": bytes}.
+#   float imbalance: Allowed excess over each host's proportional share (default: 0.1).
+# Returns:
+#   dict mapping pod names to cluster node names
+def partitionTopology(demands, links, hosts, imbalance=0.1):
+    if not hosts or not demands:
+        return dict()
+
+    neighbours = {pod_name: dict() for pod_name in demands}
+    for a, b in links:
+        if a in neighbours and b in neighbours and a != b:
+            neighbours[a][b] = neighbours[a].get(b, 0) + 1
+            neighbours[b][a] = neighbours[b].get(a, 0) + 1
+
+    # every host gets a share of the demand proportional to its capacity
+    limits = dict()
+    for resource in ("cpu", "memory"):
+        total_demand = sum(d[resource] for d in demands.values())
+        total_capacity = sum(h[resource] for h in hosts.values()) or 1
+        for name, host in hosts.items():
+            share = total_demand * host[resource] / total_capacity * (1 + imbalance)
+            largest = max(d[resource] for d in demands.values())
+            limits.setdefault(name, dict())[resource] = max(share, largest)
+    load = {name: {"cpu": 0, "memory": 0} for name in hosts}
+
+    def fits(pod_name, host):
+        return all(load[host][r] + demands[pod_name][r] <= limits[host][r] for r in ("cpu", "memory"))
+
+    degree = {p: sum(neighbours[p].values()) for p in demands}
+    placement = dict()
+    remaining = set(demands)
+    by_capacity = sorted(hosts, key=lambda h: (-hosts[h]["cpu"], -hosts[h]["memory"], h))
+    for index, host in enumerate(by_capacity):
+        last = index == len(by_capacity) - 1
+        # links from each unassigned pod into the region grown on this host
+        gains = dict()
+        while remaining:
+            candidates = [p for p in gains if last or fits(p, host)]
+            if not candidates:
+                seeds = [p for p in remaining if last or fits(p, host)]
+                if not seeds:
+                    break
+                candidates = [max(seeds, key=lambda p: (degree[p], p))]
+            # prefer pods whose links mostly end inside the region
+            pod_name = max(candidates, key=lambda p: (2 * gains.get(p, 0) - degree[p], p))
+            placement[pod_name] = host
+            remaining.discard(pod_name)
+            gains.pop(pod_name, None)
+            for r in ("cpu", "memory"):
+                load[host][r] += demands[pod_name][r]
+            for peer, count in neighbours[pod_name].items():
+                if peer in remaining:
+                    gains[peer] = gains.get(peer, 0) + count
+
+    order = sorted(demands, key=lambda p: (-degree[p], p))
+    for _ in range(len(demands)):
+        moved = False
+        for pod_name in order:
+            current = placement[pod_name]
+            links_to = dict()
+            for peer, count in neighbours[pod_name].items():
+                links_to[placement[peer]] = links_to.get(placement[peer], 0) + count
+            for r in ("cpu", "memory"):
+                load[current][r] -= demands[pod_name][r]
+            best = current
+            for host in hosts:
+                gain = links_to.get(host, 0) - links_to.get(current, 0)
+                if gain > 0 and fits(pod_name, host) and gain > links_to.get(best, 0) - links_to.get(current, 0):
+                    best = host
+            for r in ("cpu", "memory"):
+                load[best][r] += demands[pod_name][r]
+            if best != current:
+                placement[pod_name] = best
+                moved = True
+        if not moved:
+            break
+    return placement
+
+
+# Brief: Count the links of a placement that cross cluster nodes.
+# Params:
+#   dict placement: Mapping of pod names to cluster node names.
+#   list links: List of (pod_name, peer_name) pairs.
+# Returns:
+#   int number of cross-host links
+def cutSize(placement, links):
+    return sum(1 for a, b in links if placement.get(a) != placement.get(b))
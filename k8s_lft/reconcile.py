@@ -0,0 +1,343 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from k8s_lft.kubeclient import K8sClientContext
+from k8s_lft.journal import OperationJournal, interfaceOf, INTERFACE_CREATING_OPS
+from k8s_lft.replay import buildReplayPlan, runReplayPlan, linkKey
+import ipaddress
+import os
+import re
+import time
+
+
+SECTION = "__LFT_SECTION__"
+
+
+# Brief: Build the command dumping the network state of a pod in one exec round trip.
+# Params:
+#   K8sNode node: Node to observe.
+# Returns:
+#   string shell command
+def _observeCommand(node):
+    sections = ["ip -o link show", "ip -o addr show", "ip route show"]
+    if hasattr(node, "_createBridge"):
+        bridge = node.nodeName[:-2]
+        sections.append(f"ovs-vsctl br-exists {bridge} && echo bridge && ovs-vsctl list-ports {bridge}")
+        sections.append(f"ovs-vsctl get-controller {bridge}")
+    else:
+        sections += ["true", "true"]
+    sections.append("pgrep -f [r]yu-manager >/dev/null && echo running")
+    return f"; echo {SECTION}; ".join(f"{{ {s}; }} 2>/dev/null" for s in sections)
+
+
+# Brief: Parse the output of _observeCommand.
+# Params:
+#   string output: Output of the command.
+# Returns:
+#   dict with the interfaces, addresses, routes, bridge ports, controller and Ryu state of the pod;
+#   "links" maps each interface to (ifindex, ifindex of its veth peer or None)
+def parseObservedState(output):
+    parts = (output.split(SECTION) + [""] * 6)[:6]
+    links, addresses, routes, ovs, controller, ryu = parts
+
+    state = {"links": dict(), "addresses": dict(), "routes": set(), "bridge": False, "ports": set(),
+             "controller": controller.strip() or None, "ryu": "running" in ryu}
+    for line in links.splitlines():
+        match = re.match(r"^(\d+):\s+([^:@\s]+)(?:@(\S+))?:", line)
+        if match:
+            peer = re.fullmatch(r"if(\d+)", match.group(3) or "")
+            state["links"][match.group(2)] = (int(match.group(1)), int(peer.group(1)) if peer else None)
+    for line in addresses.splitlines():
+        match = re.match(r"^\d+:\s+(\S+)\s+inet6?\s+(\S+)", line)
+        if match:
+            state["addresses"].setdefault(match.group(1), set()).add(match.group(2))
+    for line in routes.splitlines():
+        match = re.match(r"^(\S+)(?:\s+via\s+(\S+))?\s+dev\s+(\S+)", line)
+        if match:
+            state["routes"].add(match.groups())
+    ovs_lines = [line.strip() for line in ovs.splitlines() if line.strip()]
+    if ovs_lines and ovs_lines[0] == "bridge":
+        state["bridge"] = True
+        state["ports"] = set(ovs_lines[1:])
+    return state
+
+
+# Brief: Normalise a route destination, a bare address being a host route.
+# Params:
+#   string destination: Destination as written by iproute2 or the journal.
+# Returns:
+#   ip_network, or None for "default" and anything that is not an address
+def _network(destination):
+    try:
+        return ipaddress.ip_network(destination, strict=False)
+    except ValueError:
+        return None
+
+
+# Brief: Build the command taking the effect of an operation out of a pod.
+# Params:
+#   K8sNode node: Node the operation was applied to.
+#   dict operation: Journal operation.
+# Returns:
+#   string shell command, None if the operation has nothing to undo
+def _undoCommand(node, operation):
+    bridge = node.nodeName[:-2] if hasattr(node, "_createBridge") else None
+    match operation["op"]:
+        case "connect" | "connectToInternet":
+            iface = interfaceOf(operation)
+            command = f"ip link del {iface}"
+            if bridge is not None:
+                command = f"ovs-vsctl --if-exists del-port {bridge} {iface}; {command}"
+            return command
+        case "setIp":
+            return f"ip addr del {operation['ip']}/{operation['mask']} dev {operation['interface']}"
+        case "setDefaultGateway":
+            return f"ip route del default via {operation['gateway_ip']} dev {operation['iface_peer']}"
+        case "addRoute":
+            return f"ip route del {operation['ip']}/{operation['mask']} dev {operation['interface']}"
+        case "setController":
+            return f"ovs-vsctl del-controller {bridge}" if bridge is not None else None
+        case "initController":
+            return "pkill -f [r]yu-manager"
+    return None
+
+
+# Brief: Check whether the effect of an operation is already present in the observed state.
+# Params:
+#   string pod_name: Pod the operation belongs to.
+#   dict operation: Journal operation.
+#   dict observed: Observed state of every pod, by pod name.
+# Returns:
+#   True if the operation does not need to be applied
+def isSatisfied(pod_name, operation, observed):
+    state = observed.get(pod_name)
+    if state is None:
+        return False
+
+    match operation["op"]:
+        case "connect":
+            peer_state = observed.get(operation["peer"])
+            if peer_state is None:
+                return False
+            ends = [(state, operation["interface_name"]), (peer_state, operation["peer_interface_name"])]
+            # on a switch the end must also be a port of its bridge
+            if not all(iface in s["links"] and (not s["bridge"] or iface in s["ports"]) for s, iface in ends):
+                return False
+            (index, peer_of), (peer_index, peer_peer_of) = (s["links"][iface] for s, iface in ends)
+            if peer_of is None and peer_peer_of is None:
+                # tunnel ends have no veth peer to compare
+                return True
+            # both ends of a veth must point at each other
+            return peer_of == peer_index and peer_peer_of == index
+        case "setIp":
+            return f"{operation['ip']}/{operation['mask']}" in state["addresses"].get(operation["interface"], ())
+        case "setDefaultGateway":
+            return ("default", operation["gateway_ip"], operation["iface_peer"]) in state["routes"]
+        case "addRoute":
+            # iproute2 prints host routes without a prefix length and destinations as their network
+            expected = _network(f"{operation['ip']}/{operation['mask']}")
+            return any(_network(dst) == expected and dev == operation["interface"] for dst, _, dev in state["routes"])
+        case "setController":
+            expected = f"{operation['protocol']}:{operation['controller_ip']}:{operation['controller_port']}"
+            return state["controller"] == expected
+        case "initController":
+            return state["ryu"]
+        case "connectToInternet":
+            return operation["node_iface"] in state["links"] and os.path.exists(f"/sys/class/net/{operation['host_iface']}")
+    return False
+
+
+# Brief: Declarative reconciler for the Kubernetes backend.
+# Takes the desired state as journal-formatted operations per pod, dumps the
+# actual network state of every pod with one exec round trip each, and applies
+# only the operations whose effect is missing, as a dependency graph on a worker
+# pool; journaled operations that left the desired state are undone. Links that are already in place are never deleted and recreated, so
+# reconciling an unchanged topology costs one observation per pod.
+class K8sReconciler:
+
+    def __init__(self, max_workers: int = 16):
+        self.max_workers = max_workers
+
+
+    # Brief: Bring the cluster to a desired state, applying only the deltas.
+    # Params:
+    #   dict desired: Mapping of pod names to their desired operations, in journal format.
+    #   dict nodes: Mapping of pod names to node objects.
+    #   bool record: Replace the journal of each pod with its desired operations,
+    #                so later recoveries replay the reconciled state (default: True).
+    # Returns:
+    #   dict summary with the number of observed pods, applied and removed operations and failures
+    def reconcile(self, desired, nodes, record: bool = True):
+        start = time.time()
+        missing = self.__createMissing(nodes)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pod_name: pool.submit(self.__observe, node) for pod_name, node in nodes.items()
+                       if pod_name not in missing}
+            observed = dict()
+            for pod_name, future in futures.items():
+                if future.exception() is not None:
+                    print(f"[Reconciler] Não foi possível observar {pod_name}: {future.exception()}")
+                    continue
+                observed[pod_name] = future.result()
+
+        # a missing link is recreated from scratch, which also drops whatever was
+        # configured on both of its ends, so those operations are pending too
+        recreated = set()
+        seen_links = set()
+        for pod_name, operations in desired.items():
+            for operation in operations:
+                if operation["op"] != "connect" or isSatisfied(pod_name, operation, observed):
+                    continue
+                recreated.add((pod_name, operation["interface_name"]))
+                recreated.add((operation["peer"], operation["peer_interface_name"]))
+
+        pending = dict()
+        for pod_name, operations in desired.items():
+            for operation in operations:
+                if operation["op"] == "connect":
+                    # a link is recorded by both endpoints but applied once
+                    key = linkKey(pod_name, operation)
+                    if key in seen_links:
+                        continue
+                    seen_links.add(key)
+                if (pod_name, interfaceOf(operation)) in recreated or not isSatisfied(pod_name, operation, observed):
+                    pending.setdefault(pod_name, []).append(operation)
+
+        removed = self.__removeStale(desired, nodes, observed)
+
+        bridges = {p for p, node in nodes.items()
+                   if hasattr(node, "_createBridge") and not observed.get(p, {}).get("bridge")}
+        failures = []
+        pods = [p for p in nodes if p in pending or p in bridges]
+        if pods:
+            peers = {op["peer"] for ops in pending.values() for op in ops if op["op"] == "connect"}
+            steps = buildReplayPlan(pending, pods, ready_only=peers & set(nodes))
+            print(f"[Reconciler] Aplicando {len(steps)} passo(s) em {pods}")
+            with ExitStack() as switches:
+                # each switch commits its missing ports and settings as one transaction
+                for node in nodes.values():
+                    if hasattr(node, "batch"):
+                        switches.enter_context(node.batch())
+                failures = runReplayPlan(steps, lambda step: self.__runStep(step, nodes, bridges), self.max_workers)
+            for step, error in failures:
+                print(f"[Reconciler] Falha em {step}: {error}")
+
+        if record:
+            self.__record(desired, nodes)
+
+        applied = sum(len(ops) for ops in pending.values())
+        print(f"[Reconciler] {len(observed)} pod(s) observado(s), {applied} operação(ões) aplicada(s), "
+              f"{removed} removida(s) em {time.time() - start:.2f}s")
+        return {
+            "observed": len(observed),
+            "created": sorted(missing),
+            "pending": applied,
+            "removed": removed,
+            "failures": failures,
+            "seconds": time.time() - start
+        }
+
+
+    # Brief: Create the StatefulSets of desired nodes that do not exist, with one list per namespace.
+    # Params:
+    #   dict nodes: Mapping of pod names to node objects.
+    # Returns:
+    #   Set of pod names whose StatefulSet was created
+    def __createMissing(self, nodes):
+        apps_api = K8sClientContext().apps_api
+        existing = set()
+        for namespace in {node.namespace for node in nodes.values()}:
+            for statefulset in apps_api.list_namespaced_stateful_set(namespace=namespace).items:
+                existing.add((namespace, statefulset.metadata.name))
+
+        missing = set()
+        for pod_name, node in nodes.items():
+            # the pod of a StatefulSet is its name followed by "-0"
+            if (node.namespace, pod_name[:-2]) not in existing:
+                node._createStatefulSet()
+                missing.add(pod_name)
+        return missing
+
+
+    # Brief: Take out of each pod the journaled operations that are no longer desired.
+    # An interface that the desired state still creates is kept, the desired
+    # operation reuses or recreates it. Each pod is cleaned with one exec.
+    # Params:
+    #   dict desired: Mapping of pod names to their desired operations.
+    #   dict nodes: Mapping of pod names to node objects.
+    #   dict observed: Observed state of every pod, by pod name.
+    # Returns:
+    #   Number of removed operations
+    def __removeStale(self, desired, nodes, observed):
+        commands = dict()
+        for pod_name, operations in desired.items():
+            node = nodes.get(pod_name)
+            if node is None or pod_name not in observed:
+                continue
+            journal = OperationJournal(namespace=node.namespace, api=K8sClientContext().core_api)
+            kept = {interfaceOf(op) for op in operations if op["op"] in INTERFACE_CREATING_OPS}
+            for operation in journal.operations(pod_name) or []:
+                if operation in operations or (operation["op"] in INTERFACE_CREATING_OPS and interfaceOf(operation) in kept):
+                    continue
+                command = _undoCommand(node, operation)
+                if command is not None:
+                    commands.setdefault(pod_name, []).append(command)
+        if not commands:
+            return 0
+
+        print(f"[Reconciler] Removendo {sum(len(c) for c in commands.values())} operação(ões) fora do estado desejado")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pod_name: pool.submit(nodes[pod_name].runWithExitCode,
+                                             "; ".join(f"{{ {c}; }} 2>/dev/null" for c in cmds) + "; true")
+                       for pod_name, cmds in commands.items()}
+        removed = 0
+        for pod_name, future in futures.items():
+            if future.exception() is not None:
+                print(f"[Reconciler] Falha ao limpar {pod_name}: {future.exception()}")
+                continue
+            removed += len(commands[pod_name])
+        return removed
+
+
+    # Brief: Dump the network state of one pod.
+    # Params:
+    #   K8sNode node: Node to observe.
+    # Returns:
+    #   dict observed state
+    def __observe(self, node):
+        output, _ = node.runWithExitCode(_observeCommand(node))
+        return parseObservedState(output)
+
+
+    # Brief: Run one reconciliation step.
+    # Params:
+    #   ReplayStep step: Step to run.
+    #   dict nodes: Mapping of pod names to node objects.
+    #   set bridges: Switches whose bridge is missing.
+    # Returns:
+    #   None
+    def __runStep(self, step, nodes, bridges):
+        node = nodes[step.pod_name]
+        if step.operation is not None:
+            node.watcher.executeOperation(node, step.pod_name, step.operation)
+            return
+        node._waitUntilReady()
+        if step.pod_name in bridges:
+            node._createBridge()
+
+
+    # Brief: Replace the journal of every reconciled pod with its desired operations.
+    # Params:
+    #   dict desired: Mapping of pod names to their desired operations.
+    #   dict nodes: Mapping of pod names to node objects.
+    # Returns:
+    #   None
+    def __record(self, desired, nodes):
+        for pod_name, operations in desired.items():
+            node = nodes.get(pod_name)
+            if node is None:
+                continue
+            journal = OperationJournal(namespace=node.namespace, api=K8sClientContext().core_api)
+            journal.reset(pod_name, node.__class__.__name__)
+            for operation in operations:
+                journal.append(pod_name, node.__class__.__name__, operation)
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from k8s_lft.journal import interfaceOf
+
+
+# Brief: One step of a journal replay.
+# A step is either the preparation of a pod ("prepare": wait until it is Running
+# and recreate its bridge if it is a switch) or one journal operation. A link is
+# recorded in the journals of both endpoints but is a single step here.
+class ReplayStep:
+
+    def __init__(self, index, pod_name, operation=None, pods=None):
+        self.index = index
+        self.pod_name = pod_name
+        self.operation = operation
+        self.pods = pods or (pod_name,)
+        self.deps = set()
+        self.dependents = set()
+
+    def __repr__(self):
+        what = self.operation["op"] if self.operation else "prepare"
+        return f"ReplayStep({self.index}, {self.pod_name}, {what})"
+
+
+# Brief: Key identifying a link independently of the endpoint that recorded it.
+# Params:
+#   string pod_name: Pod whose journal holds the operation.
+#   dict operation: "connect" operation.
+# Returns:
+#   frozenset key of the link
+def linkKey(pod_name, operation):
+    return frozenset({(pod_name, operation["interface_name"]), (operation["peer"], operation["peer_interface_name"])})
+
+
+# Brief: Select the operations whose effect was lost when some pods were recreated.
+# A recreated pod lost everything. A surviving peer only lost the end of each
+# veth pair it shared with a recreated pod, together with whatever was
+# configured on that interface (addresses, gateways); the rest of its state is
+# intact and is not replayed.
+# Params:
+#   dict journal: Mapping of pod names to their list of operations.
+#   iterable recreated: Pods whose sandbox was recreated.
+# Returns:
+#   dict mapping pod names to the operations to replay, in journal order
+def lostOperations(journal, recreated):
+    recreated = set(recreated)
+    lost = {pod_name: list(journal.get(pod_name, [])) for pod_name in recreated}
+
+    lost_interfaces = dict()
+    for pod_name, operations in journal.items():
+        for operation in operations:
+            if operation["op"] != "connect":
+                continue
+            if pod_name in recreated and operation["peer"] not in recreated:
+                lost_interfaces.setdefault(operation["peer"], set()).add(operation["peer_interface_name"])
+            elif operation["peer"] in recreated and pod_name not in recreated:
+                lost_interfaces.setdefault(pod_name, set()).add(operation["interface_name"])
+
+    for pod_name, interfaces in lost_interfaces.items():
+        lost[pod_name] = [
+            operation for operation in journal.get(pod_name, [])
+            if interfaceOf(operation) in interfaces
+            and (operation["op"] != "connect" or operation["peer"] in recreated)
+        ]
+    return lost
+
+
+# Brief: Turn the journal of a set of pods into a dependency graph of replay steps.
+# Every step of a pod depends on the pod's preparation step. A link depends on
+# the preparation of both endpoints and on the last non-link operation recorded
+# before it on each side. Any other operation depends on everything recorded
+# before it on its pod since the previous non-link operation, so an address is
+# only set once the link carrying its interface exists. Links of one pod do not
+# depend on each other, so independent links are replayed concurrently.
+# Params:
+#   dict journal: Mapping of pod names to their list of operations.
+#   iterable pod_names: Pods to replay.
+#   iterable ready_only: Extra pods that are only waited for (peers of replayed links).
+# Returns:
+#   List of ReplayStep, in journal order
+def buildReplayPlan(journal, pod_names, ready_only=()):
+    steps = []
+    prepare = dict()
+    links = dict()
+
+    def newStep(pod_name, operation=None, pods=None):
+        step = ReplayStep(len(steps), pod_name, operation, pods)
+        steps.append(step)
+        return step
+
+    def depend(step, dep):
+        if dep is not None and dep is not step:
+            step.deps.add(dep.index)
+            dep.dependents.add(step.index)
+
+    for pod_name in list(pod_names) + [p for p in ready_only if p not in pod_names]:
+        prepare[pod_name] = newStep(pod_name)
+
+    for pod_name in pod_names:
+        barrier = prepare[pod_name]
+        since_barrier = []
+        for operation in journal.get(pod_name, []):
+            if operation["op"] == "connect":
+                key = linkKey(pod_name, operation)
+                step = links.get(key)
+                if step is None:
+                    step = newStep(pod_name, operation, pods=(pod_name, operation["peer"]))
+                    links[key] = step
+                    depend(step, prepare.get(operation["peer"]))
+                depend(step, barrier)
+                since_barrier.append(step)
+            else:
+                step = newStep(pod_name, operation)
+                depend(step, barrier)
+                for dep in since_barrier:
+                    depend(step, dep)
+                barrier = step
+                since_barrier = []
+    return steps
+
+
+# Brief: Run a replay plan on a worker pool, starting each step as soon as its dependencies are done.
+# A failed step is reported and its dependents still run, like the serial replay
+# did. Should inconsistent journals ever produce a cycle, the oldest pending step
+# is forced so the replay always finishes.
+# Params:
+#   list steps: Steps returned by buildReplayPlan.
+#   function runStep: Callable executing one step.
+#   int max_workers: Maximum number of concurrent steps.
+# Returns:
+#   List of (step, exception) for the steps that failed
+def runReplayPlan(steps, runStep, max_workers=16):
+    remaining = {step.index: set(step.deps) for step in steps}
+    running = dict()
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while remaining or running:
+            ready = [index for index, deps in remaining.items() if not deps]
+            if not ready and not running:
+                ready = [min(remaining)]
+            for index in ready:
+                del remaining[index]
+                running[pool.submit(runStep, steps[index])] = steps[index]
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                if future.exception() is not None:
+                    failures.append((step, future.exception()))
+                for dependent in step.dependents:
+                    if dependent in remaining:
+                        remaining[dependent].discard(step.index)
+    return failures
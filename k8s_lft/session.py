@@ -0,0 +1,156 @@
+from kubernetes.stream import stream
+import threading
+import time
+import uuid
+import re
+
+
+# Raised when the exec stream drops after a command was sent: the command may
+# have run (fully or partially), so it must not be sent again.
+class ExecSessionInterrupted(ConnectionError):
+    pass
+
+
+# Long-lived shell inside a pod, reused for many commands.
+# Each command is written to the shell's stdin followed by an end marker that
+# carries its exit code, so a single websocket exec stream serves every command
+# instead of paying a TLS and websocket handshake per call.
+class ExecSession:
+
+    def __init__(self, api, pod_name, namespace="default"):
+        self.api = api
+        self.pod_name = pod_name
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.ws = stream(api.connect_get_namespaced_pod_exec,
+                         pod_name, namespace,
+                         command=["/bin/sh", "-c", "command -v bash >/dev/null && exec bash || exec sh"],
+                         stderr=True, stdin=True,
+                         stdout=True, tty=False,
+                         _preload_content=False)
+
+
+    # Brief: Check whether the underlying exec stream is still usable.
+    # Params:
+    #   None
+    # Returns:
+    #   True if the session can take commands
+    def isOpen(self):
+        return self.ws is not None and self.ws.is_open()
+
+
+    # Brief: Run a command in the session's shell.
+    # Params:
+    #   string command: Command to run.
+    #   float timeout: Maximum time to wait for the command, in seconds (default: None, no limit).
+    # Returns:
+    #   Tuple (output, exit code); stdout and stderr are merged like in K8sNode.run
+    def run(self, command: str, timeout: float = None):
+        marker = f"__LFT_{uuid.uuid4().hex}__"
+        end = re.compile(re.escape(marker) + r" (\d+)\n")
+        # the subshell keeps cd, export, set -e, traps and exit from leaking into
+        # the following commands, and stdin is detached so they cannot be swallowed
+        script = f"( {command}\n) 2>&1 </dev/null; echo \"{marker} $?\"\n"
+
+        with self.lock:
+            if not self.isOpen():
+                raise ConnectionError(f"Exec session to {self.pod_name} is closed")
+            try:
+                self.ws.write_stdin(script)
+            except Exception as e:
+                self.close()
+                raise ConnectionError(f"Could not write to the exec session of {self.pod_name}: {e}")
+
+            output = ""
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                self.ws.update(timeout=1)
+                if self.ws.peek_stdout():
+                    output += self.ws.read_stdout()
+                if self.ws.peek_stderr():
+                    output += self.ws.read_stderr()
+
+                match = end.search(output)
+                if match:
+                    return output[:match.start()], int(match.group(1))
+                if not self.ws.is_open():
+                    self.close()
+                    raise ExecSessionInterrupted(f"Exec session to {self.pod_name} closed while running '{command}'")
+                if deadline is not None and time.time() > deadline:
+                    # the shell is in an unknown state, do not reuse it
+                    self.close()
+                    raise TimeoutError(f"Command '{command}' did not finish in {self.pod_name} within {timeout} seconds.")
+
+
+    # Brief: Close the exec stream.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+
+# Process-wide pool of exec sessions, one per pod.
+# K8sWatcher evicts the session of a pod as soon as it sees the pod recreated.
+class ExecSessionPool:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance._sessions = dict()
+                cls._instance._lock = threading.Lock()
+        return cls._instance
+
+
+    # Brief: Return the pod's session if it is still open, otherwise open a new one and keep it in the pool.
+    # Params:
+    #   CoreV1Api api: Kubernetes core API client.
+    #   string pod_name: Name of the pod.
+    #   string namespace: Namespace of the pod.
+    # Returns:
+    #   ExecSession
+    def get(self, api, pod_name, namespace="default"):
+        key = (namespace, pod_name)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.isOpen():
+                return session
+        session = ExecSession(api, pod_name, namespace)
+        with self._lock:
+            self._sessions[key] = session
+        return session
+
+
+    # Brief: Close and drop the session of a pod.
+    # Params:
+    #   string pod_name: Name of the pod.
+    #   string namespace: Namespace of the pod.
+    # Returns:
+    #   None
+    def evict(self, pod_name, namespace="default"):
+        with self._lock:
+            session = self._sessions.pop((namespace, pod_name), None)
+        if session is not None:
+            session.close()
+
+
+    # Brief: Close every session.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def closeAll(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
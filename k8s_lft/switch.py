@@ -1,6 +1,12 @@
+from contextlib import contextmanager
 from k8s_lft.node import K8sNode
-import subprocess
-
+from k8s_lft.ovs import OvsTransaction
+from k8s_lft.pidcache import containerPid
+from profissa_lft.netlink import LinkEngine
+from profissa_lft.ovsdb import OvsdbClient
+from profissa_lft.exceptions import OvsdbOperationFailed
+import threading
+import os
 
 
 # Brief: Kubernetes Open vSwitch switch node.
@@ -8,19 +14,83 @@ import subprocess
 # This class encapsulates the functionality to create and manage an Open vSwitch
 # instance within a Kubernetes pod, allowing it to act as a virtual switch in a
 # software-defined network (SDN) environment.
+# Open vSwitch changes are applied as OvsTransaction commits; inside batch()
+# they are collected and committed together when the outermost block ends.
+# Commits, reads and port monitors go straight to the switch's OVSDB socket
+# when the pod runs on this host, and through ovs-vsctl over exec otherwise.
 class K8sSwitch(K8sNode):
 
-    def __init__(self, name):
-        super().__init__(name, image="gns3/openvswitch")
+    def __init__(self, name, namespace="default"):
+        super().__init__(name, image="gns3/openvswitch", namespace=namespace)
+        self.ovs_lock = threading.Lock()
+        self.ovs_pending = None
+        self.ovs_depth = 0
+        self.ovsdb = None
+        self.ovsdb_container = None
+
+
+    # Brief: Collect the Open vSwitch changes made inside the block and commit them as one transaction.
+    # Blocks may be nested and entered from several threads; the transaction is
+    # committed when the outermost one ends.
+    # Params:
+    #   None
+    # Returns:
+    #   None, raises RuntimeError at the end of the block if the transaction failed
+    @contextmanager
+    def batch(self):
+        with self.ovs_lock:
+            if self.ovs_depth == 0:
+                self.ovs_pending = OvsTransaction()
+            self.ovs_depth += 1
+        try:
+            yield self
+        finally:
+            with self.ovs_lock:
+                self.ovs_depth -= 1
+                transaction = self.ovs_pending if self.ovs_depth == 0 else None
+                if transaction is not None:
+                    self.ovs_pending = None
+        if transaction is not None:
+            self._commit(transaction)
 
 
-    # Brief: Instantiate the switch pod and set up Open vSwitch bridge.
+    # Brief: Apply an Open vSwitch transaction now, or add it to the open batch.
     # Params:
-    #   kwargs: Additional keyword arguments for pod instantiation.
+    #   OvsTransaction transaction: Changes to apply.
     # Returns:
     #   None
-    def instantiate(self, **kwargs):
-        super().instantiate(**kwargs)
+    def _commit(self, transaction):
+        with self.ovs_lock:
+            if self.ovs_pending is not None:
+                self.ovs_pending.extend(transaction)
+                return
+        if not len(transaction):
+            return
+        ovsdb = self._ovsdb()
+        if ovsdb is not None:
+            try:
+                ovsdb.execute(transaction.commands)
+            except OvsdbOperationFailed as e:
+                raise RuntimeError(f"Open vSwitch transaction failed on {self.nodeName}: {e}") from e
+            if LinkEngine.available():
+                pid = self._getPodpid()
+                with LinkEngine().batch() as engine:
+                    for device in transaction.devices:
+                        engine.setUp(device, pid)
+            elif transaction.devices:
+                self.run(transaction.upCommand())
+            return
+        output, code = self.runWithExitCode(transaction.command())
+        if code not in (0, None):
+            raise RuntimeError(f"Open vSwitch transaction failed on {self.nodeName} (exit code {code}): {output.strip()}")
+
+
+    # Brief: Set up the Open vSwitch bridge once the switch pod is ready.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def _postInstantiate(self):
         self._createBridge()
 
     # Brief: Create an Open vSwitch bridge inside the switch pod.
@@ -29,12 +99,9 @@ class K8sSwitch(K8sNode):
     # Returns:
     #   None
     def _createBridge(self):
-        # check if bridge already exists
-        try:
-            subprocess.run(f"sudo microk8s kubectl exec {self.nodeName} -- ovs-vsctl br-exists {self.nodeName[:-2]}", check=True, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except:
-            subprocess.run(f"sudo microk8s kubectl exec {self.nodeName} -- ovs-vsctl add-br {self.nodeName[:-2]}", check=True, shell=True)
-            subprocess.run(f"sudo microk8s kubectl exec {self.nodeName} -- ip link set {self.nodeName[:-2]} up", check=True, shell=True)
+        # --may-exist makes this a no-op for an existing bridge, and inside a
+        # batch the bridge is created before any port of the same transaction
+        self._commit(OvsTransaction().addBridge(self.nodeName[:-2]))
 
 
     # Brief: Connect an interface to the Open vSwitch bridge.
@@ -53,12 +120,12 @@ class K8sSwitch(K8sNode):
                 "controller_port": controller_port,
                 "protocol": protocol
             })
-        # Remove controladores antigos, se houver
-        self.run(f"ovs-vsctl del-controller {self.nodeName[:-2]} || true")
-        # Adiciona o controlador remoto
-        self.run(f"ovs-vsctl set-controller {self.nodeName[:-2]} {protocol}:{controller_ip}:{controller_port}")
+        transaction = OvsTransaction()
+        # Substitui os controladores antigos pelo controlador remoto
+        transaction.setController(self.nodeName[:-2], f"{protocol}:{controller_ip}:{controller_port}")
         # Confirma o modo do switch (geralmente "secure" evita conectar a outros controladores)
-        self.run(f"ovs-vsctl set-fail-mode {self.nodeName[:-2]} secure")
+        transaction.setFailMode(self.nodeName[:-2], "secure")
+        self._commit(transaction)
 
 
     # Brief: Connect an interface to the Open vSwitch bridge.
@@ -67,8 +134,7 @@ class K8sSwitch(K8sNode):
     # Returns:
     #   None
     def _connectInterface(self, iface: str):
-        self.run(f"ovs-vsctl add-port {self.nodeName[:-2]} {iface}")
-        self.run(f"ip link set {iface} up")
+        self._commit(OvsTransaction().addPort(self.nodeName[:-2], iface))
 
 
     # Brief: Create and connect a veth pair between this switch and another node.
@@ -79,7 +145,63 @@ class K8sSwitch(K8sNode):
     #  None
     def _createPort(self, nodeName, peerInterfaceName) -> None:
         try:
-            self.run(f"ovs-vsctl add-port {nodeName[:-2]} {peerInterfaceName}")
+            self._commit(OvsTransaction().addPort(nodeName[:-2], peerInterfaceName))
             print(f"[INFO] Porta {peerInterfaceName} adicionada ao switch {nodeName[:-2]}")
         except Exception as ex:
             raise Exception(f"Error while creating port {peerInterfaceName} in switch {nodeName[:-2]}: {str(ex)}")
+
+
+    # Brief: List the ports of the switch bridge.
+    # Params:
+    #   None
+    # Returns:
+    #   Sorted list of port names, the bridge's own internal port included
+    def listPorts(self):
+        ovsdb = self._ovsdb()
+        if ovsdb is not None:
+            return ovsdb.listPorts(self.nodeName[:-2])
+        output = self.run(f"ovs-vsctl list-ports {self.nodeName[:-2]}")
+        return sorted(output.split() + [self.nodeName[:-2]])
+
+
+    # Brief: Stream the port and interface changes of the switch.
+    # Params:
+    #   function callback: Called as callback(table, uuid, old, new) for every changed
+    #                      Port or Interface row, starting with the current rows.
+    # Returns:
+    #   OvsdbMonitor, call its stop method to end the subscription; raises RuntimeError
+    #   if the switch's OVSDB socket is not reachable from this host
+    def watchPorts(self, callback):
+        ovsdb = self._ovsdb()
+        if ovsdb is None:
+            raise RuntimeError(f"The OVSDB socket of {self.nodeName} is not reachable from this host")
+        return ovsdb.monitor(callback)
+
+
+    # Brief: Get an OVSDB client for the switch's db.sock.
+    # The socket is reached through /proc/<pid>/root of a process of the switch
+    # container, so the pod must run on this host and the process needs root.
+    # Params:
+    #   None
+    # Returns:
+    #   OvsdbClient, or None if the socket is not reachable (ovs-vsctl is used instead)
+    def _ovsdb(self):
+        try:
+            if not OvsdbClient.enabled() or not self._isLocal():
+                return None
+            container_id = self._getPodHost()["container_id"]
+        except Exception:
+            return None
+        with self.ovs_lock:
+            if self.ovsdb is not None and self.ovsdb_container == container_id and os.path.exists(self.ovsdb.path):
+                return self.ovsdb
+        # a recreated pod has a new container, hence a new socket path
+        pid = containerPid(container_id)
+        if pid is None or not OvsdbClient.available(OvsdbClient.socketPath(pid)):
+            return None
+        with self.ovs_lock:
+            if self.ovsdb is not None:
+                self.ovsdb.close()
+            self.ovsdb = OvsdbClient(OvsdbClient.socketPath(pid))
+            self.ovsdb_container = container_id
+            return self.ovsdb
@@ -0,0 +1,146 @@
+from kubernetes import client, watch
+from k8s_lft.kubeclient import K8sClientContext
+from k8s_lft.agent import vethTempName, tunnelTempName
+from k8s_lft.tunnel import tunnelId
+from profissa_lft.netlink import LinkEngine
+import subprocess
+import shlex
+import time
+
+
+# Brief: Comment that tags the iptables rules added for a topology.
+# Params:
+#   string topology: Name of the K8sTopology (None for nodes deployed on their own).
+# Returns:
+#   string comment, "lft:<topology>"
+def iptablesTag(topology):
+    return f"lft:{topology or 'lft'}"
+
+
+# Brief: Host-side names an agent may have left behind for a journaled link.
+# Requests that failed halfway can leave their temporary veth or tunnel device
+# in the host namespace; the names only depend on the link and its containers.
+# Params:
+#   string pod_name: Pod holding the journal entry.
+#   dict operation: "connect" operation of the pod.
+#   string container_id: Container of the pod, None if unknown.
+# Returns:
+#   Set of link names
+def agentLinkNames(pod_name, operation, container_id=None):
+    names = {tunnelTempName(tunnelId(pod_name, operation["interface_name"], operation["peer"], operation["peer_interface_name"]))}
+    if container_id is not None:
+        names.add(vethTempName(container_id, operation["interface_name"]))
+        names.add(vethTempName(container_id, operation["interface_name"], peer=True))
+    return names
+
+
+# Brief: Delete the StatefulSets, services and pods of a label selector with one delete-collection call each.
+# StatefulSets use foreground propagation, so the API server removes their pods
+# before them; the pods are also deleted right away with no grace period so the
+# StatefulSet controller cannot recreate them in between.
+# Params:
+#   string namespace: Namespace of the objects.
+#   string label_selector: Label selector of the topology (e.g. "app=k8s-node").
+# Returns:
+#   None
+def deleteCollections(namespace, label_selector):
+    context = K8sClientContext()
+    context.apps_api.delete_collection_namespaced_stateful_set(
+        namespace=namespace, label_selector=label_selector, propagation_policy="Foreground")
+    try:
+        context.core_api.delete_collection_namespaced_service(namespace=namespace, label_selector=label_selector)
+    except client.exceptions.ApiException as e:
+        # clusters older than 1.23 have no delete-collection for services
+        if e.status not in (404, 405):
+            raise
+        for service in context.core_api.list_namespaced_service(namespace=namespace, label_selector=label_selector).items:
+            context.core_api.delete_namespaced_service(name=service.metadata.name, namespace=namespace)
+    context.core_api.delete_collection_namespaced_pod(
+        namespace=namespace, label_selector=label_selector, grace_period_seconds=0)
+
+
+# Brief: Wait until no pod of a label selector is left, with one list and a single watch.
+# Params:
+#   string namespace: Namespace of the pods.
+#   string label_selector: Label selector of the topology.
+#   int timeout: Maximum time to wait, in seconds.
+# Returns:
+#   None, raises TimeoutError if pods are still there after timeout
+def waitForDeletion(namespace, label_selector, timeout):
+    core_api = K8sClientContext().core_api
+    deadline = time.time() + timeout
+    pods = core_api.list_namespaced_pod(namespace=namespace, label_selector=label_selector)
+    remaining = {pod.metadata.name for pod in pods.items}
+    resource_version = pods.metadata.resource_version
+    w = watch.Watch()
+    while remaining and time.time() < deadline:
+        try:
+            for event in w.stream(core_api.list_namespaced_pod, namespace=namespace, label_selector=label_selector,
+                                  resource_version=resource_version, timeout_seconds=max(1, int(deadline - time.time()))):
+                pod = event["object"]
+                if event["type"] == "ERROR":
+                    raise client.exceptions.ApiException(status=getattr(pod, "code", None) or 410)
+                resource_version = pod.metadata.resource_version
+                if event["type"] == "DELETED":
+                    remaining.discard(pod.metadata.name)
+                else:
+                    remaining.add(pod.metadata.name)
+                if not remaining:
+                    w.stop()
+                    break
+        except client.exceptions.ApiException as e:
+            if e.status != 410:
+                raise
+            # the resourceVersion expired, take a fresh list and watch again
+            pods = core_api.list_namespaced_pod(namespace=namespace, label_selector=label_selector)
+            remaining = {pod.metadata.name for pod in pods.items}
+            resource_version = pods.metadata.resource_version
+    if remaining:
+        raise TimeoutError(f"Pods {sorted(remaining)} were not deleted within {timeout} seconds.")
+
+
+# Brief: Remove the host-side leftovers of a topology on this host in batch.
+# Host interfaces of connectToInternet and temporary agent links are deleted
+# with one netlink batch (or one shell), and the iptables rules tagged with the
+# topology are deleted with a single iptables-restore per table.
+# Params:
+#   set host_ifaces: Host interfaces created by connectToInternet.
+#   set agent_links: Temporary agent link names of the topology (see agentLinkNames).
+#   string topology: Name of the topology whose tagged iptables rules are removed.
+# Returns:
+#   dict with the number of deleted "links" and iptables "rules"
+def cleanupHost(host_ifaces, agent_links=(), topology=None):
+    output = subprocess.run(["ip", "-o", "link", "show"], capture_output=True, text=True).stdout
+    present = {line.split(":")[1].strip().split("@")[0] for line in output.splitlines() if ":" in line}
+    links = sorted(present & (set(host_ifaces) | set(agent_links)))
+    if links:
+        if LinkEngine.available():
+            with LinkEngine().batch() as engine:
+                for name in links:
+                    engine.deleteLink(name)
+        else:
+            subprocess.run(" ; ".join(f"ip link del {shlex.quote(name)}" for name in links),
+                           shell=True, stderr=subprocess.DEVNULL)
+
+    tag = iptablesTag(topology)
+    rules = 0
+    for table in ("filter", "nat"):
+        saved = subprocess.run(["iptables-save", "-t", table], capture_output=True, text=True)
+        if saved.returncode != 0:
+            continue
+        deletions = []
+        for line in saved.stdout.splitlines():
+            if not line.startswith("-A "):
+                continue
+            args = shlex.split(line)
+            comments = {args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "--comment"}
+            if tag in comments:
+                deletions.append("-D " + line[3:])
+        if deletions:
+            payload = f"*{table}\n" + "\n".join(deletions) + "\nCOMMIT\n"
+            result = subprocess.run(["iptables-restore", "--noflush"], input=payload, capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f"[Teardown] Erro ao remover regras iptables ({table}): {result.stderr.strip()}")
+                continue
+            rules += len(deletions)
+    return {"links": len(links), "rules": rules}
@@ -0,0 +1,394 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from kubernetes import client
+from k8s_lft.reconcile import K8sReconciler
+from k8s_lft.placement import partitionTopology, schedulableHosts, parseCpu, parseMemory, cutSize
+from k8s_lft.warmup import warmupImages
+from k8s_lft.teardown import deleteCollections, waitForDeletion, cleanupHost, agentLinkNames, iptablesTag
+from k8s_lft.tunnel import isLocalNode
+from k8s_lft.agent import LftAgent
+from k8s_lft.pidcache import PodPidCache
+from k8s_lft.session import ExecSessionPool
+import threading
+import time
+
+
+# Brief: Spread API requests over time so bulk deploys do not flood the apiserver
+class _RateLimiter:
+    def __init__(self, qps: float):
+        self.interval = 1.0 / qps if qps > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Brief: Block until the caller is allowed to send its next request.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Brief: Topology-level deployment for the Kubernetes backend.
+# Nodes and links are declared first and deployed together: every StatefulSet
+# is submitted concurrently at a bounded request rate, readiness is tracked for
+# the whole set at once through the shared pod watch, and each link is wired as
+# soon as both of its endpoints are ready. Deploy time follows the slowest pod
+# instead of the sum of all pod start times.
+class K8sTopology:
+
+    def __init__(self, max_workers: int = 32, qps: float = 20.0, name: str = "lft"):
+        self.name = name
+        self.nodes = dict()
+        self.links = []
+        self.operations = dict()
+        self.max_workers = max_workers
+        self.rate_limiter = _RateLimiter(qps)
+
+
+    # Brief: Add a node to the topology.
+    # Params:
+    #   K8sNode node: Node to deploy (not instantiated yet).
+    # Returns:
+    #   The node itself
+    def addNode(self, node):
+        node.topology = self.name
+        self.nodes[node.nodeName] = node
+        return node
+
+
+    # Brief: Add a veth link between two nodes of the topology.
+    # Params:
+    #   K8sNode node: First endpoint.
+    #   K8sNode peer: Second endpoint.
+    #   string interface_name: Name of the interface in node.
+    #   string peer_interface_name: Name of the interface in peer.
+    # Returns:
+    #   None
+    def addLink(self, node, peer, interface_name: str, peer_interface_name: str):
+        for endpoint in (node, peer):
+            if endpoint.nodeName not in self.nodes:
+                self.addNode(endpoint)
+        self.links.append((node, peer, interface_name, peer_interface_name))
+
+
+    # Brief: Declare an IP address on an interface of a node.
+    # Params:
+    #   K8sNode node: Node holding the interface.
+    #   string ip: IP address.
+    #   int mask: Subnet mask (CIDR notation).
+    #   string interface: Interface name.
+    # Returns:
+    #   None
+    def addAddress(self, node, ip: str, mask: int, interface: str):
+        self.__declare(node, {"op": "setIp", "ip": ip, "mask": mask, "interface": interface})
+
+
+    # Brief: Declare the default gateway of a node.
+    # Params:
+    #   K8sNode node: Node to configure.
+    #   string gateway_ip: IP address of the gateway.
+    #   string interface: Interface name used by the default route.
+    # Returns:
+    #   None
+    def addDefaultGateway(self, node, gateway_ip: str, interface: str):
+        self.__declare(node, {"op": "setDefaultGateway", "gateway_ip": gateway_ip, "iface_peer": interface})
+
+
+    # Brief: Declare a static route of a node.
+    # Params:
+    #   K8sNode node: Node to configure.
+    #   string ip: Destination network.
+    #   string mask: Subnet mask (CIDR notation).
+    #   string interface: Interface name used by the route.
+    # Returns:
+    #   None
+    def addRoute(self, node, ip: str, mask: str, interface: str):
+        self.__declare(node, {"op": "addRoute", "ip": ip, "mask": mask, "interface": interface})
+
+
+    # Brief: Declare the SDN controller of a switch.
+    # Params:
+    #   K8sSwitch switch: Switch to configure.
+    #   string controller_ip: IP address of the controller.
+    #   int controller_port: Port of the controller (default: 6653).
+    #   string protocol: Protocol of the controller connection (default: "tcp").
+    # Returns:
+    #   None
+    def addController(self, switch, controller_ip: str, controller_port: int = 6653, protocol: str = "tcp"):
+        self.__declare(switch, {"op": "setController", "controller_ip": controller_ip,
+                                "controller_port": controller_port, "protocol": protocol})
+
+
+    # Brief: Get the desired state of the topology as journal-formatted operations.
+    # Params:
+    #   None
+    # Returns:
+    #   dict mapping pod names to their operations, links first
+    def desiredState(self):
+        desired = {pod_name: [] for pod_name in self.nodes}
+        for node, peer, interface_name, peer_interface_name in self.links:
+            desired[node.nodeName].append({"op": "connect", "peer": peer.nodeName,
+                                           "interface_name": interface_name, "peer_interface_name": peer_interface_name})
+            desired[peer.nodeName].append({"op": "connect", "peer": node.nodeName,
+                                           "interface_name": peer_interface_name, "peer_interface_name": interface_name})
+        for pod_name, operations in self.operations.items():
+            desired[pod_name].extend(operations)
+        return desired
+
+
+    # Brief: Bring the cluster to the declared topology, applying only what is missing.
+    # Unlike deploy, this also applies the declared addresses, routes and
+    # controllers, and can be called again at any time: nodes, links and
+    # settings already in place are left untouched.
+    # Params:
+    #   None
+    # Returns:
+    #   dict summary returned by K8sReconciler.reconcile
+    def reconcile(self):
+        # only missing StatefulSets are created, existing pods keep their node
+        self.place()
+        return K8sReconciler(max_workers=self.max_workers).reconcile(self.desiredState(), self.nodes)
+
+
+    # Brief: Record a declared operation of a node.
+    # Params:
+    #   K8sNode node: Node the operation belongs to.
+    #   dict operation: Operation in journal format.
+    # Returns:
+    #   None
+    def __declare(self, node, operation):
+        if node.nodeName not in self.nodes:
+            self.addNode(node)
+        self.operations.setdefault(node.nodeName, []).append(operation)
+
+
+    # Brief: Place the nodes of the topology on cluster nodes.
+    # The link graph is partitioned so that few links cross cluster nodes while
+    # the declared CPU and memory stay balanced; each node's StatefulSet then
+    # carries a node affinity for its partition. Nodes placed explicitly (their
+    # placement attribute already set) are kept where they are.
+    # Params:
+    #   dict hosts: Mapping of cluster node names to allocatable {"cpu", "memory"} (default: read from the cluster).
+    # Returns:
+    #   dict mapping pod names to cluster node names
+    def place(self, hosts=None):
+        hosts = hosts if hosts is not None else schedulableHosts()
+        if len(hosts) < 2:
+            return dict()
+
+        free = {name: node for name, node in self.nodes.items() if node.placement is None}
+        demands = {name: {"cpu": parseCpu(node.cpu), "memory": parseMemory(node.memory)} for name, node in free.items()}
+        links = [(node.nodeName, peer.nodeName) for node, peer, _, _ in self.links]
+        placement = partitionTopology(demands, links, hosts)
+        for name, host in placement.items():
+            free[name].placement = host
+
+        placement = {name: node.placement for name, node in self.nodes.items()}
+        print(f"[Topology] {len(free)} nó(s) distribuídos em {len(hosts)} host(s), "
+              f"{cutSize(placement, links)} de {len(links)} link(s) entre hosts")
+        return placement
+
+
+    # Brief: Pull the images of the topology on the cluster nodes before deploying it.
+    # Call it ahead of deploy so image pulls are kept out of deploy-time
+    # measurements; when the topology is already placed, only the cluster
+    # nodes hosting it are warmed up.
+    # Params:
+    #   int timeout: Maximum time to wait for all pulls, in seconds (default: 900).
+    # Returns:
+    #   dict mapping each image to {cluster node: pull seconds}, see warmupImages
+    def warmup(self, timeout: int = 900):
+        placements = {node.placement for node in self.nodes.values()}
+        hosts = None if None in placements else placements
+        namespace = next(iter(self.nodes.values())).namespace if self.nodes else "default"
+        return warmupImages({node.image for node in self.nodes.values()}, namespace, hosts, timeout)
+
+
+    # Brief: Deploy every node and wire every link of the topology.
+    # Params:
+    #   int timeout: Maximum time to wait for all pods to become ready, in seconds (default: 600).
+    #   bool place: Partition the topology over the cluster nodes before deploying (default: True).
+    # Returns:
+    #   None
+    def deploy(self, timeout: int = 600, place: bool = True):
+        start = time.time()
+        errors = []
+        if place:
+            self.place()
+
+        # the ports of each switch are committed as one transaction once every link is wired
+        with ExitStack() as switches, ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for node in self.nodes.values():
+                if hasattr(node, "batch"):
+                    switches.enter_context(node.batch())
+            submissions = [pool.submit(self.__submitNode, node) for node in self.nodes.values()]
+            for future in submissions:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+            if errors:
+                raise RuntimeError(f"Failed to submit {len(errors)} StatefulSet(s): {errors}")
+            print(f"[Topology] {len(self.nodes)} StatefulSet(s) submitted in {time.time() - start:.2f}s")
+
+            link_futures = self.__waitAndWire(pool, timeout)
+            for future in link_futures:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+
+        if errors:
+            raise RuntimeError(f"Topology deployed with {len(errors)} error(s): {errors}")
+        print(f"[Topology] {len(self.nodes)} node(s) and {len(self.links)} link(s) deployed in {time.time() - start:.2f}s")
+
+
+    # Brief: Delete every node of the topology and what it left on this host.
+    # StatefulSets, services and pods are removed with label-selected
+    # delete-collection calls (foreground propagation), completion is awaited
+    # with a single pod watch per namespace, and the host interfaces and
+    # iptables rules of connectToInternet are removed in batch afterwards.
+    # Params:
+    #   int timeout: Maximum time to wait for the pods to be deleted, in seconds (default: 300).
+    #   bool host_cleanup: Also remove host-side veths and iptables rules (default: True).
+    # Returns:
+    #   None
+    def teardown(self, timeout: int = 300, host_cleanup: bool = True):
+        start = time.time()
+        groups = {(node.namespace, f"app={node.app},lft/topology={self.name}") for node in self.nodes.values()}
+
+        # host-side state is only known from the journal, read it before dropping the entries
+        host_ifaces, agent_links, remote_hosts = set(), set(), set()
+        for node in self.nodes.values():
+            host = PodPidCache().getHost(node.nodeName)
+            for operation in node.journal.operations(node.nodeName) or []:
+                if operation["op"] == "connectToInternet":
+                    host_ifaces.add(operation["host_iface"])
+                    if host is not None and not isLocalNode(host["node"]):
+                        # connected through the agent, its rules live on that cluster node
+                        remote_hosts.add(host["node"])
+                elif operation["op"] == "connect":
+                    agent_links |= agentLinkNames(node.nodeName, operation, host["container_id"] if host else None)
+
+        for namespace, label_selector in groups:
+            deleteCollections(namespace, label_selector)
+        for node in self.nodes.values():
+            node.watcher.unregisterNode(node.nodeName)
+        for namespace, label_selector in groups:
+            waitForDeletion(namespace, label_selector, max(1, timeout - (time.time() - start)))
+
+        for node in self.nodes.values():
+            node.journal.remove([node.nodeName])
+            PodPidCache().evict(node.nodeName)
+            ExecSessionPool().evict(node.nodeName, node.namespace)
+        for journal in {id(node.journal): node.journal for node in self.nodes.values()}.values():
+            journal.flush()
+
+        cleaned = {"links": 0, "rules": 0}
+        if host_cleanup:
+            cleaned = cleanupHost(host_ifaces, agent_links, self.name)
+            # the host ends on other cluster nodes went away with their pods, only the rules are left
+            for node_name in remote_hosts:
+                cleaned["rules"] += LftAgent().removeTaggedRules(node_name, iptablesTag(self.name))
+        print(f"[Topology] {len(self.nodes)} nó(s) removidos em {time.time() - start:.2f}s "
+              f"({cleaned['links']} interface(s) e {cleaned['rules']} regra(s) iptables do host)")
+
+
+    # Brief: Submit the StatefulSet of one node, honouring the request rate.
+    # Params:
+    #   K8sNode node: Node to submit.
+    # Returns:
+    #   None
+    def __submitNode(self, node):
+        self.rate_limiter.acquire()
+        node._createStatefulSet()
+
+
+    # Brief: Wait for readiness of the whole node set and wire links as their endpoints become ready.
+    # Params:
+    #   ThreadPoolExecutor pool: Pool running post-instantiate hooks and links.
+    #   int timeout: Maximum time to wait, in seconds.
+    # Returns:
+    #   List of futures of the submitted links
+    def __waitAndWire(self, pool, timeout: int):
+        first = next(iter(self.nodes.values()))
+        watcher = first.watcher
+        use_watcher = all(watcher.tracks(node.namespace, node.app) for node in self.nodes.values())
+        namespaces = {node.namespace for node in self.nodes.values()}
+        pending_nodes = set(self.nodes)
+        pending_links = list(self.links)
+        hooks = dict()
+        link_futures = []
+
+        deadline = time.time() + timeout
+        while pending_nodes or pending_links:
+            ready = watcher.readyPods() if use_watcher else self.__readyPods(first.api, namespaces)
+            for pod_name in ready & pending_nodes:
+                # switches must have their bridge before ports are attached
+                hooks[pod_name] = pool.submit(self.nodes[pod_name]._postInstantiate)
+                pending_nodes.discard(pod_name)
+
+            still_pending = []
+            for link in pending_links:
+                node, peer = link[0], link[1]
+                endpoints = [hooks.get(node.nodeName), hooks.get(peer.nodeName)]
+                if all(hook is not None and hook.done() for hook in endpoints):
+                    failed = [hook.exception() for hook in endpoints if hook.exception() is not None]
+                    if failed:
+                        raise RuntimeError(f"Cannot wire {node.nodeName} <-> {peer.nodeName}: {failed}")
+                    link_futures.append(pool.submit(self.__wire, *link))
+                else:
+                    still_pending.append(link)
+            pending_links = still_pending
+
+            if not (pending_nodes or pending_links):
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"Pods {sorted(pending_nodes)} did not become ready within {timeout} seconds.")
+            if pending_nodes and use_watcher:
+                watcher.waitForReadinessChange(timeout=0.5)
+            else:
+                time.sleep(1 if pending_nodes else 0.1)
+
+        for hook in hooks.values():
+            if hook.exception() is not None:
+                raise hook.exception()
+        return link_futures
+
+
+    # Brief: List the ready pods with one request per namespace, for pods the watcher does not track.
+    # Params:
+    #   CoreV1Api api: Kubernetes core API client.
+    #   set namespaces: Namespaces the topology spans.
+    # Returns:
+    #   Set of ready pod names
+    def __readyPods(self, api, namespaces):
+        ready = set()
+        for namespace in namespaces:
+            try:
+                pods = api.list_namespaced_pod(namespace=namespace).items
+            except client.exceptions.ApiException as e:
+                print(f"[Topology] Error listing pods in {namespace}: {e}")
+                continue
+            for pod in pods:
+                if pod.metadata.name not in self.nodes or pod.status.phase != "Running":
+                    continue
+                conditions = pod.status.conditions or []
+                if any(c.type == "Ready" and c.status == "True" for c in conditions):
+                    ready.add(pod.metadata.name)
+        return ready
+
+
+    # Brief: Wire one link, honouring the request rate.
+    # Params:
+    #   K8sNode node: First endpoint.
+    #   K8sNode peer: Second endpoint.
+    #   string interface_name: Name of the interface in node.
+    #   string peer_interface_name: Name of the interface in peer.
+    # Returns:
+    #   None
+    def __wire(self, node, peer, interface_name: str, peer_interface_name: str):
+        self.rate_limiter.acquire()
+        node.connect(peer, interface_name, peer_interface_name)
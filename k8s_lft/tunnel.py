@@ -0,0 +1,36 @@
+import socket
+import zlib
+import os
+
+
+# Encapsulation of links whose endpoints run on different cluster nodes ("vxlan" or "geneve")
+TUNNEL_KIND = os.environ.get("LFT_TUNNEL", "vxlan")
+TUNNEL_PORTS = {"vxlan": 4789, "geneve": 6081}
+
+
+# Brief: Check whether a cluster node is the one this process runs on.
+# Params:
+#   string node_name: Cluster node name.
+# Returns:
+#   True if the node is local (LFT_NODE_NAME, or the hostname like microk8s names nodes);
+#   never in the operator, whose pod has no access to the host
+def isLocalNode(node_name):
+    if os.environ.get("LFT_OPERATOR") == "1":
+        return False
+    if os.environ.get("LFT_NODE_NAME"):
+        return node_name == os.environ["LFT_NODE_NAME"]
+    return (node_name or "").split(".")[0].lower() == socket.gethostname().split(".")[0].lower()
+
+
+# Brief: Derive the tunnel ID of a link from its endpoints.
+# The ID only depends on the link, so a replayed link gets the same ID back.
+# Params:
+#   string pod_name: First pod.
+#   string interface_name: Interface in the first pod.
+#   string peer_name: Second pod.
+#   string peer_interface_name: Interface in the second pod.
+# Returns:
+#   int VNI in [1, 2^24)
+def tunnelId(pod_name, interface_name, peer_name, peer_interface_name):
+    ends = sorted([f"{pod_name}/{interface_name}", f"{peer_name}/{peer_interface_name}"])
+    return zlib.crc32("|".join(ends).encode()) % 0xFFFFFE + 1
@@ -9,4 +9,12 @@ sudo microk8s kubectl delete statefulsets -l app=k8s-node -n default
 sudo microk8s kubectl delete deployments -l app=k8s-node -n default
 
 # Deleta todos os Services com a label app=k8s-node no namespace default
-sudo microk8s kubectl delete services -l app=k8s-node -n default
\ No newline at end of file
+sudo microk8s kubectl delete services -l app=k8s-node -n default
+# Deleta o journal de operações da topologia
+sudo microk8s kubectl delete configmaps -l app=k8s-node -n default
+# Deleta o agente de links entre nós do cluster
+sudo microk8s kubectl delete daemonsets -l app=lft-agent -n default
+sudo microk8s kubectl delete configmaps -l app=lft-agent -n default
+sudo microk8s kubectl delete daemonsets -l app=lft-warmup -n default
+# Deleta o estado publicado pelo operador de recuperação
+sudo microk8s kubectl delete topologies.lft.k8s.io --all -n default --ignore-not-found
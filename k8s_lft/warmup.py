@@ -0,0 +1,184 @@
+from kubernetes import client
+from k8s_lft.kubeclient import K8sClientContext
+import time
+import zlib
+import re
+
+
+WARMUP_APP = "lft-warmup"
+
+# waiting reasons of a container whose image is still being pulled
+PULLING = {"ContainerCreating", "PodInitializing"}
+PULL_FAILED = {"ErrImagePull", "ImagePullBackOff", "InvalidImageName", "ErrImageNeverPull"}
+
+GO_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 1e-3, "us": 1e-6, "µs": 1e-6, "ns": 1e-9}
+
+
+# Brief: Parse a Go duration as printed in kubelet events.
+# Params:
+#   string duration: Duration such as "1m2.5s" or "512ms".
+# Returns:
+#   float seconds
+def parseGoDuration(duration):
+    parts = re.findall(r"([0-9.]+)(ms|us|µs|ns|h|m|s)", duration)
+    return sum(float(value) * GO_DURATION_UNITS[unit] for value, unit in parts)
+
+
+# Brief: Pull the images of a planned topology on every cluster node ahead of time.
+# One DaemonSet per image is created, so every node pulls every image in
+# parallel (as far as the kubelet's serializeImagePulls setting allows) before
+# any emulated pod is deployed; the first instantiate then no longer waits on a
+# pull inside _waitUntilReady. The pull time of each image on each node is read
+# from the kubelet "Pulled" events and returned, so it can be reported apart
+# from deploy-time measurements. The DaemonSets are deleted at the end.
+# Params:
+#   iterable images: Images to pull (duplicates are ignored).
+#   string namespace: Namespace of the warm-up DaemonSets (default: "default").
+#   list hosts: Cluster nodes to warm up (default: every node the DaemonSets can run on).
+#   int timeout: Maximum time to wait for all pulls, in seconds (default: 900).
+# Returns:
+#   dict mapping each image to {cluster node: pull seconds, 0.0 if it was already present};
+#   images that failed to pull map the node to None
+def warmupImages(images, namespace="default", hosts=None, timeout=900):
+    context = K8sClientContext()
+    images = sorted(set(images))
+    names = {f"{WARMUP_APP}-{zlib.crc32(image.encode()):08x}": image for image in images}
+    start = time.time()
+
+    for name, image in names.items():
+        _createDaemonSet(context, name, image, namespace, hosts)
+
+    pulled = dict()
+    try:
+        deadline = time.time() + timeout
+        while True:
+            pods = context.core_api.list_namespaced_pod(namespace=namespace, label_selector=f"app={WARMUP_APP}").items
+            pulled = _pulledImages(pods, names)
+            if _complete(context, names, namespace, pulled):
+                break
+            if time.time() > deadline:
+                raise TimeoutError(f"Images {images} were not pulled within {timeout} seconds.")
+            time.sleep(1)
+
+        results = {image: dict() for image in images}
+        seconds = _pullTimes(context, names, namespace, pods)
+        for (node_name, image), ok in pulled.items():
+            results[image][node_name] = seconds.get((node_name, image), 0.0) if ok else None
+    finally:
+        context.apps_api.delete_collection_namespaced_daemon_set(
+            namespace=namespace, label_selector=f"app={WARMUP_APP}", propagation_policy="Foreground")
+
+    for image, times in results.items():
+        report = ", ".join(f"{node_name}={'falhou' if s is None else f'{s:.2f}s'}" for node_name, s in sorted(times.items()))
+        print(f"[Warmup] {image}: {report}")
+    print(f"[Warmup] {len(images)} imagem(ns) preparadas em {time.time() - start:.2f}s")
+    return results
+
+
+# Brief: Create the warm-up DaemonSet of one image.
+# The container only sleeps; it is the pull of its image that matters. Images
+# without a sleep binary fail to start after being pulled, which still counts.
+# Params:
+#   K8sClientContext context: Shared Kubernetes clients.
+#   string name: DaemonSet name.
+#   string image: Image to pull.
+#   string namespace: Namespace of the DaemonSet.
+#   list hosts: Cluster nodes to run on, or None for all of them.
+# Returns:
+#   None
+def _createDaemonSet(context, name, image, namespace, hosts):
+    labels = {"app": WARMUP_APP, "lft/warmup": name}
+    spec = {
+        "tolerations": [{"operator": "Exists"}],
+        "terminationGracePeriodSeconds": 0,
+        "containers": [{
+            "name": "warmup",
+            "image": image,
+            "imagePullPolicy": "IfNotPresent",
+            "command": ["sleep", "infinity"],
+            "resources": {"requests": {"cpu": "1m", "memory": "4Mi"}}
+        }]
+    }
+    if hosts:
+        spec["affinity"] = {"nodeAffinity": {"requiredDuringSchedulingIgnoredDuringExecution": {"nodeSelectorTerms": [
+            {"matchFields": [{"key": "metadata.name", "operator": "In", "values": sorted(hosts)}]}
+        ]}}}
+    manifest = {
+        "apiVersion": "apps/v1",
+        "kind": "DaemonSet",
+        "metadata": {"name": name, "labels": labels},
+        "spec": {"selector": {"matchLabels": labels}, "template": {"metadata": {"labels": labels}, "spec": spec}}
+    }
+    try:
+        context.apps_api.create_namespaced_daemon_set(namespace=namespace, body=manifest)
+    except client.exceptions.ApiException as e:
+        # left over by an interrupted warm-up, it pulls the same image
+        if e.status != 409:
+            raise
+
+
+# Brief: Get the pull state of every warm-up pod.
+# Params:
+#   list pods: Warm-up pods.
+#   dict names: Mapping of DaemonSet names to images.
+# Returns:
+#   dict mapping (cluster node, image) to True if pulled, False if the pull failed;
+#   pods still pulling are left out
+def _pulledImages(pods, names):
+    pulled = dict()
+    for pod in pods:
+        image = names.get((pod.metadata.labels or {}).get("lft/warmup"))
+        if image is None or not pod.spec.node_name or pod.metadata.deletion_timestamp is not None:
+            continue
+        statuses = pod.status.container_statuses or []
+        if not statuses:
+            continue
+        waiting = statuses[0].state.waiting
+        if waiting is not None and waiting.reason in PULL_FAILED:
+            pulled[(pod.spec.node_name, image)] = False
+        elif waiting is None or waiting.reason not in PULLING:
+            pulled[(pod.spec.node_name, image)] = True
+    return pulled
+
+
+# Brief: Check whether every warm-up DaemonSet has a settled pod on every node it targets.
+# Params:
+#   K8sClientContext context: Shared Kubernetes clients.
+#   dict names: Mapping of DaemonSet names to images.
+#   string namespace: Namespace of the DaemonSets.
+#   dict pulled: Result of _pulledImages.
+# Returns:
+#   True if no pull is pending
+def _complete(context, names, namespace, pulled):
+    daemonsets = context.apps_api.list_namespaced_daemon_set(namespace=namespace, label_selector=f"app={WARMUP_APP}").items
+    for daemonset in daemonsets:
+        image = names.get(daemonset.metadata.name)
+        if image is None:
+            continue
+        desired = (daemonset.status and daemonset.status.desired_number_scheduled) or 0
+        if desired == 0 or sum(1 for node_name, i in pulled if i == image) < desired:
+            return False
+    return len(daemonsets) >= len(names)
+
+
+# Brief: Read the pull time of every warm-up pod from the kubelet "Pulled" events.
+# Params:
+#   K8sClientContext context: Shared Kubernetes clients.
+#   dict names: Mapping of DaemonSet names to images.
+#   string namespace: Namespace of the pods.
+#   list pods: Warm-up pods.
+# Returns:
+#   dict mapping (cluster node, image) to pull seconds
+def _pullTimes(context, names, namespace, pods):
+    # events name the image as resolved by the runtime ("docker.io/...:latest"),
+    # so the image is taken from the pod instead
+    owners = {pod.metadata.name: (pod.spec.node_name, names.get((pod.metadata.labels or {}).get("lft/warmup")))
+              for pod in pods}
+    events = context.core_api.list_namespaced_event(namespace=namespace, field_selector="reason=Pulled").items
+    seconds = dict()
+    for event in events:
+        owner = owners.get(event.involved_object.name)
+        match = re.match(r'Successfully pulled image ".+?" in ([^ ]+)', event.message or "")
+        if owner is not None and match:
+            seconds[owner] = parseGoDuration(match.group(1))
+    return seconds
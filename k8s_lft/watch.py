@@ -1,10 +1,19 @@
-from kubernetes import client, config, watch
+from kubernetes import client, watch
 import threading
 import time
+import os
 import json
 import traceback
+from collections import deque
+from contextlib import ExitStack
 from requests.exceptions import ConnectionError as RequestsConnectionError
 from urllib3.exceptions import NewConnectionError, MaxRetryError
+from k8s_lft.kubeclient import K8sClientContext
+from k8s_lft.pidcache import PodPidCache, parseContainerId
+from k8s_lft.journal import OperationJournal
+from k8s_lft.session import ExecSessionPool
+from k8s_lft.replay import buildReplayPlan, runReplayPlan, lostOperations
+from k8s_lft.crd import operatorActive
 
 
 
@@ -21,7 +30,7 @@ class K8sWatcher:
             print("[Watcher] Já existe um watcher, retornando instância existente.")
         return cls._instance
 
-    def __init__(self, namespace="default", label_selector=None):
+    def __init__(self, namespace="default", label_selector=None, max_workers=16, ready_timeout=60):
         if hasattr(self, "_initialized") and self._initialized:
             return
 
@@ -33,6 +42,18 @@ class K8sWatcher:
         self.namespace = namespace
         self.label_selector = label_selector
         self.stop_event = threading.Event()
+        self.ready_pods = set()
+        self.readiness = threading.Condition()
+        self.readiness_listeners = set()
+        self.max_workers = max_workers
+        self.ready_timeout = ready_timeout
+        self.recovery_wakeup = threading.Event()
+        self.recoveries = deque(maxlen=100)
+        self.watch_stats = {"relists": 0, "events": 0, "bookmarks": 0}
+        # scripts leave recovery to the in-cluster operator when one is running
+        self.defer_to_operator = os.environ.get("LFT_OPERATOR") != "1"
+        self.recovery_thread = threading.Thread(target=self.__recovery_loop, daemon=True)
+        self.recovery_thread.start()
         self.thread = threading.Thread(target=self.__watch_loop)
         self.thread.start()
 
@@ -47,109 +68,166 @@ class K8sWatcher:
         self.node_objects[node.nodeName] = node
 
 
-    # Brief: Main watch loop to monitor pod status and trigger reapplication of operations.
+    # Brief: Forget a node whose pod was deleted on purpose, so it is not recovered.
     # Params:
+    #   string pod_name: Name of the pod.
+    # Returns:
     #   None
+    def unregisterNode(self, pod_name):
+        self.node_objects.pop(pod_name, None)
+        self.nodes.pop(pod_name, None)
+
+
+    # Brief: Check whether this watcher observes the pods of a node.
+    # Params:
+    #   string namespace: Namespace of the node.
+    #   string app: Value of the node's "app" label.
     # Returns:
+    #   True if the node's pod events reach this watcher
+    def tracks(self, namespace, app):
+        return namespace == self.namespace and self.label_selector in (None, f"app={app}")
+
+
+    # Brief: Get the pods whose Ready condition is currently true.
+    # Params:
     #   None
-    def __watch_loop(self):
+    # Returns:
+    #   Set of ready pod names
+    def readyPods(self):
+        with self.readiness:
+            return set(self.ready_pods)
 
-        # Brief: Wait for a pod to be in Running state and then reapply operations.
-        # Params:
-        #   string pod_name: Name of the pod to monitor.
-        # Returns:
-        #   None
-        def __waitForRunningThenApply(pod_name):
-            print(f"[Watcher] Aguardando pod {pod_name} entrar em Running para reaplicar operações...")
-            for i in range(60):  # try for up to 60 seconds
-                try:
-                    print(f"[Watcher] ({i}) Consultando status do pod {pod_name}...")
-                    pod_status = v1.read_namespaced_pod_status(pod_name, self.namespace)
-                    phase = pod_status.status.phase
-                    print(f"[Watcher] Pod {pod_name} está com phase={phase}")
-                    if phase == "Running":
-                        print(f"[Watcher] Pod {pod_name} agora está em Running, reaplicando operações...")
-                        self.reapplyOperations(pod_name)
-                        print(f"[Watcher] Operações reaplicadas para {pod_name}, "
-                            f"reapply está como {self.nodes[pod_name]['redo_operations']}.")
-                        break
-                except Exception as e:
-                    print(f"[Watcher] Erro ao ler status do pod {pod_name}: {e}")
-                time.sleep(1)
+
+    # Brief: Block until a pod becomes ready, woken up by the shared pod watch.
+    # Params:
+    #   string pod_name: Name of the pod to wait for.
+    #   float timeout: Maximum time to wait in seconds.
+    # Returns:
+    #   True if the pod is ready, False on timeout
+    def waitUntilReady(self, pod_name, timeout):
+        with self.readiness:
+            return self.readiness.wait_for(lambda: pod_name in self.ready_pods, timeout=timeout)
+
+
+    # Brief: Register a callback run (under the readiness lock) whenever the set of ready pods may have changed.
+    # Params:
+    #   function listener: Callable without arguments; it must not block.
+    # Returns:
+    #   None
+    def addReadinessListener(self, listener):
+        with self.readiness:
+            self.readiness_listeners.add(listener)
+
+
+    # Brief: Unregister a readiness callback.
+    # Params:
+    #   function listener: Callable given to addReadinessListener.
+    # Returns:
+    #   None
+    def removeReadinessListener(self, listener):
+        with self.readiness:
+            self.readiness_listeners.discard(listener)
+
+
+    # Brief: Block until the set of ready pods changes.
+    # Params:
+    #   float timeout: Maximum time to wait in seconds.
+    # Returns:
+    #   None
+    def waitForReadinessChange(self, timeout):
+        with self.readiness:
+            self.readiness.wait(timeout=timeout)
+
+
+    # Brief: Wake up the threads and listeners waiting on readiness; the readiness lock must be held.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __notifyReadiness(self):
+        self.readiness.notify_all()
+        for listener in self.readiness_listeners:
+            listener()
+
+
+    # Brief: Update the readiness state from a pod watch event and wake up waiters.
+    # Params:
+    #   string event_type: Type of the watch event (ADDED, MODIFIED, DELETED).
+    #   pod: Pod object carried by the event.
+    # Returns:
+    #   None
+    def __updateReadiness(self, event_type, pod):
+        conditions = pod.status.conditions or []
+        ready = (
+            event_type != "DELETED"
+            and pod.metadata.deletion_timestamp is None
+            and pod.status.phase == "Running"
+            and any(c.type == "Ready" and c.status == "True" for c in conditions)
+        )
+        with self.readiness:
+            if ready:
+                self.ready_pods.add(pod.metadata.name)
             else:
-                print(f"[Watcher] Timeout: pod {pod_name} não entrou em Running em 30s.")
+                self.ready_pods.discard(pod.metadata.name)
+            self.__notifyReadiness()
+
+
+    # Brief: Main watch loop to monitor pod status and trigger reapplication of operations.
+    # The pods are listed once and the watch then resumes from the last
+    # resourceVersion it saw, kept fresh by bookmarks, so a restart every
+    # timeout_seconds does not replay an ADDED event per pod. A relist only
+    # happens when the apiserver answers 410 Gone.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __watch_loop(self):
 
-        config.load_kube_config(config_file="kubeconfig")
-        v1 = client.CoreV1Api()
+        v1 = K8sClientContext().core_api
         w = watch.Watch()
+        pid_cache = PodPidCache()
+        resource_version = None
 
         print(f"[Watcher] Iniciando observação de pods no namespace '{self.namespace}'")
         while not self.stop_event.is_set():
             try:
-                
+                if resource_version is None:
+                    resource_version = self.__relist(v1, pid_cache)
+
                 for event in w.stream(
                     v1.list_namespaced_pod,
                     namespace=self.namespace,
                     label_selector=self.label_selector,
+                    resource_version=resource_version,
+                    allow_watch_bookmarks=True,
                     timeout_seconds=60
                 ):
                     if self.stop_event.is_set():
                         break
 
-                    pod = event["object"]
-                    pod_name = pod.metadata.name
-                    uid = pod.metadata.uid
-                    phase = pod.status.phase
-                    
-                    if pod_name not in self.nodes:
-                        
-                        self.nodes[pod_name] = {
-                            "uid": uid,
-                            "last_phase": phase,
-                            "recreate_count": 0,
-                            "running_transitions": 0,
-                            "redo_operations": False
-                        }
-                        
-                    if uid != self.nodes[pod_name]["uid"] or self.nodes[pod_name]["redo_operations"]:
-                        if uid != self.nodes[pod_name]["uid"]:
-                            self.nodes[pod_name]["uid"] = uid
-                            self.nodes[pod_name]["recreate_count"] += 1
-                            self.nodes[pod_name]["redo_operations"] = True
-
-                            # redo whole network if a pod was recreated
-                            for node in self.nodes.values():
-                                print(f"[Watcher] Marcando nó {node} para reapply devido a erro no watch.")
-                                node["redo_operations"] = True
-                            print(f"[Watcher] Pod {pod_name} foi recriado (recreate_count={self.nodes[pod_name]['recreate_count']}).")
-
-                        # do switches first, they have to be up for others to connect
-                        switches_to_reapply = [n for n in self.nodes if n.startswith("s") and self.nodes[n]["redo_operations"]]
-                        if switches_to_reapply:
-                            print(f"[Watcher] Detectados switches a reaplicar: {switches_to_reapply}")
-
-
-                            for s_name in switches_to_reapply:
-                                print(f"aplicando __waitforRunning em {s_name}")
-                                __waitForRunningThenApply(s_name)
-                                print(f"aplicou __waitforRunning em {s_name}?")
-                                self.nodes[s_name]["redo_operations"] = False  
-
-                            for n in self.nodes:
-                                if not n.startswith("s"):  
-                                    self.nodes[n]["redo_operations"] = True
-                                    print(f"[Watcher] Marcando {n} para reapply (switch foi recriado).")
-
-                        # then connect the rest
-                        others_to_reapply = [n for n in self.nodes if not n.startswith("s") and self.nodes[n]["redo_operations"]]
-                        if others_to_reapply:
-                            print(f"[Watcher] Reaplicando operações para os demais pods: {others_to_reapply}")
-                            for n_name in others_to_reapply:
-                                __waitForRunningThenApply(n_name)
-                                self.nodes[n_name]["redo_operations"] = False
+                    if event["type"] == "ERROR":
+                        if event["raw_object"].get("code") == 410:
+                            print("[Watcher] resourceVersion expirado, listando os pods novamente.")
+                            resource_version = None
+                            break
+                        continue
 
+                    pod = event["object"]
+                    resource_version = pod.metadata.resource_version
+                    if event["type"] == "BOOKMARK":
+                        self.watch_stats["bookmarks"] += 1
                         continue
 
+                    self.watch_stats["events"] += 1
+                    self.__handleEvent(event["type"], pod, pid_cache)
+
+            except client.exceptions.ApiException as e:
+                if e.status == 410:
+                    print("[Watcher] resourceVersion expirado, listando os pods novamente.")
+                    resource_version = None
+                    continue
+                print(f"[Watcher] Erro no stream: {e}. Reiniciando em 2s...")
+                time.sleep(2)
 
             except Exception as e:
                 print(f"[Watcher] Erro no stream: {e}. Reiniciando em 2s...")
@@ -168,14 +246,161 @@ class K8sWatcher:
                     for node in self.nodes.values():
                         print(f"[Watcher] Marcando nó {node} para reapply devido a erro no watch.")
                         node["redo_operations"] = True
+                    self.recovery_wakeup.set()
 
                 time.sleep(2)
 
-            finally:
-                print("[Watcher] um evento aconteceu...")
 
+    # Brief: List the watched pods and rebuild the state from them.
+    # Params:
+    #   CoreV1Api v1: Kubernetes core API client.
+    #   PodPidCache pid_cache: PID cache to invalidate for recreated pods.
+    # Returns:
+    #   resourceVersion of the list, to start the watch from
+    def __relist(self, v1, pid_cache):
+        pods = v1.list_namespaced_pod(namespace=self.namespace, label_selector=self.label_selector)
+        self.watch_stats["relists"] += 1
+
+        listed = {pod.metadata.name for pod in pods.items}
+        with self.readiness:
+            # pods deleted while the watch was down never send their DELETED event
+            self.ready_pods &= listed
+            self.__notifyReadiness()
+        for pod in pods.items:
+            self.__handleEvent("ADDED", pod, pid_cache)
+        return pods.metadata.resource_version
+
+
+    # Brief: Handle one pod event: readiness, PID cache and recreation detection.
+    # Params:
+    #   string event_type: Type of the watch event (ADDED, MODIFIED, DELETED).
+    #   pod: Pod object carried by the event.
+    #   PodPidCache pid_cache: PID cache to invalidate for recreated pods.
+    # Returns:
+    #   None
+    def __handleEvent(self, event_type, pod, pid_cache):
+        pod_name = pod.metadata.name
+        self.__updateReadiness(event_type, pod)
+        uid = pod.metadata.uid
+        phase = pod.status.phase
+
+        if pod_name not in self.nodes:
+
+            self.nodes[pod_name] = {
+                "uid": uid,
+                "last_phase": phase,
+                "recreate_count": 0,
+                "running_transitions": 0,
+                "redo_operations": False,
+                "recreated_at": None
+            }
+
+        # never hand back a PID from a dead sandbox
+        container_statuses = pod.status.container_statuses or []
+        if container_statuses:
+            container_id = parseContainerId(container_statuses[0].container_id)
+            if container_id is not None:
+                pid_cache.evictIfStale(pod_name, container_id)
+
+        node_state = self.nodes[pod_name]
+        if uid != node_state["uid"] or node_state["redo_operations"] or node_state["recreated_at"]:
+            if uid != node_state["uid"]:
+                pid_cache.evict(pod_name)
+                ExecSessionPool().evict(pod_name, self.namespace)
+                node_state["uid"] = uid
+                node_state["recreate_count"] += 1
+                # only this pod and the peer ends of its links are replayed
+                node_state["recreated_at"] = node_state["recreated_at"] or time.time()
+                created = pod.metadata.creation_timestamp
+                node_state["created_at"] = created.timestamp() if created else None
+                print(f"[Watcher] Pod {pod_name} foi recriado (recreate_count={node_state['recreate_count']}).")
+
+            # replay runs on the recovery thread so this loop keeps consuming events
+            self.recovery_wakeup.set()
+
+
+    # Brief: Get the counters of the pod watch.
+    # Params:
+    #   None
+    # Returns:
+    #   dict with the number of relists, processed events and bookmarks
+    def getWatchStats(self):
+        return dict(self.watch_stats)
+
+
+    # Brief: Recovery loop replaying the operations of every pod marked for reapply.
+    # Params:
+    #   None
+    # Returns:
+    #   None
+    def __recovery_loop(self):
+        while not self.stop_event.is_set():
+            self.recovery_wakeup.wait()
+            self.recovery_wakeup.clear()
+            full = [n for n in list(self.nodes) if self.nodes[n]["redo_operations"]]
+            recreated = {n: self.nodes[n]["recreated_at"] for n in list(self.nodes) if self.nodes[n]["recreated_at"]}
+            if not full and not recreated:
+                continue
+            for pod_name in full:
+                self.nodes[pod_name]["redo_operations"] = False
+            for pod_name in recreated:
+                self.nodes[pod_name]["recreated_at"] = None
+            if self.defer_to_operator and operatorActive(self.namespace):
+                print(f"[Watcher] Operador ativo em {self.namespace}, recuperação de {full or list(recreated)} delegada.")
+                continue
+
+            start = time.time()
+            try:
+                if full:
+                    # the watch lost track of the cluster, sandboxes may have changed without a new UID
+                    self.__replay(full)
+                else:
+                    self.__replay(list(recreated), recreated=set(recreated))
+            except Exception as e:
+                print(f"[Watcher] Erro ao reaplicar operações de {full or list(recreated)}: {e}")
+                traceback.print_exc()
+            self.__recordRecovery(full, recreated, start)
 
 
+    # Brief: Record how long a recovery took.
+    # Params:
+    #   list full: Pods fully replayed after the watch lost track of the cluster.
+    #   dict recreated: Recreated pods and the time their new UID was observed.
+    #   float start: Time the replay started.
+    # Returns:
+    #   None
+    def __recordRecovery(self, full, recreated, start):
+        end = time.time()
+        detected = min(recreated.values()) if recreated else start
+        created = [self.nodes[p].get("created_at") for p in recreated]
+        created = [c for c in created if c]
+        recovery = {
+            "pods": sorted(full or recreated),
+            "full_replay": bool(full),
+            "replay_seconds": end - start,
+            "time_to_recover": end - detected,
+            "since_pod_creation": end - min(created) if created else None,
+            "finished_at": end
+        }
+        self.recoveries.append(recovery)
+        print(f"[Watcher] Recuperação de {recovery['pods']} em {recovery['time_to_recover']:.2f}s "
+              f"(reaplicação {recovery['replay_seconds']:.2f}s)")
+
+
+    # Brief: Get time-to-recover metrics of the recoveries performed so far.
+    # Params:
+    #   None
+    # Returns:
+    #   dict with the number of recoveries, the last one, and the mean and max time to recover
+    def getRecoveryMetrics(self):
+        recoveries = list(self.recoveries)
+        times = [r["time_to_recover"] for r in recoveries]
+        return {
+            "recoveries": len(recoveries),
+            "last": recoveries[-1] if recoveries else None,
+            "mean_time_to_recover": sum(times) / len(times) if times else None,
+            "max_time_to_recover": max(times) if times else None
+        }
 
 
     # Brief: Reapply stored operations to a pod.
@@ -185,31 +410,103 @@ class K8sWatcher:
     #   None
     def reapplyOperations(self, pod_name):
         print(f"[Watcher] Reaplicando operações para {pod_name}...")
+        self.__replay([pod_name])
+        if pod_name in self.nodes:
+            self.nodes[pod_name]["redo_operations"] = False
 
-        node_object = self.node_objects.get(pod_name)
 
-        apps_v1 = client.AppsV1Api()
-        statefulset_name = pod_name[:-2]  # remove "-0"
+    # Brief: Replay the journal of several pods as a dependency graph on a worker pool.
+    # Each pod is prepared as soon as it is Running, each link as soon as both
+    # endpoints are prepared, and independent pods are replayed concurrently.
+    # Params:
+    #   list pod_names: Pods whose operations are replayed.
+    #   set recreated: If given, only the state lost by these recreated pods is
+    #                  replayed: their own operations plus the peer ends of their links.
+    # Returns:
+    #   None
+    def __replay(self, pod_names, recreated=None):
+        if recreated is None:
+            journal = {pod_name: self.__readOperations(pod_name) for pod_name in pod_names}
+        else:
+            journal = OperationJournal(namespace=self.namespace, api=K8sClientContext().core_api).readAll()
+            journal = {name: entry["operations"] for name, entry in journal.items()}
+            for pod_name in recreated - set(journal):
+                journal[pod_name] = self.__readOperations(pod_name)
+            journal = lostOperations(journal, recreated)
+            journal = {name: ops for name, ops in journal.items() if ops or name in recreated}
+
+        known = [p for p in journal if p in self.node_objects]
+        for pod_name in set(journal) - set(known):
+            print(f"[Watcher] Pod {pod_name} não foi registrado neste processo, ignorando.")
+        if not known:
+            return
+        journal = {pod_name: journal[pod_name] for pod_name in known}
+        # bridges only disappear with the pod that held them
+        bridges = set(known) if recreated is None else recreated
+
+        peers = {op["peer"] for ops in journal.values() for op in ops if op["op"] == "connect"}
+        steps = buildReplayPlan(journal, known, ready_only=peers)
+        print(f"[Watcher] Reaplicando {len(steps)} passo(s) para {known}")
+
+        start = time.time()
+        switches = [p for p in set(known) | peers if hasattr(self.node_objects.get(p), "batch")]
         try:
-            statefulset = apps_v1.read_namespaced_stateful_set(
-                name=statefulset_name,
-                namespace=self.namespace
-            )
-
-            annotations = statefulset.metadata.annotations or {}
-            ops_json = annotations.get("lft/operations", "[]")
-            ops = json.loads(ops_json)
-
-            print(f"[Watcher] StatefulSet '{statefulset_name}' encontrado com {len(ops)} operação(ões).")
-            for op in ops:
-                print(f"[Watcher] Reaplicando operação: {op}")
-                self.executeOperation(self.node_objects[pod_name], pod_name, op)
-            self.nodes[pod_name]["redo_operations"] = False
+            with ExitStack() as stack:
+                # each switch commits the ports it regains as one transaction
+                for pod_name in switches:
+                    stack.enter_context(self.node_objects[pod_name].batch())
+                failures = runReplayPlan(steps, lambda step: self.__runStep(step, bridges), self.max_workers)
+        except RuntimeError as e:
+            print(f"[Watcher] Falha ao aplicar a transação do Open vSwitch: {e}")
+            failures = []
+            for pod_name in switches:
+                if pod_name in self.nodes and pod_name in known:
+                    self.nodes[pod_name]["redo_operations"] = True
+        for step, error in failures:
+            print(f"[Watcher] Falha em {step}: {error}")
+            # a pod that never became ready is retried on its next event
+            if step.operation is None and step.pod_name in self.nodes and step.pod_name in known:
+                self.nodes[step.pod_name]["redo_operations"] = True
+        print(f"[Watcher] Reaplicação de {known} concluída em {time.time() - start:.2f}s")
+
+
+    # Brief: Run one replay step.
+    # Params:
+    #   ReplayStep step: Step to run.
+    #   set bridges: Pods whose bridge must be recreated if they are switches.
+    # Returns:
+    #   None
+    def __runStep(self, step, bridges):
+        if step.operation is not None:
+            self.executeOperation(self.node_objects[step.pod_name], step.pod_name, step.operation)
+            return
+
+        if not self.waitUntilReady(step.pod_name, self.ready_timeout):
+            raise TimeoutError(f"Pod {step.pod_name} não ficou pronto em {self.ready_timeout}s.")
+        node = self.node_objects.get(step.pod_name)
+        if step.pod_name in bridges and hasattr(node, "_createBridge"):
+            node._createBridge()
+            print(f"[Watcher] Bridge criada no switch {step.pod_name}")
 
-        except client.exceptions.ApiException as e:
-            print(f"[Watcher] Erro ao buscar StatefulSet '{statefulset_name}': {e}")
 
+    # Brief: Read the operations recorded for a pod in one call.
+    # Falls back to the "lft/operations" StatefulSet annotation written by older versions.
+    # Params:
+    #   string pod_name: Name of the pod.
+    # Returns:
+    #   List of operations
+    def __readOperations(self, pod_name):
+        journal = OperationJournal(namespace=self.namespace, api=K8sClientContext().core_api)
+        ops = journal.operations(pod_name)
+        if ops is not None:
+            return ops
 
+        statefulset = K8sClientContext().apps_api.read_namespaced_stateful_set(
+            name=pod_name[:-2],  # remove "-0"
+            namespace=self.namespace
+        )
+        annotations = statefulset.metadata.annotations or {}
+        return json.loads(annotations.get("lft/operations", "[]"))
 
 
     # Brief: Execute a specific operation on a node.
@@ -222,18 +519,17 @@ class K8sWatcher:
     def executeOperation(self, node, pod_name, operation):
         print(f"[Watcher] Executando operação '{operation}' no pod '{pod_name}'") 
 
-        if node.__class__.__name__ == 'K8sSwitch':
-            node._createBridge()
-            print(f"[Watcher] Bridge criada no switch {pod_name}")
-
-
         match operation["op"]:
             case "connect":
-                node.connect(operation["peer"], operation["interface_name"], operation["peer_interface_name"], reconnect=True)
+                # the peer object also attaches its end to its bridge if it is a switch
+                peer = self.node_objects.get(operation["peer"], operation["peer"])
+                node.connect(peer, operation["interface_name"], operation["peer_interface_name"], reconnect=True)
             case "setIp":
                 node.setIp(operation["ip"], operation["mask"], operation["interface"], reconnect=True)
             case "setDefaultGateway":
                 node.setDefaultGateway(operation["gateway_ip"], operation["iface_peer"], reconnect=True)
+            case "addRoute":
+                node.addRoute(operation["ip"], operation["mask"], operation["interface"], reconnect=True)
             case "setController":
                 node.setController(operation["controller_ip"], operation["controller_port"], operation["protocol"], reconnect=True)
             case "initController":
@@ -15,10 +15,14 @@
 
 from .node import Node
 from .host import Host
+from .netnshost import NetnsHost
 from .controller import Controller
 from .switch import Switch
 from .ue import UE
 from .epc import EPC
 from .enb import EnB
+from .images import warmupImages
+from .execution import CommandExecutor, CommandResult, gather
+from .topology import Topology
 
-__all__ = [Node, Host, Controller, Switch, UE, EPC, EnB]
\ No newline at end of file
+__all__ = [Node, Host, NetnsHost, Controller, Switch, UE, EPC, EnB, warmupImages, CommandExecutor, CommandResult, gather, Topology]
\ No newline at end of file
@@ -37,9 +37,8 @@ class CICFlowMeter(Node):
     # Return:
     #   None
     def instantiate(self, image='alexandremitsurukaihara/lst2.0:cicflowmeter') -> None:
-        mount = ''
-        if self.__mount: mount = f'-v {self.__hostPath}:{self.__containerPath}'
-        super().instantiate(dockerCommand=f"docker run -d --network=none --privileged {mount} --name={self.getNodeName()} {image}")
+        binds = [f'{self.__hostPath}:{self.__containerPath}'] if self.__mount else None
+        super().instantiate(dockerImage=image, dns='', binds=binds)
         
     # Brief: Convert pcaps into csv of flows
     # Params:
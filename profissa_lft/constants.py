@@ -9,6 +9,7 @@ PRIVILEGED = "--privileged"
 DNS = "--dns"
 MEMORY = "--memory"
 CPUS = "--cpus"
+VOLUME = "-v"
 
 # UE config file
 RF_SECTION = "rf"
@@ -0,0 +1,288 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import http.client
+import io
+import json
+import os
+import socket
+import struct
+import tarfile
+import threading
+from urllib.parse import quote, urlencode
+from .exceptions import DockerApiError
+
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+
+# Brief: HTTP connection over the Docker daemon unix socket
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout=None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.__path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.__path)
+        self.sock = sock
+
+
+# Brief: Docker Engine API client used by the Docker backend instead of forking the docker CLI
+# Every thread keeps one keep-alive HTTP connection to the daemon socket, so a
+# container action costs one request on an open connection instead of a
+# docker process. Callers keep their CLI path as a fallback for when the socket
+# is not reachable.
+class DockerEngine:
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instanceLock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance.__initialized = False
+        return cls._instance
+
+    def __init__(self, path=None) -> None:
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.path = path or os.environ.get("DOCKER_SOCKET", DOCKER_SOCKET)
+        self.__local = threading.local()
+
+    # Brief: Verifies if the Engine API can be used
+    # Params:
+    # Return:
+    #   True if the daemon socket is reachable by this process and LFT_DOCKER_API is not set to 0
+    @staticmethod
+    def available() -> bool:
+        path = os.environ.get("DOCKER_SOCKET", DOCKER_SOCKET)
+        return os.environ.get("LFT_DOCKER_API", "1") != "0" and os.path.exists(path) and os.access(path, os.R_OK | os.W_OK)
+
+    # Brief: Creates a container
+    # Params:
+    #   String name: Name of the container
+    #   String image: Image of the container
+    #   List<str> command: Command of the container, None keeps the image default
+    #   bool privileged: Run the container privileged
+    #   String network: Network mode, "none" for nodes wired by LFT
+    #   String dns: DNS server, '' keeps the daemon default
+    #   String memory: Memory limit such as "512m", '' for no limit
+    #   String cpus: CPU limit such as "0.5", '' for no limit
+    #   List<str> binds: Bind mounts as "hostPath:containerPath"
+    # Return:
+    #   String ID of the container
+    def create(self, name: str, image: str, command=None, privileged=True, network="none", dns='', memory='', cpus='', binds=None) -> str:
+        hostConfig = {"Privileged": privileged, "NetworkMode": network}
+        if dns:
+            hostConfig["Dns"] = [dns]
+        if memory:
+            hostConfig["Memory"] = parseBytes(memory)
+        if cpus:
+            hostConfig["NanoCpus"] = int(float(cpus) * 1e9)
+        if binds:
+            hostConfig["Binds"] = list(binds)
+        body = {"Image": image, "HostConfig": hostConfig, "Tty": False, "OpenStdin": False}
+        if command:
+            body["Cmd"] = list(command)
+        return self.__request("POST", f"/containers/create?{urlencode({'name': name})}", body)["Id"]
+
+    # Brief: Starts a container
+    # Params:
+    #   String name: Name or ID of the container
+    # Return:
+    #   None
+    def start(self, name: str) -> None:
+        self.__request("POST", f"/containers/{quote(name)}/start")
+
+    # Brief: Runs a command inside a container and waits for it
+    # Params:
+    #   String name: Name or ID of the container
+    #   List<str> command: Command and its arguments
+    #   bool stderr: Also collect the standard error
+    # Return:
+    #   Tuple (stdout, stderr, exit code)
+    def exec(self, name: str, command: list, stderr=True) -> tuple:
+        execId = self.__request("POST", f"/containers/{quote(name)}/exec",
+                                {"AttachStdout": True, "AttachStderr": stderr, "Tty": False, "Cmd": list(command)})["Id"]
+        raw = self.__request("POST", f"/exec/{execId}/start", {"Detach": False, "Tty": False}, raw=True)
+        out, err = demultiplex(raw)
+        exitCode = self.__request("GET", f"/exec/{execId}/json")["ExitCode"]
+        return out.decode("utf8", errors="replace"), err.decode("utf8", errors="replace"), exitCode
+
+    # Brief: Inspects a container
+    # Params:
+    #   String name: Name or ID of the container
+    # Return:
+    #   Dictionary with the container state, None if it does not exist
+    def inspect(self, name: str):
+        try:
+            return self.__request("GET", f"/containers/{quote(name)}/json")
+        except DockerApiError as ex:
+            if ex.status == 404:
+                return None
+            raise
+
+    # Brief: Copies a local file or directory into a container, like docker cp
+    # Params:
+    #   String name: Name or ID of the container
+    #   String path: Local path
+    #   String destPath: Path inside the container (path+filename)
+    # Return:
+    #   None
+    def putArchive(self, name: str, path: str, destPath: str) -> None:
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            tar.add(path, arcname=os.path.basename(destPath.rstrip("/")))
+        directory = os.path.dirname(destPath.rstrip("/")) or "/"
+        self.__request("PUT", f"/containers/{quote(name)}/archive?{urlencode({'path': directory})}",
+                       buffer.getvalue(), contentType="application/x-tar")
+
+    # Brief: Copies a file or directory out of a container, like docker cp
+    # Params:
+    #   String name: Name or ID of the container
+    #   String path: Path inside the container
+    #   String destPath: Local path (path+filename)
+    # Return:
+    #   None
+    def getArchive(self, name: str, path: str, destPath: str) -> None:
+        raw = self.__request("GET", f"/containers/{quote(name)}/archive?{urlencode({'path': path})}", raw=True)
+        with tarfile.open(fileobj=io.BytesIO(raw), mode="r") as tar:
+            members = tar.getmembers()
+            root = members[0].name.split("/")[0] if members else ""
+            for member in members:
+                # the archive root is renamed to destPath, like docker cp does
+                relative = member.name[len(root):].lstrip("/")
+                target = os.path.join(destPath, relative) if relative else destPath
+                if member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                elif member.isfile():
+                    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+                    with tar.extractfile(member) as source, open(target, "wb") as f:
+                        f.write(source.read())
+
+    # Brief: Removes a container, killing it first if it is running
+    # Params:
+    #   String name: Name or ID of the container
+    # Return:
+    #   None
+    def remove(self, name: str) -> None:
+        self.__request("DELETE", f"/containers/{quote(name)}?force=1")
+
+    # Brief: Verifies if an image exists locally
+    # Params:
+    #   String image: Tag of the image
+    # Return:
+    #   True if the image exists
+    def imageExists(self, image: str) -> bool:
+        try:
+            self.__request("GET", f"/images/{quote(image, safe='')}/json")
+            return True
+        except DockerApiError as ex:
+            if ex.status == 404:
+                return False
+            raise
+
+    # Brief: Pulls an image and waits for the pull to finish
+    # Params:
+    #   String image: Tag of the image
+    # Return:
+    #   None
+    def pull(self, image: str) -> None:
+        repository, tag = image, "latest"
+        if ":" in image.rsplit("/", 1)[-1]:
+            repository, tag = image.rsplit(":", 1)
+        raw = self.__request("POST", f"/images/create?{urlencode({'fromImage': repository, 'tag': tag})}", raw=True)
+        # errors after the pull started are reported inside the progress stream
+        decoder = json.JSONDecoder()
+        text, index = raw.decode("utf8", errors="replace"), 0
+        while index < len(text):
+            while index < len(text) and text[index].isspace():
+                index += 1
+            if index >= len(text):
+                break
+            message, index = decoder.raw_decode(text, index)
+            if "error" in message:
+                raise DockerApiError(500, message["error"])
+
+    # Brief: Sends a request on the connection of the calling thread, reconnecting once if it was closed
+    # Params:
+    #   String method: HTTP method
+    #   String path: Request path
+    #   body: JSON-serializable body, raw bytes or None
+    #   bool raw: Return the raw response body instead of decoding JSON
+    #   String contentType: Content type of a raw body
+    # Return:
+    #   Decoded JSON response (None if empty) or raw bytes
+    def __request(self, method: str, path: str, body=None, raw=False, contentType="application/json"):
+        if body is not None and not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode()
+        headers = {"Content-Type": contentType} if body is not None else {}
+        for attempt in (0, 1):
+            connection = getattr(self.__local, "connection", None)
+            if connection is None:
+                connection = self.__local.connection = UnixHTTPConnection(self.path)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError, BrokenPipeError) as ex:
+                # the daemon closed the idle keep-alive connection
+                connection.close()
+                self.__local.connection = None
+                if attempt:
+                    raise DockerApiError(0, str(ex))
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode("utf8", errors="replace")
+            raise DockerApiError(response.status, message)
+        if raw:
+            return data
+        return json.loads(data) if data else None
+
+
+# Brief: Splits the multiplexed stream of a non-tty exec into stdout and stderr
+# Params:
+#   bytes raw: Stream made of frames with an 8-byte header (stream type, payload size)
+# Return:
+#   Tuple (stdout bytes, stderr bytes)
+def demultiplex(raw: bytes) -> tuple:
+    streams = {1: bytearray(), 2: bytearray()}
+    index = 0
+    while index + 8 <= len(raw):
+        streamType, size = struct.unpack(">BxxxL", raw[index:index + 8])
+        streams.setdefault(streamType, bytearray()).extend(raw[index + 8:index + 8 + size])
+        index += 8 + size
+    return bytes(streams[1]), bytes(streams[2])
+
+
+# Brief: Converts a docker memory string to bytes
+# Params:
+#   String memory: Memory such as "512m" or "1g"
+# Return:
+#   int bytes
+def parseBytes(memory: str) -> int:
+    units = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    memory = str(memory).strip().lower()
+    if memory and memory[-1] in units:
+        return int(float(memory[:-1]) * units[memory[-1]])
+    return int(memory)
@@ -28,4 +28,28 @@ class NodeInstantiationFailed(Exception):
 
 # Brief: This exception is related to the creation of a 
 class InvalidNodeName(Exception):
-    pass
\ No newline at end of file
+    pass
+
+# Brief: This exception gathers the errors of one or more failed netlink operations
+class NetlinkOperationFailed(Exception):
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("; ".join(f"{description}: {str(ex)}" for description, ex in errors))
+
+# Brief: This exception gathers the errors reported by ovsdb-server for a failed OVSDB request
+class OvsdbOperationFailed(Exception):
+    def __init__(self, errors: list):
+        self.errors = errors
+        super().__init__("; ".join(f"{e.get('error')}: {e.get('details', '')}" if isinstance(e, dict) else str(e) for e in errors))
+
+# Brief: This exception is related to a request refused by the Docker Engine API
+class DockerApiError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        super().__init__(f"{status}: {message}")
+
+# Brief: This exception gathers the commands that exited with a non-zero code inside containers
+class CommandFailed(Exception):
+    def __init__(self, results: list):
+        self.results = results
+        super().__init__("; ".join(f"{r.nodeName}: '{r.command}' exited with {r.exitCode}: {r.stderr.strip()}" for r in results))
@@ -0,0 +1,164 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from .dockerapi import DockerEngine
+from .exceptions import CommandFailed
+
+
+# Brief: Outcome of a command run inside a container
+class CommandResult:
+    def __init__(self, nodeName: str, command: str, stdout: str, stderr: str, exitCode: int, duration: float) -> None:
+        self.nodeName = nodeName
+        self.command = command
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exitCode = exitCode
+        self.duration = duration
+
+    # Brief: Verifies if the command succeeded
+    # Params:
+    # Return:
+    #   True if the exit code is 0
+    def ok(self) -> bool:
+        return self.exitCode == 0
+
+    def __repr__(self) -> str:
+        return f"CommandResult({self.nodeName!r}, {self.command!r}, exitCode={self.exitCode}, duration={self.duration:.3f})"
+
+
+# Brief: Runs container commands with a global and a per-node concurrency cap
+# Commands wait in a queue of their node and are handed to the shared pool only
+# while the node has a free slot, so no pool thread is left blocked on a busy
+# node and a thousand commands never turn into a thousand docker processes.
+# Each command is run by the execute function of its node (one Engine API exec
+# for containers) and its future resolves to a CommandResult.
+class CommandExecutor:
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instanceLock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance.__initialized = False
+        return cls._instance
+
+    # Brief: Constructor of the executor, only the first call configures it
+    # Params:
+    #   int maxWorkers: Maximum number of commands running at once on this host (default: LFT_EXEC_WORKERS or 32)
+    #   int perNode: Maximum number of commands running at once in one container (default: LFT_EXEC_PER_NODE or 4)
+    # Return:
+    #   None
+    def __init__(self, maxWorkers=None, perNode=None) -> None:
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.maxWorkers = maxWorkers or int(os.environ.get("LFT_EXEC_WORKERS", "32"))
+        self.perNode = perNode or int(os.environ.get("LFT_EXEC_PER_NODE", "4"))
+        self.__pool = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="lft-exec")
+        self.__lock = threading.Lock()
+        self.__queues = dict()
+        self.__running = dict()
+
+    # Brief: Queues a command to run inside a container
+    # Params:
+    #   String nodeName: Name of the container
+    #   String command: Shell command, run with bash -c
+    #   int timeout: Seconds after which the command is killed (exit code 124), None for no limit
+    #   function execute: Runs an argument list in the node and returns (stdout, stderr, exit code), docker exec if None
+    # Return:
+    #   Future resolving to a CommandResult
+    def submit(self, nodeName: str, command: str, timeout=None, execute=None) -> Future:
+        future = Future()
+        with self.__lock:
+            self.__queues.setdefault(nodeName, deque()).append((future, command, timeout, execute))
+        self.__dispatch(nodeName)
+        return future
+
+    # Brief: Hands queued commands of a node to the pool while the node has free slots
+    # Params:
+    #   String nodeName: Name of the container
+    # Return:
+    #   None
+    def __dispatch(self, nodeName: str) -> None:
+        while True:
+            with self.__lock:
+                queue = self.__queues.get(nodeName)
+                if not queue or self.__running.get(nodeName, 0) >= self.perNode:
+                    return
+                future, command, timeout, execute = queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.__running[nodeName] = self.__running.get(nodeName, 0) + 1
+            self.__pool.submit(self.__execute, future, nodeName, command, timeout, execute)
+
+    # Brief: Runs one command and resolves its future, then frees the slot of the node
+    # Params:
+    #   Future future: Future of the command
+    #   String nodeName: Name of the container
+    #   String command: Shell command
+    #   int timeout: Seconds after which the command is killed, None for no limit
+    #   function execute: Runs an argument list in the node, docker exec if None
+    # Return:
+    #   None
+    def __execute(self, future: Future, nodeName: str, command: str, timeout, execute) -> None:
+        try:
+            argv = ["bash", "-c", command]
+            if timeout is not None:
+                argv = ["timeout", str(timeout)] + argv
+            start = time.time()
+            if execute is not None:
+                stdout, stderr, exitCode = execute(argv)
+            elif DockerEngine.available():
+                stdout, stderr, exitCode = DockerEngine().exec(nodeName, argv)
+            else:
+                out = subprocess.run(["docker", "exec", nodeName] + argv, capture_output=True)
+                stdout, stderr, exitCode = out.stdout.decode("utf8", errors="replace"), out.stderr.decode("utf8", errors="replace"), out.returncode
+            future.set_result(CommandResult(nodeName, command, stdout, stderr, exitCode, time.time() - start))
+        except Exception as ex:
+            future.set_exception(ex)
+        finally:
+            with self.__lock:
+                self.__running[nodeName] -= 1
+                if not self.__queues.get(nodeName) and self.__running[nodeName] == 0:
+                    self.__queues.pop(nodeName, None)
+                    self.__running.pop(nodeName, None)
+            self.__dispatch(nodeName)
+
+
+# Brief: Waits for command futures and collects their results in order
+# Params:
+#   List<Future> futures: Futures returned by Node.submit or Node.runs
+#   int timeout: Maximum time to wait for all of them, in seconds (None for no limit)
+#   bool check: Raise CommandFailed if any command exits with a non-zero code
+# Return:
+#   List<CommandResult> in the order of futures
+def gather(futures: list, timeout=None, check=False) -> list:
+    futures = list(futures)
+    done, pending = wait(futures, timeout=timeout)
+    if pending:
+        raise TimeoutError(f"{len(pending)} of {len(futures)} commands did not finish within {timeout} seconds")
+    results = [future.result() for future in futures]
+    failed = [result for result in results if not result.ok()]
+    if check and failed:
+        raise CommandFailed(failed)
+    return results
@@ -0,0 +1,92 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .dockerapi import DockerEngine
+
+
+# images known to be present locally, so instantiate does not inspect them again
+_present = set()
+_presentLock = threading.Lock()
+
+
+# Brief: Verifies if an image exists locally, remembering the images found
+# Params:
+#   String image: Tag of the Docker image
+# Return:
+#   True if the image exists locally
+def imagePresent(image: str) -> bool:
+    with _presentLock:
+        if image in _present:
+            return True
+    if DockerEngine.available():
+        if not DockerEngine().imageExists(image):
+            return False
+    elif subprocess.run(["docker", "image", "inspect", image], capture_output=True).returncode != 0:
+        return False
+    with _presentLock:
+        _present.add(image)
+    return True
+
+
+# Brief: Pulls an image from a Docker Hub repository and waits for it
+# Params:
+#   String image: Tag of the Docker image
+# Return:
+#   None, raises an Exception if the pull failed
+def pullImage(image: str) -> None:
+    if DockerEngine.available():
+        DockerEngine().pull(image)
+    else:
+        out = subprocess.run(["docker", "pull", image], capture_output=True)
+        if out.returncode != 0:
+            raise Exception(out.stderr.decode('utf8').strip())
+    with _presentLock:
+        _present.add(image)
+
+
+# Brief: Pulls the images of a planned topology in parallel before instantiating it
+# Images already present are not pulled again. The pull time of each image is
+# returned so it can be reported apart from deploy-time measurements.
+# Params:
+#   List<str> images: Images to pull (duplicates are ignored)
+#   int maxWorkers: Maximum number of concurrent pulls
+# Return:
+#   Dictionary mapping each image to its pull time in seconds (0.0 if it was already present, None if the pull failed)
+def warmupImages(images: list, maxWorkers=8) -> dict:
+    def pull(image):
+        if imagePresent(image):
+            return 0.0
+        start = time.time()
+        try:
+            pullImage(image)
+        except Exception as ex:
+            logging.error(f"Error pulling {image} image: {str(ex)}")
+            return None
+        return time.time() - start
+
+    images = sorted(set(images))
+    if not images:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(images))) as pool:
+        times = dict(zip(images, pool.map(pull, images)))
+    for image, seconds in times.items():
+        logging.info(f"Image {image} {'failed to pull' if seconds is None else f'ready in {seconds:.2f}s'}")
+    return times
@@ -0,0 +1,117 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import subprocess
+from .netlink import LinkEngine
+
+
+# Brief: Addresses, routes and link-ups of one network namespace, applied together
+# The changes keep their order and are applied with a single netlink burst, or
+# a single "ip -n <ns> -batch -" when pyroute2 is not usable, instead of one
+# ip process (or docker exec) per setting.
+class IpChangeSet:
+    def __init__(self) -> None:
+        self.changes = []
+
+    # Brief: Sets an interface up
+    # Params:
+    #   String interfaceName: Name of the interface
+    # Return:
+    #   The change set itself
+    def setUp(self, interfaceName: str):
+        self.changes.append(("up", interfaceName))
+        return self
+
+    # Brief: Assigns an IP address to an interface
+    # Params:
+    #   String interfaceName: Name of the interface
+    #   String ip: IP address
+    #   int mask: Integer that represents the network mask
+    # Return:
+    #   The change set itself
+    def addAddress(self, interfaceName: str, ip: str, mask: int):
+        self.changes.append(("address", interfaceName, ip, int(mask)))
+        return self
+
+    # Brief: Adds a route through an interface
+    # Params:
+    #   String ip: Destination network address
+    #   int mask: Prefix length of the destination, 0 for the default route
+    #   String interfaceName: Name of the interface to forward to
+    #   String gateway: Next hop, None for a directly connected destination
+    # Return:
+    #   The change set itself
+    def addRoute(self, ip: str, mask: int, interfaceName: str, gateway=None):
+        self.changes.append(("route", interfaceName, ip, int(mask), gateway))
+        return self
+
+    # Brief: Appends the changes of another change set
+    # Params:
+    #   IpChangeSet other: Changes to append
+    # Return:
+    #   The change set itself
+    def extend(self, other):
+        self.changes.extend(other.changes)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    # Brief: Returns the changes as iproute2 batch lines
+    # Params:
+    # Return:
+    #   List<str> ip commands without the leading "ip"
+    def commands(self) -> list:
+        lines = []
+        for change in self.changes:
+            if change[0] == "up":
+                lines.append(f"link set {change[1]} up")
+            elif change[0] == "address":
+                lines.append(f"address add {change[2]}/{change[3]} dev {change[1]}")
+            else:
+                destination = f"{change[2]}/{change[3]}" if change[3] > 0 else "default"
+                via = f" via {change[4]}" if change[4] is not None else ""
+                lines.append(f"route add {destination}{via} dev {change[1]}")
+        return lines
+
+    # Brief: Applies the changes inside a network namespace
+    # Params:
+    #   String namespace: Name of the namespace in /var/run/netns
+    # Return:
+    #   None, raises an Exception describing every failed change
+    def apply(self, namespace: str) -> None:
+        if not self.changes:
+            return
+        if LinkEngine.available():
+            try:
+                with LinkEngine().batch() as engine:
+                    for change in self.changes:
+                        if change[0] == "up":
+                            engine.setUp(change[1], namespace)
+                        elif change[0] == "address":
+                            engine.addAddress(change[1], change[2], change[3], namespace)
+                        else:
+                            engine.addRoute(change[2], change[3], change[1], change[4], namespace)
+            except Exception as ex:
+                logging.error(f"Error while applying {len(self)} network changes in {namespace}: {str(ex)}")
+                raise Exception(f"Error while applying {len(self)} network changes in {namespace}: {str(ex)}")
+            return
+        out = subprocess.run(["ip", "-n", namespace, "-force", "-batch", "-"], input="\n".join(self.commands()) + "\n",
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            logging.error(f"Error while applying {len(self)} network changes in {namespace}: {out.stderr.strip()}")
+            raise Exception(f"Error while applying {len(self)} network changes in {namespace}: {out.stderr.strip()}")
@@ -0,0 +1,297 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from .exceptions import NetlinkOperationFailed
+
+try:
+    from pyroute2 import IPRoute, NetNS
+except ImportError:
+    IPRoute = None
+    NetNS = None
+
+
+# Brief: In-process netlink engine for veth creation and namespace moves, shared by both backends
+# A namespace handle is opened once per node and reused, and every operation is
+# a direct netlink message instead of a forked ip/nsenter process. Namespaces are
+# referenced by PID (Kubernetes pods), by name in /var/run/netns (Docker nodes)
+# or by None for the root namespace. Callers keep their shell path as a fallback
+# for when pyroute2 is not installed or the process is not root.
+class LinkEngine:
+    _instance = None
+    _instanceLock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._instanceLock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance.__initialized = False
+        return cls._instance
+
+    def __init__(self) -> None:
+        if self.__initialized:
+            return
+        self.__initialized = True
+        self.__lock = threading.RLock()
+        self.__handles = {}
+        self.__root = None
+        self.__local = threading.local()
+
+    # Brief: Verifies if the netlink engine can be used
+    # Params:
+    # Return:
+    #   True if pyroute2 is installed, the process is root and LFT_NETLINK is not set to 0
+    @staticmethod
+    def available() -> bool:
+        return IPRoute is not None and os.geteuid() == 0 and os.environ.get("LFT_NETLINK", "1") != "0"
+
+    # Brief: Collects the errors of every operation run inside the block and raises them together
+    # Params:
+    # Return:
+    #   None, raises NetlinkOperationFailed at the end of the block if any operation failed
+    @contextmanager
+    def batch(self):
+        outer = getattr(self.__local, "errors", None)
+        self.__local.errors = [] if outer is None else outer
+        try:
+            yield self
+        finally:
+            errors = self.__local.errors
+            self.__local.errors = outer
+        if outer is None and errors:
+            raise NetlinkOperationFailed(errors)
+
+    # Brief: Creates a veth pair and moves each end to its namespace, bringing both up
+    # Params:
+    #   String name: Name of the first end
+    #   String peerName: Name of the second end
+    #   ns: Namespace of the first end (PID, netns name or None for the root namespace)
+    #   peerNs: Namespace of the second end
+    #   bool up: Set both ends up after moving them
+    # Return:
+    #   None
+    def createVethPair(self, name: str, peerName: str, ns=None, peerNs=None, up=True) -> None:
+        def create():
+            ipr = self.__rootHandle()
+            ipr.link("add", ifname=name, kind="veth", peer=peerName)
+            location = {name: None, peerName: None}
+            try:
+                for ifname, target in ((name, ns), (peerName, peerNs)):
+                    if target is not None:
+                        self.__move(ipr, ifname, target)
+                        location[ifname] = target
+                    if up:
+                        handle = self.__handle(target)
+                        handle.link("set", index=self.__index(handle, ifname), state="up")
+            except Exception:
+                # do not leave a half-configured pair behind, deleting one end removes both
+                self.__quietDelete(name, location[name])
+                raise
+        self.__apply(f"create veth pair {name}<->{peerName}", create)
+
+    # Brief: Moves an interface from the root namespace to another namespace
+    # Params:
+    #   String ifname: Name of the interface
+    #   ns: Target namespace (PID or netns name)
+    #   String newName: Rename the interface while moving it
+    #   bool up: Set the interface up in the target namespace
+    # Return:
+    #   None
+    def moveToNamespace(self, ifname: str, ns, newName=None, up=True) -> None:
+        def move():
+            self.__move(self.__rootHandle(), ifname, ns, newName)
+            if up:
+                handle = self.__handle(ns)
+                handle.link("set", index=self.__index(handle, newName or ifname), state="up")
+        self.__apply(f"move {ifname} to {ns}", move)
+
+    # Brief: Renames an interface, it must be down
+    # Params:
+    #   String ifname: Current name of the interface
+    #   String newName: New name of the interface
+    #   ns: Namespace of the interface
+    # Return:
+    #   None
+    def rename(self, ifname: str, newName: str, ns=None) -> None:
+        def rename():
+            handle = self.__handle(ns)
+            handle.link("set", index=self.__index(handle, ifname), ifname=newName)
+        self.__apply(f"rename {ifname} to {newName} in {ns}", rename)
+
+    # Brief: Sets an interface up
+    # Params:
+    #   String ifname: Name of the interface
+    #   ns: Namespace of the interface
+    # Return:
+    #   None
+    def setUp(self, ifname: str, ns=None) -> None:
+        def setUp():
+            handle = self.__handle(ns)
+            handle.link("set", index=self.__index(handle, ifname), state="up")
+        self.__apply(f"set {ifname} up in {ns}", setUp)
+
+    # Brief: Assigns an IP address to an interface
+    # Params:
+    #   String ifname: Name of the interface
+    #   String ip: IP address
+    #   int mask: Prefix length of the network mask
+    #   ns: Namespace of the interface
+    # Return:
+    #   None
+    def addAddress(self, ifname: str, ip: str, mask: int, ns=None) -> None:
+        def addAddress():
+            handle = self.__handle(ns)
+            handle.addr("add", index=self.__index(handle, ifname), address=ip, prefixlen=int(mask))
+        self.__apply(f"add {ip}/{mask} to {ifname} in {ns}", addAddress)
+
+    # Brief: Adds a route through an interface
+    # Params:
+    #   String ip: Destination network address
+    #   int mask: Prefix length of the destination, 0 for the default route
+    #   String ifname: Name of the interface to forward to
+    #   String gateway: Next hop, None for a directly connected destination
+    #   ns: Namespace of the interface
+    # Return:
+    #   None
+    def addRoute(self, ip: str, mask: int, ifname: str, gateway=None, ns=None) -> None:
+        def addRoute():
+            handle = self.__handle(ns)
+            kwargs = {"dst": ip, "dst_len": int(mask)} if int(mask) > 0 else {}
+            if gateway is not None:
+                kwargs["gateway"] = gateway
+            else:
+                # like "ip route add ... dev", a directly connected destination has link scope
+                kwargs["scope"] = 253
+            handle.route("add", oif=self.__index(handle, ifname), **kwargs)
+        self.__apply(f"add route {ip}/{mask} via {gateway or ifname} in {ns}", addRoute)
+
+    # Brief: Deletes an interface, doing nothing if it does not exist
+    # Params:
+    #   String ifname: Name of the interface
+    #   ns: Namespace of the interface
+    # Return:
+    #   None
+    def deleteLink(self, ifname: str, ns=None) -> None:
+        def delete():
+            handle = self.__handle(ns)
+            indexes = handle.link_lookup(ifname=ifname)
+            if indexes:
+                handle.link("del", index=indexes[0])
+        self.__apply(f"delete {ifname} in {ns}", delete)
+
+    # Brief: Closes the handle of a namespace
+    # Params:
+    #   ns: Namespace to release
+    # Return:
+    #   None
+    def release(self, ns) -> None:
+        with self.__lock:
+            handle = self.__handles.pop(self.__path(ns), None)
+        if handle is not None:
+            handle.close()
+
+    # Brief: Closes every open handle
+    # Params:
+    # Return:
+    #   None
+    def closeAll(self) -> None:
+        with self.__lock:
+            handles = list(self.__handles.values())
+            self.__handles.clear()
+            root, self.__root = self.__root, None
+        for handle in handles + ([root] if root is not None else []):
+            handle.close()
+
+    # Brief: Runs an operation, collecting its error if a batch is active
+    # Params:
+    #   String description: Description of the operation used in error messages
+    #   function operation: Operation to run
+    # Return:
+    #   None
+    def __apply(self, description: str, operation) -> None:
+        try:
+            operation()
+        except Exception as ex:
+            logging.error(f"Netlink operation failed ({description}): {str(ex)}")
+            errors = getattr(self.__local, "errors", None)
+            if errors is None:
+                raise NetlinkOperationFailed([(description, ex)])
+            errors.append((description, ex))
+
+    def __move(self, ipr, ifname: str, ns, newName=None) -> None:
+        fd = os.open(self.__path(ns), os.O_RDONLY)
+        try:
+            kwargs = {"ifname": newName} if newName else {}
+            ipr.link("set", index=self.__index(ipr, ifname), net_ns_fd=fd, **kwargs)
+        finally:
+            os.close(fd)
+
+    def __quietDelete(self, ifname: str, ns) -> None:
+        try:
+            handle = self.__handle(ns)
+            indexes = handle.link_lookup(ifname=ifname)
+            if indexes:
+                handle.link("del", index=indexes[0])
+        except Exception:
+            pass
+
+    def __index(self, handle, ifname: str) -> int:
+        indexes = handle.link_lookup(ifname=ifname)
+        if not indexes:
+            raise Exception(f"Network interface {ifname} does not exist")
+        return indexes[0]
+
+    # Brief: Returns the path of a namespace reference
+    # Params:
+    #   ns: PID (int or digit string) or name in /var/run/netns
+    # Return:
+    #   Path to the namespace file
+    def __path(self, ns) -> str:
+        if isinstance(ns, int) or str(ns).isdigit():
+            return f"/proc/{ns}/ns/net"
+        if str(ns).startswith("/"):
+            return str(ns)
+        return f"/var/run/netns/{ns}"
+
+    def __rootHandle(self):
+        with self.__lock:
+            if self.__root is None:
+                self.__root = IPRoute()
+            return self.__root
+
+    # Brief: Returns the netlink handle of a namespace, opening it once and reusing it
+    # Params:
+    #   ns: Namespace reference or None for the root namespace
+    # Return:
+    #   IPRoute or NetNS handle
+    def __handle(self, ns):
+        if ns is None:
+            return self.__rootHandle()
+        path = self.__path(ns)
+        with self.__lock:
+            handle = self.__handles.get(path)
+            if handle is not None and os.path.lexists(path):
+                return handle
+            # namespaces whose owner is gone are closed before opening new ones
+            stale = [p for p in self.__handles if not os.path.lexists(p)]
+            for p in stale:
+                self.__handles.pop(p).close()
+            handle = NetNS(path)
+            self.__handles[path] = handle
+            return handle
@@ -0,0 +1,233 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import shutil
+import subprocess
+import time
+from .node import Node
+from .dockerapi import parseBytes
+from .exceptions import NodeInstantiationFailed
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_PARENT = "lft"
+MOUNT_NS_DIR = "/var/run/lft/mnt"
+
+
+# Brief: Host made of a bare network namespace instead of a container
+# It shares the filesystem and binaries of the machine, so a node costs a
+# namespace and a loopback interface instead of a container. Commands run with
+# "ip netns exec", which also bind-mounts /etc/netns/<name>/hosts over
+# /etc/hosts, so each host keeps its own hosts file. Memory and CPU limits put
+# the commands of the host in a cgroup v2 group. With the optional persistent
+# mount namespace the hosts file and /sys are mounted once inside it and the
+# commands enter both namespaces with nsenter, so the mounts they make are kept
+# between commands and stay private to the host.
+# The namespace is /var/run/netns/<name>, like the link of container nodes, so
+# connect, setIp and Topology work the same with both kinds of nodes.
+class NetnsHost(Node):
+    def __init__(self, nodeName: str) -> None:
+        super().__init__(nodeName)
+        self.__cgroup = None
+        self.__mountNamespace = None
+
+    # Brief: Creates the network namespace of the host
+    # Params:
+    #   String memory: It is the amount of memory allowed to the commands of the host (e.g. "512m"), '' for no limit
+    #   String cpus: It is the amount of cpu allowed to the commands of the host, can be a fractional value such as "0.5"
+    #   bool mountNamespace: Run the commands of the host in a persistent mount namespace of their own
+    #   instantiateArgs: Container options (dockerImage, dns...) accepted and ignored, so hosts can be swapped in Topology
+    # Return:
+    #   None
+    def instantiate(self, memory='', cpus='', mountNamespace=False, **instantiateArgs) -> None:
+        name = self.getNodeName()
+        try:
+            out = subprocess.run(["ip", "netns", "add", name], capture_output=True, text=True)
+            if out.returncode != 0 and "File exists" not in out.stderr:
+                raise Exception(out.stderr.strip())
+            subprocess.run(["ip", "-n", name, "link", "set", "lo", "up"], check=True)
+            os.makedirs(f"/etc/netns/{name}", exist_ok=True)
+            if not os.path.exists(f"/etc/netns/{name}/hosts"):
+                shutil.copy("/etc/hosts", f"/etc/netns/{name}/hosts")
+            if memory != '' or cpus != '':
+                self.__createCgroup(memory, cpus)
+            if mountNamespace:
+                self.__createMountNamespace()
+            if self.__cgroup is not None or self.__mountNamespace is not None:
+                # commands of limited or isolated hosts go through extra wrapping, make sure one runs
+                _, stderr, exitCode = self.execute(["true"])
+                if exitCode != 0:
+                    raise Exception(f"commands cannot run in the host: {stderr.strip()}")
+        except Exception as ex:
+            # nothing of a half created host is left behind
+            try:
+                self.delete()
+            except Exception:
+                pass
+            logging.error(f"Error while criating the namespace {name}: {str(ex)}")
+            raise NodeInstantiationFailed(f"Error while criating the namespace {name}: {str(ex)}")
+
+    # Brief: Deletes the namespace of the host, killing every process left in it
+    # Params:
+    # Return:
+    #   None
+    def delete(self) -> None:
+        name = self.getNodeName()
+        try:
+            pids = subprocess.run(["ip", "netns", "pids", name], capture_output=True, text=True).stdout.split()
+            if pids:
+                subprocess.run(["kill", "-9"] + pids, capture_output=True)
+            subprocess.run(["ip", "netns", "del", name], capture_output=True)
+            if self.__mountNamespace is not None:
+                subprocess.run(["umount", self.__mountNamespace], capture_output=True)
+                os.remove(self.__mountNamespace)
+                self.__mountNamespace = None
+            if self.__cgroup is not None:
+                self.__deleteCgroup()
+            shutil.rmtree(f"/etc/netns/{name}", ignore_errors=True)
+        except Exception as ex:
+            logging.error(f"Error while deleting the host {name}: {str(ex)}")
+            raise NodeInstantiationFailed(f"Error while deleting the host {name}: {str(ex)}")
+
+    # Brief: Runs a command inside the namespace without waiting for it, for long running processes
+    # Params:
+    #   String command: String containing the command to run inside the namespace
+    # Return:
+    #   Returns variable that contains stdout and stderr (more information in subprocess documentation)
+    def run(self, command: str) -> str:
+        try:
+            return subprocess.Popen(self.__wrap(["bash", "-c", command]), stdout=subprocess.PIPE, text=True)
+        except Exception as ex:
+            logging.error(f"Error executing command {command} in {self.getNodeName()}: {str(ex)}")
+            raise Exception(f"Error executing command {command} in {self.getNodeName()}: {str(ex)}")
+
+    # Brief: Runs a command inside the namespace and waits for it
+    # Params:
+    #   List<str> command: Command and its arguments
+    # Return:
+    #   Tuple (stdout, stderr, exit code)
+    def execute(self, command: list) -> tuple:
+        out = subprocess.run(self.__wrap(command), capture_output=True)
+        return out.stdout.decode("utf8", errors="replace"), out.stderr.decode("utf8", errors="replace"), out.returncode
+
+    # Brief: Copy local file, the host shares the local filesystem so it is a plain copy
+    # Params:
+    #   String path: Absolute or relative path to the file to be copied (path+filename)
+    #   String destPath: Absolute path to copy the file to (path+filename)
+    # Return:
+    def copyLocalToContainer(self, path: str, destPath: str) -> None:
+        self.__copy(path, destPath)
+
+    # Brief: Copy local file, the host shares the local filesystem so it is a plain copy
+    # Params:
+    #   String path: Absolute path to the file to be copied (path+filename)
+    #   String destPath: Absolute or relative path to copy the file to (path+filename)
+    # Return:
+    def copyContainerToLocal(self, path: str, destPath: str) -> None:
+        self.__copy(path, destPath)
+
+    def __copy(self, path: str, destPath: str) -> None:
+        try:
+            if os.path.isdir(path):
+                shutil.copytree(path, destPath, dirs_exist_ok=True)
+            else:
+                shutil.copy(path, destPath)
+        except Exception as ex:
+            logging.error(f"Error copying file from {path} to {destPath}: {str(ex)}")
+            raise Exception(f"Error copying file from {path} to {destPath}: {str(ex)}")
+
+    # Brief: Builds the argument list that runs a command inside the namespace, cgroup and mount namespace of the host
+    # Params:
+    #   List<str> command: Command and its arguments
+    # Return:
+    #   List<str> argument list to run on the machine
+    def __wrap(self, command: list) -> list:
+        if self.__mountNamespace is not None:
+            command = ["nsenter", f"--net=/var/run/netns/{self.getNodeName()}", f"--mount={self.__mountNamespace}"] + list(command)
+        else:
+            command = ["ip", "netns", "exec", self.getNodeName()] + list(command)
+        if self.__cgroup is not None:
+            # the cgroup is joined before entering the namespaces, whose fresh /sys has no /sys/fs/cgroup;
+            # the membership is inherited by the command
+            command = ["sh", "-c", f'echo $$ > {self.__cgroup}/cgroup.procs && exec "$@"', "sh"] + command
+        return command
+
+    # Brief: Creates the cgroup v2 group of the host with its memory and cpu limits
+    # Params:
+    #   String memory: Memory limit such as "512m", '' for no limit
+    #   String cpus: CPU limit such as "0.5", '' for no limit
+    # Return:
+    #   None
+    def __createCgroup(self, memory: str, cpus: str) -> None:
+        if not os.path.exists(f"{CGROUP_ROOT}/cgroup.controllers"):
+            raise Exception(f"memory and cpus limits need a cgroup v2 hierarchy mounted on {CGROUP_ROOT}")
+        parent = f"{CGROUP_ROOT}/{CGROUP_PARENT}"
+        os.makedirs(parent, exist_ok=True)
+        for directory in (CGROUP_ROOT, parent):
+            with open(f"{directory}/cgroup.subtree_control", "w") as f:
+                f.write("+memory +cpu")
+        cgroup = f"{parent}/{self.getNodeName()}"
+        os.makedirs(cgroup, exist_ok=True)
+        self.__cgroup = cgroup
+        if memory != '':
+            with open(f"{cgroup}/memory.max", "w") as f:
+                f.write(str(parseBytes(memory)))
+        if cpus != '':
+            period = 100000
+            with open(f"{cgroup}/cpu.max", "w") as f:
+                f.write(f"{int(float(cpus) * period)} {period}")
+
+    # Brief: Kills what is left in the cgroup of the host and removes it
+    # Params:
+    # Return:
+    #   None
+    def __deleteCgroup(self) -> None:
+        if os.path.exists(f"{self.__cgroup}/cgroup.kill"):
+            with open(f"{self.__cgroup}/cgroup.kill", "w") as f:
+                f.write("1")
+        # killed processes take a moment to leave the group
+        for _ in range(50):
+            try:
+                os.rmdir(self.__cgroup)
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise Exception(f"cgroup {self.__cgroup} is still busy")
+        self.__cgroup = None
+
+    # Brief: Creates a persistent mount namespace for the host, bound to a file like ip netns does for network namespaces
+    # The mounts "ip netns exec" would redo on every call (hosts file and /sys of the network namespace) are made once inside it
+    # Params:
+    # Return:
+    #   None
+    def __createMountNamespace(self) -> None:
+        os.makedirs(MOUNT_NS_DIR, exist_ok=True)
+        # the namespace file cannot be bound on a shared mount, so the directory is made a private mount once
+        if subprocess.run(["mountpoint", "-q", MOUNT_NS_DIR]).returncode != 0:
+            subprocess.run(["mount", "--bind", MOUNT_NS_DIR, MOUNT_NS_DIR], check=True)
+            subprocess.run(["mount", "--make-private", MOUNT_NS_DIR], check=True)
+        name = self.getNodeName()
+        path = f"{MOUNT_NS_DIR}/{name}"
+        open(path, "a").close()
+        self.__mountNamespace = path
+        subprocess.run(["unshare", f"--mount={path}", "--propagation", "private", "true"], check=True)
+        out = subprocess.run(self.__wrap(["sh", "-c", f"mount --bind /etc/netns/{name}/hosts /etc/hosts && umount -l /sys && mount -t sysfs {name} /sys"]),
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            raise Exception(f"could not prepare the mount namespace: {out.stderr.strip()}")
@@ -15,12 +15,22 @@
 
 
 import logging
+import os
+import re
+import shlex
 import subprocess
 import hashlib
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from configparser import ConfigParser
-import json
 from .exceptions import *
 from .constants import *
+from .netlink import LinkEngine
+from .images import imagePresent, pullImage
+from .dockerapi import DockerEngine
+from .execution import CommandExecutor
+from .ipchanges import IpChangeSet
 
 
 # Just to enable the declaration of Type in methods
@@ -40,6 +50,9 @@ class Node:
         self.__nodeName = nodeName
         self.memory = ''
         self.cpu = ''
+        self.__changes = None
+        self.__batchDepth = 0
+        self.__batchLock = threading.Lock()
 
     def __createTmpFolder(self) -> None:
         subprocess.run("mkdir -p /tmp/lft/", shell=True)
@@ -51,9 +64,10 @@ class Node:
     #   String DockerCommand: String to be used to instantiate the container instead of the standard command
     #   String memory: It is the amount of memory to be allocated to the container (e.g. "512m", which is 512 MB)
     #   String cpus: It is the amount of cpu dedicated to the container, can be a fractional value such as "0.5"
+    #   List<str> binds: Volumes to mount in the container as "hostPath:containerPath"
     # Return:
     #   None
-    def instantiate(self, dockerImage="alexandremitsurukaihara/lst2.0:host", dockerCommand='', dns='8.8.8.8', memory='', cpus='', runCommand='') -> None:
+    def instantiate(self, dockerImage="alexandremitsurukaihara/lst2.0:host", dockerCommand='', dns='8.8.8.8', memory='', cpus='', runCommand='', binds=None) -> None:
         command = []
         
         def addDockerRun():
@@ -72,7 +86,12 @@ class Node:
             command.append(PRIVILEGED)
 
         def addDNS(dns):
-            command.append(DNS + '=' + dns)
+            if dns != '':
+                command.append(DNS + '=' + dns)
+
+        def addVolumes(binds):
+            for bind in binds or []:
+                command.append(VOLUME + ' ' + bind)
 
         def addContainerMemory(memory):
             if memory != '': 
@@ -102,6 +121,7 @@ class Node:
             addContainerName()
             addPrivileged()
             addDNS(dns)
+            addVolumes(binds)
             addContainerMemory(memory)
             addContainerCPUs(cpus)
             addContainerImage(dockerImage)
@@ -110,6 +130,8 @@ class Node:
         try:    
             if dockerCommand != '':
                 subprocess.run(dockerCommand, shell=True, capture_output=True)            
+            elif DockerEngine.available():
+                self.__createContainer(dockerImage, dns, memory, cpus, runCommand, binds)
             else:
                 subprocess.run(buildCommand(), shell=True, capture_output=True)
         except Exception as ex:
@@ -118,16 +140,34 @@ class Node:
         
         self.__enableNamespace(self.getNodeName())
 
+    # Brief: Creates and starts the container through the Docker Engine API, with the same options as the docker run command
+    # Params:
+    #   String image: Tag of the Docker image
+    #   String dns: DNS server of the container
+    #   String memory: Amount of memory allocated to the container
+    #   String cpus: Amount of cpu dedicated to the container
+    #   String runCommand: Command of the container instead of the image default
+    #   List<str> binds: Volumes to mount in the container
+    # Return:
+    #   None
+    def __createContainer(self, image: str, dns: str, memory: str, cpus: str, runCommand: str, binds) -> None:
+        engine = DockerEngine()
+        try:
+            engine.create(self.getNodeName(), image, shlex.split(runCommand) or None, dns=dns, memory=memory, cpus=cpus, binds=binds)
+        except DockerApiError as ex:
+            # as with docker run, an existing container with this name is kept
+            if ex.status != 409:
+                raise
+            logging.warning(f"Container {self.getNodeName()} already exists: {str(ex)}")
+        engine.start(self.getNodeName())
+
     # Brief: Verifies if the image exists
     # Params:
     #   String image: Tag of the Docker image 
     # Return:
     #   True if the image exists locally
     def __imageExists(self, image: str) -> bool:
-        out = subprocess.run(f"docker inspect --type=image {image}", shell=True, capture_output=True)
-        outJson = json.loads(out.stdout.decode('utf-8'))
-        if outJson == []: return False
-        else: return True
+        return imagePresent(image)
 
             
     # Brief: Pulls the image from a Docker Hub repository
@@ -137,7 +177,7 @@ class Node:
     #   True if the image exists locally
     def __pullImage(self, image):
         try: 
-            subprocess.run(f"docker pull {image}", shell=True)
+            pullImage(image)
         except Exception as ex:
             logging.error(f"Error pulling non-existing {image} image: {str(ex)}")
             raise NodeInstantiationFailed(f"Error pulling non-existing {image} image: {str(ex)}")
@@ -150,7 +190,10 @@ class Node:
     #   None
     def delete(self) -> None:
         try:    
-            subprocess.run(f"docker kill {self.getNodeName()} && docker rm {self.getNodeName()}", shell=True, capture_output=True)
+            if DockerEngine.available():
+                DockerEngine().remove(self.getNodeName())
+            else:
+                subprocess.run(f"docker kill {self.getNodeName()} && docker rm {self.getNodeName()}", shell=True, capture_output=True)
         except Exception as ex:
             logging.error(f"Error while deleting the host {self.getNodeName()}: {str(ex)}")
             raise NodeInstantiationFailed(f"Error while deleting the host {self.getNodeName()}: {str(ex)}")
@@ -163,11 +206,42 @@ class Node:
     # Return:
     #   None
     def setIp(self, ip: str, mask: int, interfaceName: str) -> None:
-        if not self.__interfaceExists(interfaceName):
-            logging.error(f"Network interface {interfaceName} does not exist")
-            raise Exception(f"Network interface {interfaceName} does not exist")
+        self.__commit(IpChangeSet().addAddress(interfaceName, ip, mask))
 
-        self.__setIp(ip, mask, interfaceName)
+    # Brief: Collects the addresses, routes and link-ups set inside the block and applies them at once when the outermost block ends
+    # Blocks can be nested and shared by threads; the changes are applied with a
+    # single netlink burst or a single "ip -n <node> -batch -".
+    # Params:
+    # Return:
+    #   None, raises an Exception at the end of the block if any change failed
+    @contextmanager
+    def batch(self):
+        with self.__batchLock:
+            if self.__batchDepth == 0:
+                self.__changes = IpChangeSet()
+            self.__batchDepth += 1
+        try:
+            yield self
+        finally:
+            with self.__batchLock:
+                self.__batchDepth -= 1
+                changes = self.__changes if self.__batchDepth == 0 else None
+                if changes is not None:
+                    self.__changes = None
+        if changes is not None:
+            changes.apply(self.getNodeName())
+
+    # Brief: Applies network changes in the namespace of the node now, or adds them to the open batch
+    # Params:
+    #   IpChangeSet changes: Changes to apply
+    # Return:
+    #   None
+    def __commit(self, changes: IpChangeSet) -> None:
+        with self.__batchLock:
+            if self.__changes is not None:
+                self.__changes.extend(changes)
+                return
+        changes.apply(self.getNodeName())
 
     # Brief: Creates Linux virtual interfaces and connects peers to the nodes, in case of one of the nodes is a switch, it also creates a port in bridge
     # Params:
@@ -179,9 +253,12 @@ class Node:
             logging.error(f"Cannot connect to {node.getNodeName()}, {interfaceName} or {peerInterfaceName} already exists")
             raise Exception(f"Cannot connect to {node.getNodeName()}, {interfaceName} or {peerInterfaceName} already exists")
 
-        self.__create(interfaceName, peerInterfaceName)
-        self.__setInterface(self.getNodeName(), interfaceName)
-        self.__setInterface(node.getNodeName(), peerInterfaceName)
+        if LinkEngine.available():
+            LinkEngine().createVethPair(interfaceName, peerInterfaceName, self.getNodeName(), node.getNodeName())
+        else:
+            self.__create(interfaceName, peerInterfaceName)
+            self.__setInterface(self, interfaceName)
+            self.__setInterface(node, peerInterfaceName)
 
         if hasattr(self, '_Switch__createPort'):
             self._Switch__createPort(self.getNodeName(), interfaceName)
@@ -190,7 +267,7 @@ class Node:
     
     def connectToInternet(self, hostIP: str, hostMask: int, interfaceName: str, hostInterfaceName: str) -> None:
         self.__create(interfaceName, hostInterfaceName)
-        self.__setInterface(self.getNodeName(), interfaceName)
+        self.__setInterface(self, interfaceName)
         if hasattr(self, '_Switch__createPort'):
             self._Switch__createPort(self.getNodeName(), interfaceName)
         
@@ -207,7 +284,7 @@ class Node:
             
     def connectToInternetWithoutNAT(self, hostIP: str, hostMask: int, interfaceName: str, hostInterfaceName: str) -> None:
         self.__create(interfaceName, hostInterfaceName)
-        self.__setInterface(self.getNodeName(), interfaceName)
+        self.__setInterface(self, interfaceName)
         if self.__class__.__name__ == 'Switch':
             self._Switch__createPort(self.getNodeName(), interfaceName)
         
@@ -236,14 +313,7 @@ class Node:
     # Return:
     #   None
     def addRoute(self, ip: str, mask: int,  interfaceName: str):
-        if not self.__interfaceExists(interfaceName):
-            logging.error(f"Network interface {interfaceName} does not exist")
-            raise Exception(f"Network interface {interfaceName} does not exist")
-        try:
-            subprocess.run(f"docker exec {self.getNodeName()} ip route add {ip}/{mask} dev {interfaceName}", shell=True)
-        except Exception as ex:
-            logging.error(f"Error adding route {ip}/{mask} via {interfaceName} in {self.getNodeName()}: {str(ex)}")
-            raise Exception(f"Error adding route {ip}/{mask} via {interfaceName} in {self.getNodeName()}: {str(ex)}")
+        self.__commit(IpChangeSet().addRoute(ip, mask, interfaceName))
 
     # Brief: Add a route in routing table of host
     # Params:
@@ -267,18 +337,10 @@ class Node:
     # Return:
     #   None
     def setDefaultGateway(self, destinationIp: str, interfaceName: str) -> None:
-        if not self.__interfaceExists(interfaceName):
-            logging.error(f"Network interface {interfaceName} does not exist")
-            raise Exception(f"Network interface {interfaceName} does not exist")
-        
-        self.addRoute(destinationIp, 32, interfaceName)
-        try:
-            subprocess.run(f"docker exec {self.getNodeName()} route add default gw {destinationIp} dev {interfaceName}", shell=True)
-        except Exception as ex:
-            logging.error(f"Error while setting gateway {destinationIp} on device {interfaceName} in {self.getNodeName()}: {str(ex)}")
-            raise Exception(f"Error while setting gateway {destinationIp} on device {interfaceName} in {self.getNodeName()}: {str(ex)}")
+        # the gateway is reached through a /32 route on the interface, added in the same batch
+        self.__commit(IpChangeSet().addRoute(destinationIp, 32, interfaceName).addRoute("0.0.0.0", 0, interfaceName, destinationIp))
 
-    # Brief: Runs a command inside the container
+    # Brief: Runs a command inside the container without waiting for it, for long running processes
     # Params:
     #   String command: String containing the command to run inside the container
     # Return:
@@ -293,13 +355,23 @@ class Node:
             logging.error(f"Error executing command {command} in {self.getNodeName()}: {str(ex)}")
             raise Exception(f"Error executing command {command} in {self.getNodeName()}: {str(ex)}")
 
-    # Brief: Runs multiple commands inside the container
+    # Brief: Queues a command to run inside the container, bounded by the global and per-node caps of CommandExecutor
+    # Params:
+    #   String command: String containing the command to run inside the container
+    #   int timeout: Seconds after which the command is killed (exit code 124), None for no limit
+    # Return:
+    #   Future resolving to a CommandResult with stdout, stderr, exit code and duration
+    def submit(self, command: str, timeout=None) -> Future:
+        return CommandExecutor().submit(self.getNodeName(), command, timeout, self.execute)
+
+    # Brief: Runs multiple commands inside the container, bounded by the global and per-node caps of CommandExecutor
     # Params:
     #   List<String> commands: Runs multiple comands inside the container
+    #   int timeout: Seconds after which each command is killed, None for no limit
     # Return:
-    #   Returns a list with the variable that contains stdout and stderr (more information in subprocess documentation)
-    def runs(self, commands: list) -> list:
-        return [self.run(command) for command in commands]     
+    #   Returns a list of futures resolving to CommandResult (see gather)
+    def runs(self, commands: list, timeout=None) -> list:
+        return [self.submit(command, timeout) for command in commands]
 
     # Brief: Copy local file into container
     # Params:
@@ -308,7 +380,10 @@ class Node:
     # Return:
     def copyLocalToContainer(self, path: str, destPath: str) -> None:
         try:
-            subprocess.run(f"docker cp {path} {self.getNodeName()}:{destPath}", shell=True, capture_output=True)
+            if DockerEngine.available():
+                DockerEngine().putArchive(self.getNodeName(), path, destPath)
+            else:
+                subprocess.run(f"docker cp {path} {self.getNodeName()}:{destPath}", shell=True, capture_output=True)
         except Exception as ex:
             logging.error(f"Error copying file from {path} to {destPath}: {str(ex)}")
             raise Exception(f"Error copying file from {path} to {destPath}: {str(ex)}")
@@ -320,16 +395,28 @@ class Node:
     # Return:
     def copyContainerToLocal(self, path: str, destPath: str) -> None:
         try:
-            subprocess.run(f"docker cp {self.getNodeName()}:{path} {destPath}", shell=True, capture_output=True)
+            if DockerEngine.available():
+                DockerEngine().getArchive(self.getNodeName(), path, destPath)
+            else:
+                subprocess.run(f"docker cp {self.getNodeName()}:{path} {destPath}", shell=True, capture_output=True)
         except Exception as ex:
             logging.error(f"Error copying file from {path} to {destPath}: {str(ex)}")
             raise Exception(f"Error copying file from {path} to {destPath}: {str(ex)}")
 
     def __interfaceExists(self, interfaceName: str) -> bool:
-        out = subprocess.run(f"docker exec {self.getNodeName()} ip link | grep {interfaceName}", shell=True, capture_output=True)
-        if out.stdout.decode("utf8") != '':
-            return True
-        return False
+        out, _, _ = self.execute(["ip", "link"])
+        return interfaceName in re.findall(r"^\d+: ([^:@\s]+)", out, re.MULTILINE)
+
+    # Brief: Runs a command inside the container and waits for it, through the Docker Engine API when it is reachable
+    # Params:
+    #   List<str> command: Command and its arguments
+    # Return:
+    #   Tuple (stdout, stderr, exit code)
+    def execute(self, command: list) -> tuple:
+        if DockerEngine.available():
+            return DockerEngine().exec(self.getNodeName(), command)
+        out = subprocess.run(["docker", "exec", self.getNodeName()] + command, capture_output=True)
+        return out.stdout.decode("utf8"), out.stderr.decode("utf8"), out.returncode
 
     # Brief: Returns the name of the interface to be created on this node
     # Params:
@@ -339,20 +426,6 @@ class Node:
     def __getThisInterfaceName(self, node: Node) -> str:
         return self.getNodeName()+node.getNodeName()
 
-    # Brief: Set Ip to an interface
-    # Params:
-    #   String ip: IP address to be set to peerName interface
-    #   int mask: Integer that represents the network mask
-    #   String interfaceName: Name of the interface to set the ip
-    # Return:
-    #   None
-    def __setIp(self, ip: str, mask: int, interfaceName: str) -> None:
-        try:
-            subprocess.run(f"ip -n {self.getNodeName()} addr add {ip}/{mask} dev {interfaceName}", shell=True)
-        except Exception as ex:
-            logging.error(f"Error while setting IP {ip}/{mask} to virtual interface {interfaceName}: {str(ex)}")
-            raise Exception(f"Error while setting IP {ip}/{mask} to virtual interface {interfaceName}: {str(ex)}")
-
     # Brief: Returns the name of the interface to be created on other node
     # Params:
     #   Node node: Reference of another node to connect to
@@ -368,6 +441,9 @@ class Node:
     # Return:
     #   None
     def __create(self, peer1Name: str, peer2Name: str) -> None:
+        if LinkEngine.available():
+            LinkEngine().createVethPair(peer1Name, peer2Name, up=False)
+            return
         try:
             subprocess.run(f"ip link add {peer1Name} type veth peer name {peer2Name}", shell=True)
         except Exception as ex:
@@ -376,17 +452,21 @@ class Node:
 
     # Brief: Set the interface to node
     # Params:
-    #   String nodeName: Name of the node network namespace
+    #   Node node: Node whose network namespace receives the interface
     #   String peerName: Name of the interface to set to node
     # Return:
     #   None
-    def __setInterface(self, nodeName: str, peerName: str) -> None:
+    def __setInterface(self, node: Node, peerName: str) -> None:
+        if LinkEngine.available():
+            LinkEngine().moveToNamespace(peerName, node.getNodeName())
+            return
         try:
-            subprocess.run(f"ip link set {peerName} netns {nodeName}", shell=True)
-            subprocess.run(f"ip -n {nodeName} link set {peerName} up", shell=True)
+            subprocess.run(f"ip link set {peerName} netns {node.getNodeName()}", shell=True)
         except Exception as ex:
-            logging.error(f"Error while setting virtual interfaces {peerName} to {nodeName}: {str(ex)}")
-            raise Exception(f"Error while setting virtual interfaces {peerName} to {nodeName}: {str(ex)}")
+            logging.error(f"Error while setting virtual interfaces {peerName} to {node.getNodeName()}: {str(ex)}")
+            raise Exception(f"Error while setting virtual interfaces {peerName} to {node.getNodeName()}: {str(ex)}")
+        # the link-up joins the open batch of the node, if any
+        node.__commit(IpChangeSet().setUp(peerName))
 
     # Brief: Enable accessing the Docker node namespace directly
     # Params:
@@ -394,7 +474,15 @@ class Node:
     #   None
     def __enableNamespace(self, nodeName) -> None:
         try:    
-            subprocess.run(f"pid=$(docker inspect -f '{{{{.State.Pid}}}}' {nodeName}); mkdir -p /var/run/netns/; ln -sfT /proc/$pid/ns/net /var/run/netns/{nodeName}", shell=True)
+            if DockerEngine.available():
+                pid = DockerEngine().inspect(nodeName)["State"]["Pid"]
+                os.makedirs("/var/run/netns/", exist_ok=True)
+                link = f"/var/run/netns/{nodeName}"
+                if os.path.lexists(link):
+                    os.remove(link)
+                os.symlink(f"/proc/{pid}/ns/net", link)
+            else:
+                subprocess.run(f"pid=$(docker inspect -f '{{{{.State.Pid}}}}' {nodeName}); mkdir -p /var/run/netns/; ln -sfT /proc/$pid/ns/net /var/run/netns/{nodeName}", shell=True)
         except Exception as ex:
             logging.error(f"Error while deleting the host {self.getNodeName()}: {str(ex)}")
             raise Exception(f"Error while deleting the host {self.getNodeName()}: {str(ex)}")
@@ -404,8 +492,8 @@ class Node:
     # Return:
     #   Return a list with the name of all interfaces
     def __getAllInterfaces(self) -> list:
-        output = subprocess.run(f"docker exec {self.getNodeName()} ifconfig -a | sed 's/[ \t].*//;/^$/d'", shell=True, capture_output=True)
-        interfaces=output.stdout.decode('utf8').replace(":", '').split('\n')
+        output, _, _ = self.execute(["sh", "-c", "ifconfig -a | sed 's/[ \t].*//;/^$/d'"])
+        interfaces=output.replace(":", '').split('\n')
         return list(filter(None, interfaces)) # Remove empty strings
 
     # Brief: Verifies if the container is active
@@ -413,6 +501,9 @@ class Node:
     # Return:
     #   Return true if it is active or false otherwise
     def __isActive(self) -> bool:
+        if DockerEngine.available():
+            state = DockerEngine().inspect(self.getNodeName())
+            return state is not None and state["State"]["Running"]
         if subprocess.run(f"docker ps | grep {self.getNodeName()}'", shell=True, capture_output=True).stdout.decode('utf8') != '': return True
         return False
 
@@ -444,8 +535,8 @@ class Node:
         return h.hexdigest()
     
     def setHost(self, ip: str) -> None:
-        result = self.run(f"hostname")
-        hostname = result.stdout.read().replace("\n", "")
+        result = self.submit(f"hostname").result()
+        hostname = result.stdout.replace("\n", "")
         self.run(f"HOSTNAME=$(hostname) && echo \"{ip} {hostname}\" >> /etc/hosts")
 
     def acceptPacketsFromInterface(self, interfaceName: str):
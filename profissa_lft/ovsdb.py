@@ -0,0 +1,382 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from .exceptions import OvsdbOperationFailed
+
+
+DATABASE = "Open_vSwitch"
+SOCKET = "var/run/openvswitch/db.sock"
+
+_decoder = json.JSONDecoder()
+
+
+# Brief: OVSDB JSON-RPC client (RFC 7047) for the Open vSwitch of a switch node, shared by both backends
+# The switch's db.sock is reached from the host through /proc/<pid>/root of the
+# container, so reads and writes are JSON messages on a Unix socket instead of
+# an ovs-vsctl process forked by docker or kubectl exec. Monitors stream the
+# changes of the Port and Interface tables instead of polling them. Callers keep
+# their ovs-vsctl path as a fallback for when the socket is not reachable.
+class OvsdbClient:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.__socket = None
+        self.__buffer = b""
+        self.__nextId = 0
+        self.__lock = threading.Lock()
+
+    # Brief: Returns the path of the db.sock of a container, as seen from the host
+    # Params:
+    #   pid: PID of any process of the container
+    # Return:
+    #   Path to the socket
+    @staticmethod
+    def socketPath(pid) -> str:
+        return f"/proc/{pid}/root/{SOCKET}"
+
+    # Brief: Verifies if container sockets can be reached at all, before looking for one
+    # Params:
+    # Return:
+    #   True if the process is root and LFT_OVSDB is not set to 0
+    @staticmethod
+    def enabled() -> bool:
+        return os.geteuid() == 0 and os.environ.get("LFT_OVSDB", "1") != "0"
+
+    # Brief: Verifies if a db.sock can be used
+    # Params:
+    #   String path: Path to the socket
+    # Return:
+    #   True if the socket is reachable by this process and LFT_OVSDB is not set to 0
+    @staticmethod
+    def available(path: str) -> bool:
+        if not OvsdbClient.enabled():
+            return False
+        try:
+            return os.path.exists(path) and os.access(path, os.R_OK | os.W_OK)
+        except OSError:
+            return False
+
+    # Brief: Runs a transaction on the Open_vSwitch database
+    # Params:
+    #   List<dict> operations: OVSDB operations
+    # Return:
+    #   List with the result of each operation, raises OvsdbOperationFailed if the transaction failed
+    def transact(self, operations: list) -> list:
+        results = self.__call("transact", [DATABASE] + list(operations))
+        errors = [result for result in results if result and "error" in result]
+        if errors:
+            logging.error(f"OVSDB transaction failed on {self.path}: {errors}")
+            raise OvsdbOperationFailed(errors)
+        return results
+
+    # Brief: Lists the bridges of the switch
+    # Params:
+    # Return:
+    #   Sorted list of bridge names
+    def listBridges(self) -> list:
+        rows = self.transact([{"op": "select", "table": "Bridge", "where": [], "columns": ["name"]}])[0]["rows"]
+        return sorted(row["name"] for row in rows)
+
+    # Brief: Lists the ports of a bridge
+    # Params:
+    #   String bridge: Name of the bridge
+    # Return:
+    #   Sorted list of port names, the bridge's own internal port included
+    def listPorts(self, bridge: str) -> list:
+        bridges, ports = self.transact([
+            {"op": "select", "table": "Bridge", "where": [["name", "==", bridge]], "columns": ["ports"]},
+            {"op": "select", "table": "Port", "where": [], "columns": ["_uuid", "name"]}
+        ])
+        if not bridges["rows"]:
+            raise OvsdbOperationFailed([{"error": "not found", "details": f"no bridge named {bridge}"}])
+        uuids = set(decodeSet(bridges["rows"][0]["ports"]))
+        return sorted(row["name"] for row in ports["rows"] if decode(row["_uuid"]) in uuids)
+
+    # Brief: Applies ovs-vsctl style commands as one OVSDB transaction and waits for ovs-vswitchd to apply it
+    # Supported commands are add-br, add-port, set-controller and set-fail-mode;
+    # bridges and ports that already exist are skipped like with --may-exist.
+    # Commands on a bridge that does not exist fail like with ovs-vsctl.
+    # Params:
+    #   List<list> commands: Commands such as ["--may-exist", "add-port", "s1", "eth0"]
+    #   int timeout: Maximum time to wait for ovs-vswitchd, in seconds
+    # Return:
+    #   None, raises OvsdbOperationFailed if the transaction failed
+    def execute(self, commands: list, timeout=5) -> None:
+        bridges, ports = self.transact([
+            {"op": "select", "table": "Bridge", "where": [], "columns": ["name"]},
+            {"op": "select", "table": "Port", "where": [], "columns": ["name"]}
+        ])
+        bridges = {row["name"] for row in bridges["rows"]}
+        ports = {row["name"] for row in ports["rows"]}
+
+        operations = []
+        for index, command in enumerate(commands):
+            args = [arg for arg in command if arg != "--may-exist"]
+            name = f"row{index}"
+            if args[0] == "add-br":
+                if args[1] in bridges:
+                    continue
+                bridges.add(args[1])
+                operations += self.__insertPort(args[1], name, internal=True)
+                operations.append({"op": "insert", "table": "Bridge", "uuid-name": name + "br",
+                                   "row": {"name": args[1], "ports": ["named-uuid", name + "port"]}})
+                operations.append({"op": "mutate", "table": "Open_vSwitch", "where": [],
+                                   "mutations": [["bridges", "insert", ["set", [["named-uuid", name + "br"]]]]]})
+            elif args[0] == "add-port":
+                if args[2] in ports:
+                    continue
+                self.__checkBridge(args[1], bridges)
+                ports.add(args[2])
+                operations += self.__insertPort(args[2], name)
+                operations.append(self.__waitBridge(args[1]))
+                operations.append({"op": "mutate", "table": "Bridge", "where": [["name", "==", args[1]]],
+                                   "mutations": [["ports", "insert", ["set", [["named-uuid", name + "port"]]]]]})
+            elif args[0] == "set-controller":
+                self.__checkBridge(args[1], bridges)
+                operations.append({"op": "insert", "table": "Controller", "uuid-name": name, "row": {"target": args[2]}})
+                operations.append(self.__waitBridge(args[1]))
+                operations.append({"op": "update", "table": "Bridge", "where": [["name", "==", args[1]]],
+                                   "row": {"controller": ["set", [["named-uuid", name]]]}})
+            elif args[0] == "set-fail-mode":
+                self.__checkBridge(args[1], bridges)
+                operations.append(self.__waitBridge(args[1]))
+                operations.append({"op": "update", "table": "Bridge", "where": [["name", "==", args[1]]],
+                                   "row": {"fail_mode": args[2]}})
+            else:
+                raise OvsdbOperationFailed([{"error": "unsupported command", "details": " ".join(command)}])
+        if not operations:
+            return
+
+        # like ovs-vsctl, bump next_cfg and wait until ovs-vswitchd reports it in cur_cfg
+        operations.append({"op": "mutate", "table": "Open_vSwitch", "where": [], "mutations": [["next_cfg", "+=", 1]]})
+        operations.append({"op": "select", "table": "Open_vSwitch", "where": [], "columns": ["next_cfg"]})
+        results = self.transact(operations)
+        nextCfg = results[-1]["rows"][0]["next_cfg"]
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            rows = self.transact([{"op": "select", "table": "Open_vSwitch", "where": [], "columns": ["cur_cfg"]}])[0]["rows"]
+            if rows[0]["cur_cfg"] >= nextCfg:
+                return
+            time.sleep(0.01)
+        raise OvsdbOperationFailed([{"error": "timeout", "details": f"ovs-vswitchd did not apply the transaction within {timeout}s"}])
+
+    # Brief: Streams the changes of the Port and Interface tables
+    # Params:
+    #   function callback: Called as callback(table, uuid, old, new) for every changed row, old is None
+    #                      for new rows and new is None for deleted ones; the current rows are reported first
+    #   List<str> tables: Tables to monitor
+    # Return:
+    #   OvsdbMonitor, call its stop method to end the subscription
+    def monitor(self, callback, tables=("Port", "Interface")) -> "OvsdbMonitor":
+        return OvsdbMonitor(self.path, callback, tables)
+
+    # Brief: Closes the connection
+    # Params:
+    # Return:
+    #   None
+    def close(self) -> None:
+        with self.__lock:
+            self.__disconnect()
+
+    def __checkBridge(self, bridge: str, bridges: set) -> None:
+        if bridge not in bridges:
+            raise OvsdbOperationFailed([{"error": "not found", "details": f"no bridge named {bridge}"}])
+
+    # Brief: Builds an operation that aborts the whole transaction if the bridge is gone
+    # The bridge may have been deleted since it was listed, and an update or
+    # mutate on no rows would otherwise commit the rest of the transaction.
+    # Params:
+    #   String bridge: Name of the bridge
+    # Return:
+    #   OVSDB wait operation
+    def __waitBridge(self, bridge: str) -> dict:
+        return {"op": "wait", "table": "Bridge", "where": [["name", "==", bridge]], "columns": ["name"],
+                "until": "==", "rows": [{"name": bridge}], "timeout": 0}
+
+    def __insertPort(self, portName: str, name: str, internal=False) -> list:
+        interface = {"name": portName}
+        if internal:
+            interface["type"] = "internal"
+        return [
+            {"op": "insert", "table": "Interface", "uuid-name": name + "iface", "row": interface},
+            {"op": "insert", "table": "Port", "uuid-name": name + "port",
+             "row": {"name": portName, "interfaces": ["named-uuid", name + "iface"]}}
+        ]
+
+    # Brief: Sends a request and waits for its reply, reconnecting once if the connection was lost
+    # Params:
+    #   String method: JSON-RPC method
+    #   List params: Parameters of the method
+    # Return:
+    #   The result of the request
+    def __call(self, method: str, params: list):
+        with self.__lock:
+            for attempt in (0, 1):
+                try:
+                    if self.__socket is None:
+                        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self.__socket.connect(self.path)
+                    self.__nextId += 1
+                    requestId = self.__nextId
+                    self.__socket.sendall(json.dumps({"method": method, "params": params, "id": requestId}).encode())
+                    while True:
+                        message = self.__receive()
+                        if message.get("method") == "echo":
+                            self.__socket.sendall(json.dumps({"result": message["params"], "error": None, "id": message["id"]}).encode())
+                        elif message.get("id") == requestId:
+                            break
+                except OSError as ex:
+                    self.__disconnect()
+                    if attempt:
+                        raise OvsdbOperationFailed([{"error": "connection failed", "details": f"{self.path}: {str(ex)}"}])
+                    continue
+                if message.get("error") is not None:
+                    raise OvsdbOperationFailed([message["error"]])
+                return message["result"]
+
+    def __receive(self) -> dict:
+        message, self.__buffer = readMessage(self.__socket, self.__buffer)
+        return message
+
+    def __disconnect(self) -> None:
+        if self.__socket is not None:
+            try:
+                self.__socket.close()
+            except OSError:
+                pass
+        self.__socket = None
+        self.__buffer = b""
+
+
+# Brief: Background subscription to the changes of OVSDB tables
+# The monitor owns its own connection, so it never delays the requests of the client.
+class OvsdbMonitor:
+    COLUMNS = {
+        "Port": ["name", "interfaces"],
+        "Interface": ["name", "ofport", "admin_state", "link_state", "error"]
+    }
+
+    def __init__(self, path: str, callback, tables=("Port", "Interface")) -> None:
+        self.path = path
+        self.callback = callback
+        self.tables = list(tables)
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(path)
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    # Brief: Ends the subscription
+    # Params:
+    # Return:
+    #   None
+    def stop(self) -> None:
+        self.__stopped.set()
+        try:
+            self.__socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__socket.close()
+        self.__thread.join(timeout=1)
+
+    def __run(self) -> None:
+        requests = {table: {"columns": self.COLUMNS[table]} if table in self.COLUMNS else {} for table in self.tables}
+        buffer = b""
+        try:
+            self.__socket.sendall(json.dumps({"method": "monitor", "params": [DATABASE, None, requests], "id": "monitor"}).encode())
+            while not self.__stopped.is_set():
+                message, buffer = readMessage(self.__socket, buffer)
+                if message.get("method") == "echo":
+                    self.__socket.sendall(json.dumps({"result": message["params"], "error": None, "id": message["id"]}).encode())
+                elif message.get("id") == "monitor":
+                    if message.get("error") is not None:
+                        logging.error(f"OVSDB monitor on {self.path} failed: {message['error']}")
+                        return
+                    self.__dispatch(message["result"])
+                elif message.get("method") == "update":
+                    self.__dispatch(message["params"][1])
+        except (OSError, ValueError) as ex:
+            if not self.__stopped.is_set():
+                logging.error(f"OVSDB monitor on {self.path} stopped: {str(ex)}")
+
+    def __dispatch(self, updates: dict) -> None:
+        for table, rows in updates.items():
+            for uuid, change in rows.items():
+                old = change.get("old")
+                new = change.get("new")
+                try:
+                    self.callback(table, uuid,
+                                  {k: decode(v) for k, v in old.items()} if old is not None else None,
+                                  {k: decode(v) for k, v in new.items()} if new is not None else None)
+                except Exception as ex:
+                    logging.error(f"OVSDB monitor callback failed: {str(ex)}")
+
+
+# Brief: Reads one JSON-RPC message from a socket
+# Messages are not delimited, so the stream is split by decoding one JSON value at a time.
+# Params:
+#   socket sock: Connected socket
+#   bytes buffer: Data received but not decoded yet
+# Return:
+#   Tuple (message, remaining buffer)
+def readMessage(sock, buffer: bytes):
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            try:
+                # a multi-byte character split between reads fails to decode until the rest arrives
+                text = buffer.decode()
+                message, end = _decoder.raw_decode(text)
+                return message, text[end:].encode()
+            except ValueError:
+                pass
+        data = sock.recv(65536)
+        if not data:
+            raise OSError("connection closed by ovsdb-server")
+        buffer += data
+
+
+# Brief: Converts an OVSDB value to plain Python
+# Params:
+#   value: Atom, ["uuid", ...], ["set", [...]] or ["map", [[k, v], ...]]
+# Return:
+#   The UUID string, list, dict or atom
+def decode(value):
+    if isinstance(value, list) and len(value) == 2:
+        kind, data = value
+        if kind in ("uuid", "named-uuid"):
+            return data
+        if kind == "set":
+            return [decode(item) for item in data]
+        if kind == "map":
+            return {decode(k): decode(v) for k, v in data}
+    return value
+
+
+# Brief: Converts an OVSDB set to a list, a set of one element being encoded as the bare element
+# Params:
+#   value: ["set", [...]] or a single atom
+# Return:
+#   List of plain Python values
+def decodeSet(value) -> list:
+    if isinstance(value, list) and len(value) == 2 and value[0] == "set":
+        return decode(value)
+    return [decode(value)]
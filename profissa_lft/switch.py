@@ -15,8 +15,12 @@
 
 
 import logging
+import os
 import subprocess
 from .node import Node
+from .netlink import LinkEngine
+from .ovsdb import OvsdbClient
+from .dockerapi import DockerEngine
 from .exceptions import NodeInstantiationFailed
 
 
@@ -35,19 +39,26 @@ class Switch(Node):
             self.__mount = True
         else: 
             raise Exception(f"Invalid hostPath and containerPath mount point on {self.getNodeName()}. hostPath and containerPath cannot be null")
+        self.__ovsdbClient = None
 
     # Brief: Instantiate an OpenvSwitch switch container
     # Params:
     # Return:
     #   None
     def instantiate(self, image='alexandremitsurukaihara/lst2.0:openvswitch', controllerIP='', controllerPort=-1) -> None:
-        mount = ''
-        if self.__mount: mount = f'-v {self.__hostPath}:{self.__containerPath}'
-        super().instantiate(dockerCommand=f"docker run -d --network=none --privileged {mount} --name={self.getNodeName()} {image}")
+        binds = [f'{self.__hostPath}:{self.__containerPath}'] if self.__mount else None
+        super().instantiate(dockerImage=image, dns='', binds=binds)
         try:
             # Create bridge and set it up
-            subprocess.run(f"docker exec {self.getNodeName()} ovs-vsctl add-br {self.getNodeName()}", shell=True)
-            subprocess.run(f"docker exec {self.getNodeName()} ip link set {self.getNodeName()} up", shell=True)
+            ovsdb = self.__ovsdb()
+            if ovsdb is not None:
+                ovsdb.execute([["--may-exist", "add-br", self.getNodeName()]])
+            else:
+                subprocess.run(f"docker exec {self.getNodeName()} ovs-vsctl add-br {self.getNodeName()}", shell=True)
+            if ovsdb is not None and LinkEngine.available():
+                LinkEngine().setUp(self.getNodeName(), self.__pid())
+            else:
+                subprocess.run(f"docker exec {self.getNodeName()} ip link set {self.getNodeName()} up", shell=True)
         except Exception as ex:
             logging.error(f"Error while creating the switch {self.getNodeName()}: {str(ex)}")
             raise NodeInstantiationFailed(f"Error while creating the switch {self.getNodeName()}: {str(ex)}")
@@ -63,7 +74,11 @@ class Switch(Node):
     #   None
     def setController(self, ip:str, port: int) -> None:
         try:
-            subprocess.run(f"docker exec {self.getNodeName()} ovs-vsctl set-controller {self.getNodeName()} tcp:{ip}:{str(port)}", shell=True)
+            ovsdb = self.__ovsdb()
+            if ovsdb is not None:
+                ovsdb.execute([["set-controller", self.getNodeName(), f"tcp:{ip}:{str(port)}"]])
+            else:
+                subprocess.run(f"docker exec {self.getNodeName()} ovs-vsctl set-controller {self.getNodeName()} tcp:{ip}:{str(port)}", shell=True)
         except Exception as ex:
             logging.error(f"Error connecting switch {self.getNodeName()} to controller on IP {ip}/{port}: {str(ex)}")
             raise Exception(f"Error connecting switch {self.getNodeName()} to controller on IP {ip}/{port}: {str(ex)}")
@@ -76,11 +91,85 @@ class Switch(Node):
     #   None
     def __createPort(self, nodeName, peerInterfaceName) -> None:
         try:
-            subprocess.run(f"docker exec {nodeName} ovs-vsctl add-port {nodeName} {peerInterfaceName}", shell=True)
+            ovsdb = self.__ovsdb() if nodeName == self.getNodeName() else None
+            if ovsdb is not None:
+                ovsdb.execute([["--may-exist", "add-port", nodeName, peerInterfaceName]])
+            else:
+                subprocess.run(f"docker exec {nodeName} ovs-vsctl add-port {nodeName} {peerInterfaceName}", shell=True)
         except Exception as ex:
             logging.error(f"Error while creating port {peerInterfaceName} in switch {nodeName}: {str(ex)}")
             raise Exception(f"Error while creating port {peerInterfaceName} in switch {nodeName}: {str(ex)}")
 
+    # Brief: Creates many ports in the OpenvSwitch bridge with a single transaction
+    # Params:
+    #   List<str> interfaceNames: Names of the interfaces already moved into the switch container
+    # Return:
+    #   None
+    def addPorts(self, interfaceNames: list) -> None:
+        if not interfaceNames:
+            return
+        try:
+            ovsdb = self.__ovsdb()
+            if ovsdb is not None:
+                ovsdb.execute([["--may-exist", "add-port", self.getNodeName(), name] for name in interfaceNames])
+            else:
+                commands = " ".join(f"-- --may-exist add-port {self.getNodeName()} {name}" for name in interfaceNames)
+                subprocess.run(f"docker exec {self.getNodeName()} ovs-vsctl {commands}", shell=True)
+        except Exception as ex:
+            logging.error(f"Error while creating ports {interfaceNames} in switch {self.getNodeName()}: {str(ex)}")
+            raise Exception(f"Error while creating ports {interfaceNames} in switch {self.getNodeName()}: {str(ex)}")
+
+    # Brief: Lists the ports of the switch bridge
+    # Params:
+    # Return:
+    #   Sorted list of port names, the bridge's own internal port included
+    def listPorts(self) -> list:
+        ovsdb = self.__ovsdb()
+        if ovsdb is not None:
+            return ovsdb.listPorts(self.getNodeName())
+        out = subprocess.run(f"docker exec {self.getNodeName()} ovs-vsctl list-ports {self.getNodeName()}", shell=True, capture_output=True)
+        return sorted(out.stdout.decode('utf8').split() + [self.getNodeName()])
+
+    # Brief: Streams the port and interface changes of the switch
+    # Params:
+    #   function callback: Called as callback(table, uuid, old, new) for every changed Port or Interface row, starting with the current rows
+    # Return:
+    #   OvsdbMonitor, call its stop method to end the subscription
+    def watchPorts(self, callback):
+        ovsdb = self.__ovsdb()
+        if ovsdb is None:
+            logging.error(f"The OVSDB socket of {self.getNodeName()} is not reachable")
+            raise Exception(f"The OVSDB socket of {self.getNodeName()} is not reachable")
+        return ovsdb.monitor(callback)
+
+    # Brief: Returns the PID of the switch container
+    # Params:
+    # Return:
+    #   String PID
+    def __pid(self) -> str:
+        if DockerEngine.available():
+            return str(DockerEngine().inspect(self.getNodeName())["State"]["Pid"])
+        out = subprocess.run(f"docker inspect -f '{{{{.State.Pid}}}}' {self.getNodeName()}", shell=True, capture_output=True)
+        return out.stdout.decode('utf8').strip()
+
+    # Brief: Returns an OVSDB client for the db.sock of the switch container, reached through /proc/<pid>/root
+    # Params:
+    # Return:
+    #   OvsdbClient, or None if the socket is not reachable (ovs-vsctl is used instead)
+    def __ovsdb(self):
+        if not OvsdbClient.enabled():
+            return None
+        if self.__ovsdbClient is not None and os.path.exists(self.__ovsdbClient.path):
+            return self.__ovsdbClient
+        pid = self.__pid()
+        if not pid.isdigit() or pid == "0" or not OvsdbClient.available(OvsdbClient.socketPath(pid)):
+            return None
+        # a restarted container has a new PID, hence a new socket path
+        if self.__ovsdbClient is not None:
+            self.__ovsdbClient.close()
+        self.__ovsdbClient = OvsdbClient(OvsdbClient.socketPath(pid))
+        return self.__ovsdbClient
+
     # Brief: Set Ip to an interface (the ip must be set only after connecting it to a container)
     # Params:
     #   String ip: IP address to be set to peerName interface
@@ -0,0 +1,200 @@
+# Copyright (C) 2022 Alexandre Mitsuru Kaihara
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import inspect
+import logging
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .node import Node
+from .switch import Switch
+from .netlink import LinkEngine
+from .ipchanges import IpChangeSet
+from .images import warmupImages
+from .exceptions import NodeInstantiationFailed
+
+
+# Brief: Builds a Docker topology in phases instead of one node at a time
+# All containers are instantiated concurrently, then every veth pair is created
+# in one netlink batch (or one ip -batch), the ports of each switch are added in
+# a single OVSDB transaction and the addresses of each namespace are assigned in
+# one IpChangeSet. Nodes are declared with addNode/addLink/addAddress before deploy.
+class Topology:
+    # Brief: Constructor of Topology
+    # Params:
+    #   int maxWorkers: Maximum number of containers instantiated (or configured) at once
+    # Return:
+    #   None
+    def __init__(self, maxWorkers=16) -> None:
+        self.maxWorkers = maxWorkers
+        self.__nodes = []
+        self.__instantiateArgs = dict()
+        self.__links = []
+        self.__addresses = []
+
+    # Brief: Declares a node of the topology
+    # Params:
+    #   Node node: Node to instantiate
+    #   instantiateArgs: Keyword arguments passed to the instantiate method of the node
+    # Return:
+    #   The node itself
+    def addNode(self, node: Node, **instantiateArgs) -> Node:
+        self.__nodes.append(node)
+        self.__instantiateArgs[node.getNodeName()] = instantiateArgs
+        return node
+
+    # Brief: Declares a link between two nodes, a port is created on the side that is a switch
+    # Params:
+    #   Node node: First node
+    #   Node peer: Second node
+    #   String interfaceName: Name of the interface on the first node
+    #   String peerInterfaceName: Name of the interface on the second node
+    # Return:
+    #   None
+    def addLink(self, node: Node, peer: Node, interfaceName: str, peerInterfaceName: str) -> None:
+        self.__links.append((node, peer, interfaceName, peerInterfaceName))
+
+    # Brief: Declares an IP address of a node interface
+    # Params:
+    #   Node node: Node of the interface
+    #   String ip: IP address
+    #   int mask: Integer that represents the network mask
+    #   String interfaceName: Name of the interface
+    # Return:
+    #   None
+    def addAddress(self, node: Node, ip: str, mask: int, interfaceName: str) -> None:
+        self.__addresses.append((node, ip, mask, interfaceName))
+
+    # Brief: Deploys the declared topology
+    # Params:
+    # Return:
+    #   Dictionary with the duration in seconds of each phase ("images", "instantiate", "links", "ports", "addresses") and the "total"
+    def deploy(self) -> dict:
+        times = dict()
+        start = time.time()
+
+        images = {self.__imageOf(node) for node in self.__nodes}
+        warmupImages([image for image in images if image], self.maxWorkers)
+        times["images"] = time.time() - start
+
+        phase = time.time()
+        self.__forEach(self.__nodes, lambda node: node.instantiate(**self.__instantiateArgs[node.getNodeName()]), "instantiate")
+        times["instantiate"] = time.time() - phase
+
+        phase = time.time()
+        self.__createLinks()
+        times["links"] = time.time() - phase
+
+        phase = time.time()
+        ports = dict()
+        for node, peer, interfaceName, peerInterfaceName in self.__links:
+            for switch, name in ((node, interfaceName), (peer, peerInterfaceName)):
+                if isinstance(switch, Switch):
+                    ports.setdefault(switch, []).append(name)
+        self.__forEach(list(ports), lambda switch: switch.addPorts(ports[switch]), "create ports of")
+        times["ports"] = time.time() - phase
+
+        phase = time.time()
+        self.__assignAddresses()
+        times["addresses"] = time.time() - phase
+
+        times["total"] = time.time() - start
+        logging.info(f"Topology with {len(self.__nodes)} nodes and {len(self.__links)} links deployed in {times['total']:.2f}s: "
+                     + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in times.items() if name != "total"))
+        return times
+
+    # Brief: Deletes every container of the topology concurrently
+    # Params:
+    # Return:
+    #   None
+    def delete(self) -> None:
+        self.__forEach(self.__nodes, lambda node: node.delete(), "delete")
+
+    # Brief: Returns the image a node will be instantiated with
+    # Params:
+    #   Node node: Declared node
+    # Return:
+    #   The dockerImage (or image) argument given to addNode, else the default of the node's instantiate, None for nodes without an image
+    def __imageOf(self, node: Node):
+        args = self.__instantiateArgs[node.getNodeName()]
+        parameters = inspect.signature(node.instantiate).parameters
+        for key in ("dockerImage", "image"):
+            if key in parameters:
+                return args.get(key, parameters[key].default)
+        return None
+
+    # Brief: Creates every veth pair directly inside the namespaces of its nodes
+    # Params:
+    # Return:
+    #   None
+    def __createLinks(self) -> None:
+        if not self.__links:
+            return
+        if LinkEngine.available():
+            with LinkEngine().batch() as engine:
+                for node, peer, interfaceName, peerInterfaceName in self.__links:
+                    engine.createVethPair(interfaceName, peerInterfaceName, node.getNodeName(), peer.getNodeName())
+            return
+        commands = [f"link add {interfaceName} netns {node.getNodeName()} type veth peer name {peerInterfaceName} netns {peer.getNodeName()}"
+                    for node, peer, interfaceName, peerInterfaceName in self.__links]
+        self.__ipBatch(commands)
+
+    # Brief: Assigns the declared addresses, one batch per node namespace
+    # Params:
+    # Return:
+    #   None
+    def __assignAddresses(self) -> None:
+        changes = dict()
+        if not LinkEngine.available():
+            # veths created by ip -batch are still down, so they are set up here as well
+            for node, peer, interfaceName, peerInterfaceName in self.__links:
+                changes.setdefault(node.getNodeName(), IpChangeSet()).setUp(interfaceName)
+                changes.setdefault(peer.getNodeName(), IpChangeSet()).setUp(peerInterfaceName)
+        for node, ip, mask, interfaceName in self.__addresses:
+            changes.setdefault(node.getNodeName(), IpChangeSet()).addAddress(interfaceName, ip, mask)
+        self.__forEach(list(changes), lambda namespace: changes[namespace].apply(namespace), "configure")
+
+    # Brief: Runs iproute2 commands on the host with a single ip process
+    # Params:
+    #   List<str> commands: ip commands without the leading "ip"
+    # Return:
+    #   None
+    def __ipBatch(self, commands: list) -> None:
+        out = subprocess.run(["ip", "-force", "-batch", "-"], input="\n".join(commands) + "\n", capture_output=True, text=True)
+        if out.returncode != 0:
+            logging.error(f"Error while running ip batch on the host: {out.stderr.strip()}")
+            raise Exception(f"Error while running ip batch on the host: {out.stderr.strip()}")
+
+    # Brief: Applies an action to many nodes concurrently and raises the errors together
+    # Params:
+    #   List<Node> nodes: Nodes (or namespace names) to apply the action to
+    #   function action: Action receiving one node
+    #   String description: Description of the action used in error messages
+    # Return:
+    #   None
+    def __forEach(self, nodes: list, action, description: str) -> None:
+        if not nodes:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(nodes))) as pool:
+            futures = {pool.submit(action, node): node for node in nodes}
+        errors = []
+        for future, node in futures.items():
+            if future.exception() is not None:
+                name = node.getNodeName() if isinstance(node, Node) else node
+                errors.append(f"{name}: {str(future.exception())}")
+        if errors:
+            logging.error(f"Failed to {description} {len(errors)} node(s): {'; '.join(errors)}")
+            raise NodeInstantiationFailed(f"Failed to {description} {len(errors)} node(s): {'; '.join(errors)}")
@@ -17,6 +17,10 @@ setup(
         'pandas',
         'kubernetes'
     ],
+    extras_require={
+        'netlink': ['pyroute2'],
+        'async': ['kubernetes_asyncio']
+    },
     author='Alexandre Mitsuru Kaihara & Enzo Zanetti Celentano',
     author_email='alexandreamk1@gmail.com',
     description='LFT: lightweight network topologies emulation with Docker or Kubernetes',